@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "HospitalChatbot.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from app1 import push  # noqa: E402  (needs the app registry loaded above)
+
+
+async def application(scope, receive, send):
+    # Long-lived event streams bypass Django's per-request thread (see app1.push)
+    if scope['type'] == 'http' and scope['path'] == '/events':
+        await push.asgi_events(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
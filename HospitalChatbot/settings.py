@@ -63,12 +63,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "app1.middleware.StaticFilesMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "app1.middleware.ActionMetricsMiddleware",
+    "app1.middleware.QueryProfilerMiddleware",
 ]
 
 ROOT_URLCONF = "HospitalChatbot.urls"
@@ -98,6 +101,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Seconds a worker keeps its connection; gunicorn.conf.py sets 60
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 0)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
@@ -141,6 +147,12 @@ STATICFILES_DIRS = [
     BASE_DIR / "app1" / "static",
 ]
 STATIC_ROOT = BASE_DIR / "staticfiles"
+# collectstatic writes content-hashed names plus .gz/.br variants, which
+# app1.middleware.StaticFilesMiddleware serves with far-future caching.
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "app1.storage.CompressedManifestStaticFilesStorage"},
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -153,10 +165,83 @@ GROQ_API_KEY = os.environ.get('GROQ_API_KEY', '')
 GROQ_API_URL = os.environ.get('GROQ_API_URL', 'https://api.groq.ai/v1/completions')
 
 # Email configuration for sending appointment confirmations
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = 'app1.mail.EmailBackend'
 EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
 EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
 EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True').lower() == 'true'
 EMAIL_HOST_USER =   os.environ.get('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL =  os.environ.get('DEFAULT_FROM_EMAIL')
+
+# Per-request SQL profiling (see app1.middleware.QueryProfilerMiddleware).
+# DEBUG responses carry X-DB-* headers; otherwise a sample of requests is logged.
+SQL_PROFILER_ENABLED = os.environ.get('SQL_PROFILER_ENABLED', 'True').lower() == 'true'
+SQL_PROFILER_SAMPLE_RATE = float(os.environ.get('SQL_PROFILER_SAMPLE_RATE', 0.01))
+SQL_PROFILER_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_PROFILER_N_PLUS_ONE_THRESHOLD', 3))
+
+# Metrics exposed at /metrics (see app1.metrics). Point METRICS_MULTIPROC_DIR at a
+# directory shared by all gunicorn workers so the numbers are summed across them.
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+# Seconds of inactivity after which a chat conversation (app1.conversation) starts over
+CHAT_STATE_TTL = int(os.environ.get('CHAT_STATE_TTL', 30 * 60))
+
+# Server-sent events at /events (app1.push). Each ASGI worker polls the outbox
+# table once per interval while it has open connections.
+PUSH_POLL_INTERVAL = float(os.environ.get('PUSH_POLL_INTERVAL', 1.0))
+PUSH_KEEPALIVE = int(os.environ.get('PUSH_KEEPALIVE', 20))
+PUSH_RETENTION = int(os.environ.get('PUSH_RETENTION', 600))
+
+# perform_action responses stored per Idempotency-Key (app1.idempotency): how long
+# they are kept, and how long a duplicate waits for the first request to finish.
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_WAIT = float(os.environ.get('IDEMPOTENCY_WAIT', 10))
+
+# Closed encounters older than this many months may be moved to the archive
+# tables by archive_encounters (app1.archive).
+ARCHIVE_AFTER_MONTHS = int(os.environ.get('ARCHIVE_AFTER_MONTHS', 24))
+
+# Shared doctor slot calendar (app1.availability): a file mapped by every worker
+# on the node, e.g. /dev/shm/hospital_calendar. Unset: slot lookups query the
+# database.
+DOCTOR_CALENDAR_PATH = os.environ.get('DOCTOR_CALENDAR_PATH') or None
+DOCTOR_CALENDAR_DAYS = int(os.environ.get('DOCTOR_CALENDAR_DAYS', 28))
+DOCTOR_CALENDAR_CAPACITY = int(os.environ.get('DOCTOR_CALENDAR_CAPACITY', 4096))
+
+# Triage keeps a patient with their previous doctor in the specialization when
+# that doctor is free within this many hours of the earliest one
+# (app1.assignment).
+ASSIGNMENT_CONTINUITY_HOURS = int(os.environ.get('ASSIGNMENT_CONTINUITY_HOURS', 48))
+
+# Reminder delivery channels (app1.dispatch): backend, worker threads and sends
+# per second for each channel. CALL and SMS print to stdout until a provider
+# backend is configured.
+REMINDER_CHANNELS = {
+    'EMAIL': {'BACKEND': 'app1.dispatch.EmailChannel', 'CONCURRENCY': 4, 'RATE': 10},
+    'CALL': {'BACKEND': 'app1.dispatch.ConsoleChannel', 'CONCURRENCY': 2, 'RATE': 2},
+    'SMS': {'BACKEND': 'app1.dispatch.ConsoleChannel', 'CONCURRENCY': 2, 'RATE': 5},
+}
+
+# Structured logging (app1.log): the app1 loggers write JSON lines to stderr from
+# a background thread, so requests never wait on log I/O. LOG_SAMPLE_RATES keeps
+# that fraction of the named high-volume INFO events (one `action` event per
+# chatbot request); warnings and errors are always written.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_SAMPLE_RATES = {
+    'action': float(os.environ.get('LOG_ACTION_SAMPLE_RATE', 0.01)),
+}
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sample': {'()': 'app1.log.SampleFilter', 'rates': LOG_SAMPLE_RATES},
+    },
+    'handlers': {
+        'json': {'class': 'app1.log.BackgroundHandler', 'filters': ['sample'], 'maxsize': LOG_QUEUE_SIZE},
+    },
+    'loggers': {
+        'app1': {'handlers': ['json'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
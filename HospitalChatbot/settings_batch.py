@@ -0,0 +1,16 @@
+"""
+Settings for cron-driven batch commands (process_reminders,
+process_follow_ups):
+
+    python manage.py process_reminders --settings=HospitalChatbot.settings_batch
+
+Same database and email configuration as settings.py, without the contrib
+apps, which only serve HTTP and the admin, so django.setup()
+imports and initialises less. Do not use it for migrate, runserver or the
+admin: those need the full app list.
+"""
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    "app1",
+]
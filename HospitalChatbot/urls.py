@@ -16,14 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
 
+# Static files are served by runserver in DEBUG and by
+# app1.middleware.StaticFilesMiddleware otherwise.
 urlpatterns = [
     path("admin/", admin.site.urls),
     path('', include('app1.urls')),
 ]
-
-# Serve static files during development
-if settings.DEBUG:
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS[0] if settings.STATICFILES_DIRS else settings.STATIC_ROOT)
\ No newline at end of file
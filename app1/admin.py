@@ -1,34 +1,271 @@
-from django.contrib import admin
+from datetime import datetime, timedelta
+
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connection, models
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 # Register your models here.
 from .models import (
-    Patient, Doctor, Encounter, Medication, LabResult,
+    Patient, Doctor, Encounter, Reminder, Feedback, Medication, LabResult,
     Allergy, Immunization, Diagnosis, Vital, Insurance
 )
+from . import reminders, rollups, search, waitlist
+
+
+# -------------------------
+# HIGH-VOLUME HELPERS
+# -------------------------
+# The admin's defaults (exact COUNT(*) per page view, a SELECT DISTINCT per
+# date-hierarchy level, a query per related object shown) are linear in table
+# size. The pieces below keep every changelist query an index seek or a
+# bounded scan.
+
+def estimated_row_count(model):
+    """Cheap approximation of a table's row count: the planner statistics on
+    PostgreSQL, the highest primary key elsewhere (an index seek; deleted rows
+    are overcounted)."""
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return row[0]
+    return model._default_manager.aggregate(m=models.Max(model._meta.pk.name))["m"] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    # Below this many rows an exact COUNT(*) is cheap enough
+    EXACT_BELOW = 10000
+    # Filtered lists stop counting here; later pages are reached by filtering further
+    FILTERED_LIMIT = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model)
+            if estimate >= self.EXACT_BELOW:
+                return estimate
+            return queryset.count()
+        return queryset[:self.FILTERED_LIMIT].count()
+
+
+class IndexedDatesQuerySet(models.QuerySet):
+    """QuerySet whose dates()/datetimes() probe each year, month or day with an
+    indexed range EXISTS instead of SELECT DISTINCT over every row. Used for
+    the admin's date_hierarchy drill-down on large tables."""
+
+    def datetimes(self, field_name, kind, order="ASC", tzinfo=None):
+        if kind not in ("year", "month", "day"):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        bounds = self.aggregate(first=models.Min(field_name), last=models.Max(field_name))
+        if bounds["first"] is None:
+            return []
+        tz = tzinfo or timezone.get_current_timezone()
+        first, last = (
+            timezone.localtime(v, tz) if timezone.is_aware(v) else timezone.make_aware(v, tz)
+            for v in (bounds["first"], bounds["last"])
+        )
+        found = []
+        start = _truncate(first, kind)
+        while start <= last:
+            end = _next_period(start, kind)
+            if self.filter(**{f"{field_name}__gte": start, f"{field_name}__lt": end}).exists():
+                found.append(start)
+            start = end
+        return found[::-1] if order == "DESC" else found
+
+
+def _truncate(value, kind):
+    parts = {"year": (value.year, 1, 1), "month": (value.year, value.month, 1),
+             "day": (value.year, value.month, value.day)}[kind]
+    return timezone.make_aware(datetime(*parts), value.tzinfo)
 
+
+def _next_period(start, kind):
+    if kind == "year":
+        naive = datetime(start.year + 1, 1, 1)
+    elif kind == "month":
+        naive = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    else:
+        naive = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+    return timezone.make_aware(naive, start.tzinfo)
+
+
+class HighVolumeAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class StatusFilter(admin.SimpleListFilter):
+    # Fixed choices: the default filter for a plain CharField runs SELECT DISTINCT over the table
+    title = "status"
+    parameter_name = "status"
+
+    def lookups(self, request, model_admin):
+        return [(s, s.replace("_", " ").title()) for s in ("BOOKED", "COMPLETED", "NO_SHOW", "CANCELLED")]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(status=self.value())
+        return queryset
+
+
+# -------------------------
+# MODEL ADMINS
+# -------------------------
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(HighVolumeAdmin):
     list_display = ("patient_id", "first_name", "last_name", "dob", "gender", "phone", "blood_group")
-    search_fields = ("first_name", "last_name", "phone")
+    search_fields = ("first_name", "last_name", "phone", "email")
+    search_help_text = "Name, phone or email; any part of 3+ characters"
+
+    def get_search_results(self, request, queryset, search_term):
+        # Served by the trigram index instead of LIKE '%term%' scans
+        return search.filter_queryset(queryset, search_term), False
 
 
 @admin.register(Doctor)
 class DoctorAdmin(admin.ModelAdmin):
     list_display = ("doctor_id", "first_name", "last_name", "specialization")
+    list_filter = ("specialization",)
     search_fields = ("first_name", "last_name", "specialization")
 
 
 @admin.register(Encounter)
-class EncounterAdmin(admin.ModelAdmin):
-    list_display = ("encounter_id", "patient", "doctor", "visit_type", "visit_date", "notes")
-    list_filter = ("visit_type", "doctor")
-    search_fields = ("patient__first_name", "patient__last_name")
-
-
-admin.site.register(Medication)
-admin.site.register(LabResult)
-admin.site.register(Allergy)
-admin.site.register(Immunization)
-admin.site.register(Diagnosis)
-admin.site.register(Vital)
-admin.site.register(Insurance)
+class EncounterAdmin(HighVolumeAdmin):
+    list_display = ("encounter_id", "patient", "doctor", "visit_type", "visit_date", "status", "payment_status")
+    list_select_related = ("patient", "doctor")
+    list_filter = ("visit_type", StatusFilter, "doctor__specialization")
+    date_hierarchy = "visit_date"
+    autocomplete_fields = ("patient", "doctor")
+    search_fields = ("encounter_id",)
+    search_help_text = "Encounter id, or patient name, phone or email"
+    actions = ["mark_completed", "mark_no_show", "mark_cancelled", "mark_paid"]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(queryset.model, query=queryset.query, using=queryset.db)
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit():
+            return queryset.filter(encounter_id=int(search_term)), False
+        patients = search.filter_queryset(Patient.objects.all(), search_term)
+        return queryset.filter(patient__in=patients.values("patient_id")), False
+
+    def _set_status(self, request, queryset, **values):
+        # queryset.update() skips save signals, so rebuild the touched days' rollups directly
+        days = []
+        if "status" in values:
+            days = list(queryset.annotate(day=TruncDate("visit_date")).values_list("day", flat=True).distinct())
+        updated = queryset.update(**values)
+        rollups.recompute_days(days)
+        self.message_user(request, f"{updated} encounters updated.", messages.SUCCESS)
+
+    @admin.action(description="Mark selected encounters as completed")
+    def mark_completed(self, request, queryset):
+        self._set_status(request, queryset, status="COMPLETED")
+
+    @admin.action(description="Mark selected encounters as no-show")
+    def mark_no_show(self, request, queryset):
+        self._set_status(request, queryset, status="NO_SHOW")
+
+    @admin.action(description="Mark selected encounters as cancelled")
+    def mark_cancelled(self, request, queryset):
+        # Saved one at a time: a cancellation frees its slot in the calendar, the
+        # doctor's load and the reminder queue (app1.signals), and offers it to
+        # the waitlist, none of which queryset.update() would do
+        cancelled = 0
+        for encounter in queryset.exclude(status="CANCELLED").select_related("doctor"):
+            waitlist.cancel(encounter)
+            cancelled += 1
+        self.message_user(request, f"{cancelled} encounters updated.", messages.SUCCESS)
+
+    @admin.action(description="Mark selected encounters as paid")
+    def mark_paid(self, request, queryset):
+        self._set_status(request, queryset, payment_status="PAID")
+
+
+@admin.register(Reminder)
+class ReminderAdmin(HighVolumeAdmin):
+    list_display = ("reminder_id", "encounter", "remind_at", "method", "health_check_done")
+    list_select_related = ("encounter__patient",)
+    list_filter = ("method", "health_check_done")
+    autocomplete_fields = ("encounter",)
+    actions = ["mark_done"]
+
+    @admin.action(description="Mark selected health checks as done")
+    def mark_done(self, request, queryset):
+        # queryset.update() skips save signals, so drop them from the due-queue directly
+        updated = queryset.update(health_check_done=True)
+        reminders.dequeue(queryset.values("pk"))
+        self.message_user(request, f"{updated} reminders updated.", messages.SUCCESS)
+
+
+@admin.register(Feedback)
+class FeedbackAdmin(HighVolumeAdmin):
+    list_display = ("feedback_id", "encounter", "rating", "follow_up_required")
+    list_select_related = ("encounter__patient",)
+    list_filter = ("rating", "follow_up_required")
+    autocomplete_fields = ("encounter",)
+
+
+@admin.register(Medication)
+class MedicationAdmin(HighVolumeAdmin):
+    list_display = ("medication_id", "name", "patient", "dosage", "frequency", "start_date", "end_date")
+    list_select_related = ("patient",)
+    autocomplete_fields = ("patient", "encounter")
+
+
+@admin.register(LabResult)
+class LabResultAdmin(HighVolumeAdmin):
+    list_display = ("lab_id", "test_name", "patient", "result_value", "result_unit", "test_date", "abnormal")
+    list_select_related = ("patient",)
+    autocomplete_fields = ("patient", "encounter")
+    # Parsed from the text fields on save (app1.labs)
+    readonly_fields = ("value_numeric", "range_low", "range_high", "abnormal")
+
+
+@admin.register(Allergy)
+class AllergyAdmin(HighVolumeAdmin):
+    list_display = ("allergy_id", "allergen", "patient", "reaction", "severity")
+    list_select_related = ("patient",)
+    autocomplete_fields = ("patient",)
+
+
+@admin.register(Immunization)
+class ImmunizationAdmin(HighVolumeAdmin):
+    list_display = ("imm_id", "vaccine_name", "patient", "date_given", "dose_number")
+    list_select_related = ("patient",)
+    autocomplete_fields = ("patient",)
+
+
+@admin.register(Diagnosis)
+class DiagnosisAdmin(HighVolumeAdmin):
+    list_display = ("diag_id", "diagnosis_code", "description", "encounter")
+    list_select_related = ("encounter__patient",)
+    autocomplete_fields = ("encounter",)
+
+
+@admin.register(Vital)
+class VitalAdmin(HighVolumeAdmin):
+    list_display = (
+        "vital_id", "encounter", "temperature", "heart_rate", "blood_pressure", "recorded_at", "news_score",
+    )
+    list_select_related = ("encounter__patient",)
+    autocomplete_fields = ("encounter",)
+    # Parsed and scored on save (app1.ews)
+    readonly_fields = ("systolic", "diastolic", "news_score")
+
+
+@admin.register(Insurance)
+class InsuranceAdmin(HighVolumeAdmin):
+    list_display = ("insurance_id", "provider_name", "policy_number", "patient", "coverage_start", "coverage_end")
+    list_select_related = ("patient",)
+    autocomplete_fields = ("patient",)
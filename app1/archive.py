@@ -0,0 +1,175 @@
+"""
+Hot/cold split of encounter history.
+
+`archive_encounters` moves encounters that were closed (completed, no-show or
+cancelled) more than ARCHIVE_AFTER_MONTHS ago, with their child rows, from
+the hot tables into the Archived* tables. The hot tables then hold recent and
+open visits only, which is all the availability, follow-up and reminder
+queries look at. Rows keep their primary keys, so ids stay valid after the
+move.
+
+Reads that reach into the past merge both sides:
+
+* patient_history(), patient_lab_results() and labs.trends() read both sides
+  in one query;
+* rollups.compute() counts archived encounters and feedback;
+* exports.iter_chunks() exports archived encounters with the hot ones;
+* GET_VISIT_SUMMARY falls back to the archive for ids not in the hot table.
+"""
+import calendar
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    ArchivedDiagnosis, ArchivedEncounter, ArchivedFeedback, ArchivedLabResult, ArchivedMedication,
+    ArchivedReminder, ArchivedReminderAttempt, ArchivedVital, Diagnosis, Encounter, EncounterRisk, Feedback, LabResult,
+    Medication, Reminder, ReminderAttempt, ReminderDue, Vital, WaitlistEntry,
+)
+
+
+CLOSED_STATUSES = ('COMPLETED', 'NO_SHOW', 'CANCELLED')
+DEFAULT_MONTHS = 24
+PAGE_SIZE = 50
+# (hot model, archive model, lookup from the hot model to its encounter id),
+# parents before children. Every model with a foreign key to one of the hot
+# models must be listed (or in DROPPED), or archive_encounters refuses to run.
+TABLES = [
+    (Encounter, ArchivedEncounter, 'encounter_id'),
+    (Reminder, ArchivedReminder, 'encounter_id'),
+    (ReminderAttempt, ArchivedReminderAttempt, 'reminder__encounter_id'),
+    (Feedback, ArchivedFeedback, 'encounter_id'),
+    (Medication, ArchivedMedication, 'encounter_id'),
+    (LabResult, ArchivedLabResult, 'encounter_id'),
+    (Diagnosis, ArchivedDiagnosis, 'encounter_id'),
+    (Vital, ArchivedVital, 'encounter_id'),
+]
+# Deleted rather than archived: queue entries of reminders that never went
+# out, early-warning scores (closed encounters are not on the wards), and
+# waitlist entries long since settled
+DROPPED = [
+    (ReminderDue, 'reminder__encounter_id'), (EncounterRisk, 'encounter_id'), (WaitlistEntry, 'encounter_id'),
+]
+
+
+def archive_months():
+    return getattr(settings, 'ARCHIVE_AFTER_MONTHS', DEFAULT_MONTHS)
+
+
+def months_ago(months, now=None):
+    now = timezone.localtime(now)
+    index = now.year * 12 + now.month - 1 - months
+    year, month = divmod(index, 12)
+    return now.replace(year=year, month=month + 1, day=min(now.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def unmapped_children():
+    known = {hot for hot, _, _ in TABLES} | {model for model, _ in DROPPED}
+    return [
+        rel.related_model for hot, _, _ in TABLES for rel in hot._meta.related_objects
+        if rel.related_model not in known
+    ]
+
+
+def archivable(cutoff):
+    return Encounter.objects.filter(status__in=CLOSED_STATUSES, visit_date__lt=cutoff)
+
+
+def _where(model, path, encounter_ids):
+    """SQL condition (and params) selecting the rows of `model` whose `path`
+    leads to one of the encounters, without a subquery on `model` itself."""
+    qn = connection.ops.quote_name
+    field, _, rest = path.partition('__')
+    column = qn(model._meta.get_field(field).column)
+    if not rest:
+        return f'{column} IN ({", ".join(["%s"] * len(encounter_ids))})', list(encounter_ids)
+    parent = model._meta.get_field(field).related_model
+    select, params = parent.objects.filter(**{f'{rest}__in': encounter_ids}).values_list('pk').query.sql_with_params()
+    return f'{column} IN ({select})', list(params)
+
+
+def move(encounter_ids):
+    """Copy the encounters and their children into the archive and delete
+    them from the hot tables. Run inside a transaction."""
+    qn = connection.ops.quote_name
+    for model, path in DROPPED:
+        model.objects.filter(**{f'{path}__in': encounter_ids}).delete()
+    with connection.cursor() as cursor:
+        for hot, cold, path in TABLES:
+            columns = ', '.join(qn(f.column) for f in hot._meta.concrete_fields)
+            where, params = _where(hot, path, encounter_ids)
+            cursor.execute(
+                f'INSERT INTO {qn(cold._meta.db_table)} ({columns}) '
+                f'SELECT {columns} FROM {qn(hot._meta.db_table)} WHERE {where}',
+                params,
+            )
+        # Raw deletes: the ORM would load every row to run cascades and signals
+        for hot, _, path in reversed(TABLES):
+            where, params = _where(hot, path, encounter_ids)
+            cursor.execute(f'DELETE FROM {qn(hot._meta.db_table)} WHERE {where}', params)
+
+
+# -- reads ---------------------------------------------------------------------------
+# Hot and archived rows are read with one UNION ALL, so a read costs the same
+# number of queries whether or not a patient has archived visits.
+
+HISTORY_FIELDS = (
+    'encounter_id', 'visit_date', 'problem', 'status', 'doctor__first_name', 'doctor__last_name',
+    'doctor__specialization',
+)
+LAB_FIELDS = (
+    'lab_id', 'test_name', 'result_value', 'result_unit', 'reference_range', 'test_date', 'value_numeric',
+    'range_low', 'range_high', 'abnormal',
+)
+
+
+def patient_history(patient_id, before=None, limit=PAGE_SIZE):
+    """A page of the patient's encounters as dicts of HISTORY_FIELDS, newest
+    first, hot and archived together.
+
+    `before` is the (visit_date, encounter_id) of the last row of the previous
+    page. Returns (rows, cursor for the next page or None).
+    """
+    condition = Q(patient_id=patient_id)
+    if before is not None:
+        visit_date, encounter_id = before
+        condition &= Q(visit_date__lt=visit_date) | Q(visit_date=visit_date, encounter_id__lt=encounter_id)
+    hot = Encounter.objects.filter(condition).values(*HISTORY_FIELDS)
+    cold = ArchivedEncounter.objects.filter(condition).values(*HISTORY_FIELDS)
+    rows = list(hot.union(cold, all=True).order_by('-visit_date', '-encounter_id')[:limit])
+    cursor = (rows[-1]['visit_date'], rows[-1]['encounter_id']) if len(rows) == limit else None
+    return rows, cursor
+
+
+def patient_lab_results(patient_id, before=None, limit=PAGE_SIZE):
+    """A page of the patient's lab results as dicts of LAB_FIELDS, newest
+    first, hot and archived together.
+
+    `before` is the (test_date, lab_id) of the last row of the previous page.
+    Returns (rows, cursor for the next page or None).
+    """
+    condition = Q(patient_id=patient_id)
+    if before is not None:
+        test_date, lab_id = before
+        condition &= Q(test_date__lt=test_date) | Q(test_date=test_date, lab_id__lt=lab_id)
+    hot = LabResult.objects.filter(condition).values(*LAB_FIELDS)
+    cold = ArchivedLabResult.objects.filter(condition).values(*LAB_FIELDS)
+    rows = list(hot.union(cold, all=True).order_by('-test_date', '-lab_id')[:limit])
+    cursor = (rows[-1]['test_date'], rows[-1]['lab_id']) if len(rows) == limit else None
+    return rows, cursor
+
+
+def get_encounter(encounter_id):
+    """An encounter by id from either side, with patient and doctor loaded, or None."""
+    for model in (Encounter, ArchivedEncounter):
+        encounter = model.objects.select_related('patient', 'doctor').filter(pk=encounter_id).first()
+        if encounter is not None:
+            return encounter
+    return None
+
+
+def lab_results(encounter):
+    model = LabResult if isinstance(encounter, Encounter) else ArchivedLabResult
+    return model.objects.filter(encounter=encounter)
@@ -0,0 +1,180 @@
+"""
+Doctor assignment across a specialization.
+
+Triage used to give every patient of a specialization to its first doctor.
+assign() picks among all of them: the doctor with the earliest free slot,
+then the fewest encounters today, then the lowest id. Given a patient, their
+previous doctor in the specialization is kept when free within
+ASSIGNMENT_CONTINUITY_HOURS of that.
+
+DoctorLoad holds each doctor's key, and its (specialization, next_free_at,
+load, doctor) index is the priority queue: a pick is one index seek, O(log n),
+instead of a scan of the specialization's doctors and their bookings, and
+every worker shares it. The keys are kept current as bookings change
+(app1.signals):
+
+* a new booking adds one to its doctor's load when it falls on their `day`,
+  and recomputes the doctor when it takes their next free slot;
+* moving, cancelling or deleting an encounter recomputes its doctors.
+
+Keys also go stale as time passes: the next free slot goes by, or the day
+ends. Either only makes a doctor's true key later than the stored one, so
+assign() checks the doctor on top and, when stale, recomputes the stale rows
+of the specialization and picks again.
+
+Doctors created with bulk_create (generate_dataset, imports) have no row until
+`python manage.py rebuild_assignment`. A specialization without rows is
+assigned its first doctor, as before.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q, Subquery
+from django.utils import timezone
+
+from . import availability
+from .models import Doctor, DoctorLoad, Encounter
+from .rollups import local_date
+
+
+# As far ahead as get_available_slots (app1.booking) offers slots
+HORIZON_DAYS = 7
+DEFAULT_CONTINUITY_HOURS = 48
+BATCH = 500
+
+
+def continuity_hours():
+    return getattr(settings, 'ASSIGNMENT_CONTINUITY_HOURS', DEFAULT_CONTINUITY_HOURS)
+
+
+def compute(doctors):
+    """Unsaved DoctorLoad rows for [(doctor_id, specialization)], from their
+    encounters over the horizon (one query)."""
+    now = timezone.localtime()
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    booked = {doctor_id: set() for doctor_id, _ in doctors}
+    today = Counter()
+    rows = Encounter.objects.filter(
+        doctor_id__in=booked, visit_date__gte=start, visit_date__lt=start + timedelta(days=HORIZON_DAYS),
+    ).exclude(status='CANCELLED').values_list('doctor_id', 'visit_date')
+    for doctor_id, visit_date in rows:
+        booked[doctor_id].add(visit_date)
+        if visit_date < start + timedelta(days=1):
+            today[doctor_id] += 1
+    return [
+        DoctorLoad(
+            doctor_id=doctor_id, specialization=specialization.lower(),
+            next_free_at=next(availability.free_slots(booked[doctor_id], now, HORIZON_DAYS), None),
+            day=now.date(), load=today[doctor_id],
+        )
+        for doctor_id, specialization in doctors
+    ]
+
+
+def refresh(doctor_ids):
+    """Recompute the rows of these doctors, creating missing ones."""
+    doctor_ids = list(doctor_ids)
+    for i in range(0, len(doctor_ids), BATCH):
+        doctors = Doctor.objects.filter(pk__in=doctor_ids[i:i + BATCH]).values_list('doctor_id', 'specialization')
+        DoctorLoad.objects.bulk_create(
+            compute(list(doctors)), update_conflicts=True, unique_fields=['doctor'],
+            update_fields=['specialization', 'next_free_at', 'day', 'load'],
+        )
+
+
+def rebuild():
+    """Recompute every doctor's row. Returns the number of doctors."""
+    doctor_ids = list(Doctor.objects.values_list('doctor_id', flat=True))
+    refresh(doctor_ids)
+    return len(doctor_ids)
+
+
+def _recompute(doctor_id):
+    """Update an existing row only: the doctor may be on its way out (a
+    cascading delete), and doctors without a row wait for a rebuild."""
+    [row] = compute([(doctor_id, '')])
+    DoctorLoad.objects.filter(pk=doctor_id).update(next_free_at=row.next_free_at, day=row.day, load=row.load)
+
+
+# -- assigning ----------------------------------------------------------------------
+
+def assign(specialization, patient_id=None):
+    """The doctor to give a patient of `specialization`, or None if it has
+    no doctors."""
+    spec = specialization.lower()
+    now = timezone.now()
+    today = timezone.localdate()
+    queue = DoctorLoad.objects.filter(specialization=spec).select_related('doctor').order_by(
+        'next_free_at', 'load', 'doctor_id',
+    )
+    free = queue.filter(next_free_at__isnull=False)
+    top = free.first()
+    if top is not None and (top.next_free_at < now or top.day != today):
+        stale = DoctorLoad.objects.filter(Q(next_free_at__lt=now) | ~Q(day=today), specialization=spec)
+        refresh(list(stale.values_list('doctor_id', flat=True)))
+        top = free.first()
+    if top is None:
+        # Booked up over the horizon, or not ranked yet
+        top = queue.first()
+        if top is None:
+            return Doctor.objects.filter(specialization__iexact=specialization).first()
+        return top.doctor
+
+    if patient_id is not None:
+        previous = Encounter.objects.filter(
+            patient_id=patient_id, doctor__specialization__iexact=specialization,
+        ).order_by('-visit_date').values('doctor_id')[:1]
+        preferred = free.filter(
+            doctor_id=Subquery(previous), next_free_at__gte=now,
+            next_free_at__lte=top.next_free_at + timedelta(hours=continuity_hours()),
+        ).first()
+        if preferred is not None:
+            return preferred.doctor
+    return top.doctor
+
+
+# -- keeping it current -----------------------------------------------------------
+
+def encounter_saved(encounter, created):
+    """Must run before app1.rollups replaces the encounter's loaded state."""
+    if not created:
+        old = getattr(encounter, '_rollup_state', None)
+        fields = Encounter.ROLLUP_FIELDS
+        if old is not None:
+            old_doctor, old_date = old[fields.index('doctor_id')], old[fields.index('visit_date')]
+            old_cancelled = old[fields.index('status')] == 'CANCELLED'
+            if (old_doctor, old_date, old_cancelled) == (
+                encounter.doctor_id, encounter.visit_date, encounter.status == 'CANCELLED',
+            ):
+                return
+            if old_doctor is not None and old_doctor != encounter.doctor_id:
+                _recompute(old_doctor)
+        if encounter.doctor_id is not None:
+            _recompute(encounter.doctor_id)
+        return
+
+    if encounter.doctor_id is None or encounter.status == 'CANCELLED':
+        return
+    row = DoctorLoad.objects.filter(pk=encounter.doctor_id).values_list('next_free_at', 'day').first()
+    if row is None:
+        return
+    next_free_at, day = row
+    if encounter.visit_date == next_free_at:
+        _recompute(encounter.doctor_id)
+    elif local_date(encounter.visit_date) == day:
+        DoctorLoad.objects.filter(pk=encounter.doctor_id, day=day).update(load=F('load') + 1)
+
+
+def encounter_deleted(encounter):
+    if encounter.doctor_id is not None:
+        _recompute(encounter.doctor_id)
+
+
+def doctor_saved(doctor):
+    [row] = compute([(doctor.pk, doctor.specialization)])
+    DoctorLoad.objects.update_or_create(
+        doctor_id=doctor.pk,
+        defaults={'specialization': row.specialization, 'next_free_at': row.next_free_at, 'day': row.day,
+                  'load': row.load},
+    )
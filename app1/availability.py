@@ -0,0 +1,317 @@
+"""
+Doctor slot calendar shared by every worker on the node.
+
+get_available_slots() and choose_appointment_slot() (app1.booking) offer the
+hourly slots FIRST_HOUR..LAST_HOUR of each day. When DOCTOR_CALENDAR_PATH is
+set, whether a doctor's slot is taken is kept as one bit in a file that every
+process maps with mmap, so a slot lookup is a bit scan instead of a query:
+
+    header | day ordinals (one int32 per ring day) | day sequences (uint32) | bits
+
+The bits hold DOCTOR_CALENDAR_DAYS days as a ring indexed by date ordinal,
+SLOTS_PER_DAY bits per day and one row per doctor id below
+DOCTOR_CALENDAR_CAPACITY (28 days: 32 bytes per doctor). The ordinal of the
+date each ring day currently holds is kept next to the bits. When a lookup
+reaches a day the ring has not loaded yet, that day is read from Encounter
+once for all doctors.
+
+Writers (encounter saves and deletes, after commit; rebuild) take an
+exclusive flock on the file. Readers do not lock: each ring day has a
+sequence number, seqlock-style, that writers make odd before touching the day
+and even again afterwards. A reader reads it before and after the bits and
+falls back to the database when it was odd or moved, or when the day holds
+another date, so a rebuild of the same date mid-read is caught too. Doctors
+beyond the capacity, and days outside the horizon, always go to the database.
+
+`python manage.py rebuild_calendar` reloads the whole horizon. Run it when the
+server starts; encounters written without signals (bulk_create, raw SQL) are
+only picked up by a rebuild or when their day rolls in.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Encounter
+
+
+FIRST_HOUR = 9
+LAST_HOUR = 17
+SLOTS_PER_DAY = LAST_HOUR - FIRST_HOUR + 1
+DEFAULT_DAYS = 28
+DEFAULT_CAPACITY = 4096
+
+MAGIC = b'DOCCAL02'
+HEADER = struct.Struct('<8sIII')
+# Ordinal of a ring day that holds nothing (being loaded, or never loaded)
+EMPTY = -1
+
+
+def slot_of(visit_date):
+    """(local date, slot index) of a visit on an hourly slot, else None."""
+    local = timezone.localtime(visit_date)
+    if local.minute or local.second or local.microsecond or not FIRST_HOUR <= local.hour <= LAST_HOUR:
+        return None
+    return local.date(), local.hour - FIRST_HOUR
+
+
+def slot_time(day, index):
+    return timezone.make_aware(datetime.combine(day, time(FIRST_HOUR + index)))
+
+
+def free_slots(booked, now, days_ahead, limit=None):
+    """The hourly slots from `now` (local) over `days_ahead` days, Sundays
+    excepted, whose datetime is not in `booked`, earliest first."""
+    found = 0
+    for day_offset in range(days_ahead):
+        date = now + timedelta(days=day_offset)
+        # Skip Sundays (assuming 6 = Sunday in weekday())
+        if date.weekday() == 6:
+            continue
+        for hour in range(FIRST_HOUR, LAST_HOUR + 1):
+            slot = date.replace(hour=hour, minute=0, second=0, microsecond=0)
+            # Skip past times for today
+            if day_offset == 0 and slot < now:
+                continue
+            if slot not in booked:
+                yield slot
+                found += 1
+                if found == limit:
+                    return
+
+
+class DoctorCalendar:
+    def __init__(self, path, days=DEFAULT_DAYS, capacity=DEFAULT_CAPACITY):
+        from bitarray import bitarray
+
+        self.path = path
+        self.pid = os.getpid()
+        self.days = days
+        self.capacity = capacity
+        self.stride = days * SLOTS_PER_DAY
+        self.ordinals_at = HEADER.size
+        self.sequences_at = self.ordinals_at + 4 * days
+        bits_at = -(-(self.sequences_at + 4 * days) // 64) * 64
+        size = bits_at + -(-capacity * self.stride // 64) * 8
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        # flock excludes other open files only, so threads also take this
+        self.thread_lock = threading.Lock()
+        with self.locked():
+            header = os.pread(self.fd, HEADER.size, 0)
+            fresh = header != HEADER.pack(MAGIC, days, SLOTS_PER_DAY, capacity)
+            if fresh:
+                # New file, or one laid out for other settings: start empty
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, size)
+            self.map = mmap.mmap(self.fd, size)
+            if fresh:
+                self.map[:HEADER.size] = HEADER.pack(MAGIC, days, SLOTS_PER_DAY, capacity)
+                for ring in range(days):
+                    self._set_ordinal(ring, EMPTY)
+        self.bits = bitarray(buffer=memoryview(self.map)[bits_at:size], endian='little')
+
+    @contextmanager
+    def locked(self):
+        with self.thread_lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _ordinal(self, ring):
+        return struct.unpack_from('<i', self.map, self.ordinals_at + 4 * ring)[0]
+
+    def _set_ordinal(self, ring, ordinal):
+        struct.pack_into('<i', self.map, self.ordinals_at + 4 * ring, ordinal)
+
+    def _sequence(self, ring):
+        return struct.unpack_from('<I', self.map, self.sequences_at + 4 * ring)[0]
+
+    @contextmanager
+    def _writing(self, ring):
+        """Bracket a change to the ring day. Hold locked()."""
+        at = self.sequences_at + 4 * ring
+        # Already odd if a writer died halfway; we hold the lock, so go on from there
+        odd = self._sequence(ring) | 1
+        struct.pack_into('<I', self.map, at, odd)
+        try:
+            yield
+        finally:
+            struct.pack_into('<I', self.map, at, (odd + 1) & 0xFFFFFFFF)
+
+    def _covers(self, doctor_id, day):
+        today = timezone.localdate()
+        return 0 <= doctor_id < self.capacity and today <= day < today + timedelta(days=self.days)
+
+    # -- reads --------------------------------------------------------------------
+
+    def day(self, doctor_id, day):
+        """The doctor's taken slots on `day`, SLOTS_PER_DAY bools, or None
+        when the calendar cannot answer and the caller should query."""
+        if not self._covers(doctor_id, day):
+            return None
+        ordinal = day.toordinal()
+        ring = ordinal % self.days
+        if self._ordinal(ring) != ordinal:
+            self._load(day)
+        sequence = self._sequence(ring)
+        if sequence % 2 or self._ordinal(ring) != ordinal:
+            return None
+        start = doctor_id * self.stride + ring * SLOTS_PER_DAY
+        taken = self.bits[start:start + SLOTS_PER_DAY].tolist()
+        # Written while we read: let the caller ask the database
+        return taken if self._sequence(ring) == sequence else None
+
+    def taken(self, doctor_id, start_day, days):
+        """Local datetimes of the doctor's taken slots over `days` days from
+        `start_day`, or None when any of those days is not covered."""
+        slots = set()
+        for offset in range(days):
+            day = start_day + timedelta(days=offset)
+            bits = self.day(doctor_id, day)
+            if bits is None:
+                return None
+            slots.update(slot_time(day, i) for i, bit in enumerate(bits) if bit)
+        return slots
+
+    def is_taken(self, doctor_id, visit_date):
+        """True/False for a covered hourly slot, else None."""
+        slot = slot_of(visit_date)
+        if slot is None:
+            return None
+        bits = self.day(doctor_id, slot[0])
+        return None if bits is None else bool(bits[slot[1]])
+
+    # -- writes -------------------------------------------------------------------
+
+    def _load(self, day):
+        """Fill the ring day for `day` from Encounter for every doctor."""
+        ordinal = day.toordinal()
+        ring = ordinal % self.days
+        with self.locked():
+            if self._ordinal(ring) == ordinal:
+                return
+            start = timezone.make_aware(datetime.combine(day, time.min))
+            rows = list(Encounter.objects.filter(
+                doctor_id__lt=self.capacity, visit_date__gte=start, visit_date__lt=start + timedelta(days=1),
+            ).exclude(status='CANCELLED').values_list('doctor_id', 'visit_date'))
+            # EMPTY until done, so a writer that dies halfway leaves the day to reload
+            with self._writing(ring):
+                self._set_ordinal(ring, EMPTY)
+                for i in range(SLOTS_PER_DAY):
+                    self.bits[ring * SLOTS_PER_DAY + i::self.stride] = 0
+                for doctor_id, visit_date in rows:
+                    slot = slot_of(visit_date)
+                    if doctor_id is not None and slot is not None:
+                        self.bits[doctor_id * self.stride + ring * SLOTS_PER_DAY + slot[1]] = 1
+                self._set_ordinal(ring, ordinal)
+
+    def rebuild(self):
+        """Reload every day of the horizon. Returns the number of days loaded."""
+        today = timezone.localdate()
+        with self.locked():
+            for ring in range(self.days):
+                with self._writing(ring):
+                    self._set_ordinal(ring, EMPTY)
+        for offset in range(self.days):
+            self._load(today + timedelta(days=offset))
+        return self.days
+
+    def set(self, doctor_id, visit_date, taken):
+        slot = slot_of(visit_date)
+        if slot is None or not self._covers(doctor_id, slot[0]):
+            return
+        ordinal = slot[0].toordinal()
+        ring = ordinal % self.days
+        with self.locked():
+            # A day that is not loaded picks the change up from the table
+            if self._ordinal(ring) == ordinal:
+                with self._writing(ring):
+                    self.bits[doctor_id * self.stride + ring * SLOTS_PER_DAY + slot[1]] = taken
+
+    def close(self):
+        del self.bits
+        self.map.close()
+        os.close(self.fd)
+
+
+_calendar = None
+
+
+def calendar():
+    """This process's DoctorCalendar, or None when DOCTOR_CALENDAR_PATH is
+    unset or bitarray is not installed."""
+    global _calendar
+    path = getattr(settings, 'DOCTOR_CALENDAR_PATH', None)
+    if not path:
+        return None
+    # A forked worker opens its own file: the parent's flock would be shared
+    if _calendar is None or _calendar.path != path or _calendar.pid != os.getpid():
+        try:
+            _calendar = DoctorCalendar(
+                path,
+                days=getattr(settings, 'DOCTOR_CALENDAR_DAYS', DEFAULT_DAYS),
+                capacity=getattr(settings, 'DOCTOR_CALENDAR_CAPACITY', DEFAULT_CAPACITY),
+            )
+        except ImportError:
+            return None
+    return _calendar
+
+
+def taken_slots(doctor_id, start_day, days):
+    cal = calendar()
+    return None if cal is None else cal.taken(doctor_id, start_day, days)
+
+
+def is_taken(doctor_id, visit_date):
+    cal = calendar()
+    return None if cal is None else cal.is_taken(doctor_id, visit_date)
+
+
+# -- keeping it current -----------------------------------------------------------
+
+def _still_taken(doctor_id, visit_date):
+    return Encounter.objects.filter(doctor_id=doctor_id, visit_date=visit_date).exclude(status='CANCELLED').exists()
+
+
+def _update(doctor_id, visit_date, taken):
+    cal = calendar()
+    if cal is not None:
+        cal.set(doctor_id, visit_date, taken)
+
+
+def encounter_saved(encounter, created):
+    """Mark the encounter's slot taken and, if it moved or was cancelled,
+    free the old one unless another encounter still holds it. Must run before
+    app1.rollups replaces the encounter's loaded state."""
+    if calendar() is None:
+        return
+    old = None if created else getattr(encounter, '_rollup_state', None)
+    new = (encounter.doctor_id, encounter.visit_date)
+    cancelled = encounter.status == 'CANCELLED'
+    freed = None
+    if old is not None and (old[1], old[0]) != new and old[1] is not None:
+        freed = (old[1], old[0])
+
+    def apply():
+        if encounter.doctor_id is not None:
+            _update(*new, _still_taken(*new) if cancelled else True)
+        if freed is not None:
+            _update(*freed, _still_taken(*freed))
+    transaction.on_commit(apply)
+
+
+def encounter_deleted(encounter):
+    if calendar() is None or encounter.doctor_id is None:
+        return
+    slot = (encounter.doctor_id, encounter.visit_date)
+    transaction.on_commit(lambda: _update(*slot, _still_taken(*slot)))
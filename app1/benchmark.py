@@ -0,0 +1,299 @@
+"""
+Load-test harness for /api/perform_action/.
+
+A run replays a weighted mix of chatbot actions at a fixed concurrency and
+reports throughput plus p50/p95/p99 latency per action. Results are plain
+dicts so they can be saved as JSON and later used as a regression baseline.
+Used by the `benchmark` management command.
+"""
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import Patient, Doctor, Encounter
+
+
+DEFAULT_MIX = {
+    'ASSIGN_DOCTOR': 40,
+    'BOOK_APPOINTMENT': 20,
+    'GET_PATIENT_HISTORY': 20,
+    'VALIDATE_PATIENT': 10,
+    'CHECK_FOLLOW_UP_STATUS': 5,
+    'LIST_DOCTORS': 5,
+}
+
+SPECIALIZATIONS = [
+    'Cardiology', 'Orthopedics', 'General Medicine', 'Dermatology',
+    'ENT', 'Gynecology', 'Pediatrics',
+]
+
+PROBLEMS = [
+    'chest pain when climbing stairs', 'high bp readings', 'short of breath at night',
+    'knee joint pain', 'suspected fracture in wrist', 'fever and weakness',
+    'stomach ache after meals', 'cold and flu symptoms', 'itchy skin rash',
+    'skin allergy on arms', 'ear pain', 'sore throat and blocked nose',
+    'irregular period', 'child has a cough', 'headache for three days',
+]
+
+FIRST_NAMES = ['Asha', 'Ravi', 'Meera', 'John', 'Priya', 'Arjun', 'Sara', 'Vikram', 'Nisha', 'Kiran']
+LAST_NAMES = ['Rao', 'Sharma', 'Iyer', 'Reddy', 'Patel', 'Nair', 'Das', 'Singh', 'Khan', 'Menon']
+
+# (metric, direction) pairs compared in regression mode. Per-action latency
+# percentiles are tracked for every action present in both runs.
+TRACKED_TOTALS = [('throughput_rps', 'higher'), ('error_rate', 'lower')]
+TRACKED_PER_ACTION = [('p95_ms', 'lower'), ('p99_ms', 'lower')]
+
+
+def parse_mix(text):
+    """Parse "ASSIGN_DOCTOR=40,BOOK_APPOINTMENT=20" into a weight dict."""
+    mix = {}
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        action, _, weight = part.partition('=')
+        mix[action.strip().upper()] = float(weight or 1)
+    if not mix or any(w < 0 for w in mix.values()) or not sum(mix.values()):
+        raise ValueError(f'Invalid action mix: {text!r}')
+    return mix
+
+
+def seed_dataset(doctors=20, patients=500, encounters_per_patient=4, seed=0):
+    """Bulk-insert a reproducible dataset: doctors spread over all
+    specializations and patients with a past visit history."""
+    rng = random.Random(seed)
+    Doctor.objects.bulk_create([
+        Doctor(
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            specialization=SPECIALIZATIONS[i % len(SPECIALIZATIONS)],
+        )
+        for i in range(doctors)
+    ], batch_size=500)
+    Patient.objects.bulk_create([
+        Patient(
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            dob=date(1950, 1, 1) + timedelta(days=rng.randrange(25000)),
+            gender=rng.choice('MFO'),
+            phone=f'9{seed:02d}{i:07d}',
+            email=f'patient{i}@example.com' if rng.random() < 0.7 else None,
+            address='',
+            blood_group=rng.choice(['A+', 'B+', 'O+', 'AB+', 'O-']),
+        )
+        for i in range(patients)
+    ], batch_size=500)
+    dataset = load_dataset()
+
+    now = timezone.now().replace(minute=0, second=0, microsecond=0)
+    encounters = []
+    for patient_id in dataset['patients']:
+        for _ in range(rng.randrange(encounters_per_patient * 2 + 1)):
+            encounters.append(Encounter(
+                patient_id=patient_id,
+                doctor_id=rng.choice(dataset['doctors']),
+                visit_type=rng.choice(['OPD', 'OPD', 'OPD', 'FU', 'TELE']),
+                visit_date=now + timedelta(hours=rng.randrange(-24 * 365, 24 * 14)),
+                problem=rng.choice(PROBLEMS),
+            ))
+    Encounter.objects.bulk_create(encounters, batch_size=500)
+    return dataset
+
+
+def load_dataset():
+    """Ids the payload generators pick from, read from the current database."""
+    patients = list(Patient.objects.values_list('patient_id', 'phone'))
+    return {
+        'doctors': list(Doctor.objects.values_list('doctor_id', flat=True)),
+        'patients': [pid for pid, _ in patients],
+        'phones': [phone for _, phone in patients],
+    }
+
+
+def build_payload(action, rng, dataset):
+    """Request data for one action, mimicking what the chat client sends."""
+    if action == 'ASSIGN_DOCTOR':
+        return {'problem': rng.choice(PROBLEMS)}
+    if action in ('BOOK_APPOINTMENT', 'CREATE_ENCOUNTER'):
+        day = timezone.localtime() + timedelta(days=rng.randrange(1, 8))
+        slot = day.replace(hour=rng.randrange(9, 18), minute=0, second=0, microsecond=0)
+        return {
+            'patient_id': rng.choice(dataset['patients']),
+            'doctor_id': rng.choice(dataset['doctors']),
+            'problem': rng.choice(PROBLEMS),
+            'slot_choice': slot.isoformat(),
+        }
+    if action == 'VALIDATE_PATIENT':
+        if rng.random() < 0.5:
+            return {'phone': rng.choice(dataset['phones'])}
+        return {'patient_id': rng.choice(dataset['patients'])}
+    if action in ('GET_PATIENT_HISTORY', 'CHECK_FOLLOW_UP_STATUS', 'GET_LAB_REPORTS', 'GET_LAB_TRENDS'):
+        return {'patient_id': rng.choice(dataset['patients'])}
+    return {}
+
+
+class InProcessTransport:
+    """Send requests through Django's test client, one client per thread,
+    so the whole middleware and view stack runs without a server."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def post(self, body):
+        from django.test import Client
+
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client()
+        response = client.post('/api/perform_action/', body, content_type='application/json')
+        return response.status_code
+
+    def close(self):
+        connection.close()
+
+
+class HttpTransport:
+    """Send requests to a running server."""
+
+    def __init__(self, base_url, timeout=30):
+        self.url = base_url.rstrip('/') + '/api/perform_action/'
+        self.timeout = timeout
+
+    def post(self, body):
+        request = urllib.request.Request(
+            self.url, data=body.encode('utf-8'), headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def close(self):
+        pass
+
+
+def run(transport, dataset, mix=None, requests=1000, concurrency=8, seed=0):
+    """Replay `requests` actions drawn from `mix` with `concurrency` workers.
+
+    Workers pull from a shared, pre-generated schedule so the offered load is
+    exactly `concurrency` requests in flight until the schedule is drained.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    actions = rng.choices(list(mix), weights=list(mix.values()), k=requests)
+    schedule = [
+        (action, json.dumps({'action': action, 'data': build_payload(action, rng, dataset)}))
+        for action in actions
+    ]
+    samples = {action: [] for action in mix}
+    errors = {action: 0 for action in mix}
+    cursor = iter(schedule)
+    lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    item = next(cursor, None)
+                if item is None:
+                    return
+                action, body = item
+                start = time.perf_counter()
+                try:
+                    status = transport.post(body)
+                except Exception:
+                    status = 599
+                elapsed = time.perf_counter() - start
+                with lock:
+                    samples[action].append(elapsed)
+                    if status >= 400:
+                        errors[action] += 1
+        finally:
+            if threading.current_thread() is not main_thread:
+                transport.close()
+
+    main_thread = threading.current_thread()
+    started = time.perf_counter()
+    if concurrency <= 1:
+        worker()
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(worker) for _ in range(concurrency)]:
+                future.result()
+    duration = time.perf_counter() - started
+    return summarize(samples, errors, duration, concurrency)
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples, errors, duration, concurrency):
+    total = sum(len(v) for v in samples.values())
+    total_errors = sum(errors.values())
+    actions = {}
+    for action, values in samples.items():
+        if not values:
+            continue
+        values = sorted(values)
+        actions[action] = {
+            'count': len(values),
+            'errors': errors[action],
+            'throughput_rps': round(len(values) / duration, 2) if duration else 0.0,
+            'mean_ms': round(sum(values) / len(values) * 1000, 3),
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p95_ms': round(percentile(values, 95) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+            'max_ms': round(values[-1] * 1000, 3),
+        }
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(total / duration, 2) if duration else 0.0,
+        'error_rate': round(total_errors / total, 4) if total else 0.0,
+        'actions': actions,
+    }
+
+
+def compare(results, baseline, threshold=0.10):
+    """Return a list of human readable regressions of `results` against
+    `baseline`, where a regression is a tracked metric that is worse by more
+    than `threshold` (a fraction, 0.10 = 10%)."""
+    regressions = []
+
+    def check(label, current, previous, direction):
+        if current is None or previous is None:
+            return
+        if direction == 'lower':
+            # Error rates start at zero; treat any new error as a regression.
+            worse = current > previous * (1 + threshold) if previous else current > 0
+        else:
+            worse = current < previous * (1 - threshold)
+        if worse:
+            regressions.append(f'{label}: {previous} -> {current}')
+
+    for metric, direction in TRACKED_TOTALS:
+        check(metric, results.get(metric), baseline.get(metric), direction)
+    for action, stats in results.get('actions', {}).items():
+        previous = baseline.get('actions', {}).get(action)
+        if not previous:
+            continue
+        for metric, direction in TRACKED_PER_ACTION:
+            check(f'{action}.{metric}', stats.get(metric), previous.get(metric), direction)
+    return regressions
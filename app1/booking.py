@@ -0,0 +1,121 @@
+"""
+Triage and booking helpers shared by the perform_action actions and the
+CHAT_TURN conversation (app1.conversation).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import assignment, availability, llm
+from .models import Encounter, Reminder
+
+
+def map_symptom_to_specialization(problem_text: str) -> str:
+    # Prefer LLM-based classification if GROQ key is configured
+    try:
+        if getattr(settings, 'GROQ_API_KEY', ''):
+            spec = llm.classify_specialization(problem_text)
+            if spec:
+                return spec
+    except Exception:
+        # fall back to rule-based mapping on any LLM error
+        pass
+
+    text = problem_text.lower()
+    if any(k in text for k in ['chest', 'heart', 'bp', 'breath']):
+        return 'Cardiology'
+    if any(k in text for k in ['bone', 'joint', 'fracture']):
+        return 'Orthopedics'
+    if any(k in text for k in ['fever', 'stomach', 'weak', 'cold', 'flu']):
+        return 'General Medicine'
+    if any(k in text for k in ['rash', 'itch', 'skin', 'allergy']):
+        return 'Dermatology'
+    if any(k in text for k in ['ear', 'nose', 'throat']):
+        return 'ENT'
+    if any(k in text for k in ['preg', 'period', 'women']):
+        return 'Gynecology'
+    if any(k in text for k in ['child', 'kid', 'children']):
+        return 'Pediatrics'
+    return 'General Medicine'
+
+
+def find_doctor_for_specialization(spec: str, patient_id=None):
+    # Balanced across the specialization's doctors (app1.assignment)
+    return assignment.assign(spec, patient_id)
+
+
+def choose_appointment_slot(doctor):
+    # Choose same-day next hour slot between 09:00-17:00 if available, else 2 days later
+    now = timezone.localtime()
+    start_hour = max(now.hour + 1, 9)
+    if start_hour > 17:
+        candidate = (now + timedelta(days=2)).replace(hour=9, minute=0, second=0, microsecond=0)
+    else:
+        candidate = now.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+
+    # check conflict exact datetime; while it is taken, move 2 days later same time
+    while slot_taken(doctor.pk, candidate):
+        candidate = candidate + timedelta(days=2)
+    return candidate
+
+
+def slot_taken(doctor_id, visit_date, uncommitted=False):
+    """Whether an encounter that is not cancelled holds the doctor's slot.
+    The calendar only catches up when a transaction commits: pass
+    uncommitted=True for a slot changed in the current one."""
+    taken = None if uncommitted else availability.is_taken(doctor_id, visit_date)
+    if taken is None:
+        taken = Encounter.objects.filter(
+            doctor_id=doctor_id, visit_date=visit_date,
+        ).exclude(status='CANCELLED').exists()
+    return taken
+
+
+def get_available_slots(doctor, days_ahead=7):
+    """Get available slots for a doctor for the next few days"""
+    now = timezone.localtime()
+
+    # Fetch the doctor's bookings in the window once instead of one query per
+    # slot, from the shared calendar when it is enabled
+    window_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    booked = availability.taken_slots(doctor.pk, window_start.date(), days_ahead)
+    if booked is None:
+        booked = set(Encounter.objects.filter(
+            doctor=doctor,
+            visit_date__gte=window_start,
+            visit_date__lt=window_start + timedelta(days=days_ahead),
+        ).exclude(status='CANCELLED').values_list('visit_date', flat=True))
+
+    return list(availability.free_slots(booked, now, days_ahead, limit=10))
+
+
+def slot_options(slots):
+    """The first five slots as numbered choices for the chat."""
+    return [
+        {'id': i + 1, 'datetime': slot.isoformat(), 'date': slot.strftime('%Y-%m-%d'), 'time': slot.strftime('%H:%M')}
+        for i, slot in enumerate(slots[:5])
+    ]
+
+
+def book(patient, doctor, problem, appt_dt, previous_encounter_id=None):
+    """Create a BOOKED encounter and its reminder call 24 hours before."""
+    # Determine visit type based on whether it's a follow-up
+    visit_type = 'FU' if previous_encounter_id else 'OPD'
+    enc = Encounter.objects.create(
+        patient=patient,
+        doctor=doctor,
+        visit_type=visit_type,
+        visit_date=appt_dt,
+        notes=problem,
+        problem=problem,
+        status='BOOKED',
+        payment_status='PENDING',
+    )
+    Reminder.objects.create(
+        encounter=enc,
+        remind_at=appt_dt - timedelta(hours=24),
+        method='CALL',
+        health_check_required=True
+    )
+    return enc
@@ -0,0 +1,336 @@
+"""
+Server-side booking conversation behind the CHAT_TURN action.
+
+Each chat message is one CHAT_TURN: the handler for the session's current
+step consumes the message, does whatever lookups or writes it implies and
+moves to the next step. Triage, slot proposal and booking happen inside the
+turns that complete them, so the page sends only what the user typed and
+gets back the bot's lines.
+
+State is a small dict in the Django session under SESSION_KEY: ids, the
+problem text and the proposed slots, never whole objects. A conversation
+left idle for CHAT_STATE_TTL seconds (default 30 minutes) starts over;
+"restart" or "cancel" starts over at any step.
+"""
+import re
+import time
+from datetime import date, datetime
+
+from django.conf import settings
+
+from . import archive, search
+from .booking import (
+    book, choose_appointment_slot, find_doctor_for_specialization, get_available_slots,
+    map_symptom_to_specialization, slot_options, slot_taken,
+)
+from .models import ArchivedEncounter, Doctor, Encounter, Patient
+
+
+SESSION_KEY = 'chat'
+DEFAULT_TTL = 30 * 60
+BOOKING_INTENT = re.compile(r'\b(book|appointment|op)\b', re.I)
+RESTART = re.compile(r'^\s*(restart|cancel|start over)\s*$', re.I)
+EXISTING = re.compile(r'existing', re.I)
+NEW = re.compile(r'new', re.I)
+PREVIOUS = re.compile(r'previous', re.I)
+AUTO = re.compile(r'auto', re.I)
+YES = re.compile(r'yes', re.I)
+# Questions asked, in order, when registering a new patient
+NEW_PATIENT_FIELDS = [
+    ('first_name', 'Please provide First Name:'),
+    ('last_name', 'Last Name:'),
+    ('dob', 'Date of Birth (YYYY-MM-DD):'),
+    ('gender', 'Gender (M/F/O):'),
+    ('phone', 'Phone Number:'),
+    ('email', 'Email (optional, reply "skip"):'),
+    ('address', 'Address:'),
+    ('blood_group', 'Blood Group (e.g., O+):'),
+]
+PREVIOUS_VISITS_SHOWN = 5
+
+
+class Reply:
+    """Bot lines plus structured data for the page (doctor, slots, encounter)."""
+
+    def __init__(self):
+        self.messages = []
+        self.data = {}
+
+    def say(self, text):
+        self.messages.append(text)
+
+
+def _ttl():
+    return getattr(settings, 'CHAT_STATE_TTL', DEFAULT_TTL)
+
+
+def load_state(session):
+    state = session.get(SESSION_KEY)
+    if not state or time.time() - state.get('at', 0) > _ttl():
+        return {'step': 'start'}
+    return state
+
+
+def save_state(session, state):
+    state['at'] = int(time.time())
+    session[SESSION_KEY] = state
+
+
+def handle_turn(session, message):
+    """Advance the session's conversation by one user message. Returns the
+    reply as a dict: step, messages and any structured data."""
+    state = load_state(session)
+    reply = Reply()
+    if RESTART.match(message):
+        state = _restart(state)
+        reply.say('Okay, starting over. How can I assist you today?')
+    else:
+        STEPS[state['step']](state, message.strip(), reply)
+    save_state(session, state)
+    return {'step': state['step'], 'messages': reply.messages, **reply.data}
+
+
+def _restart(state):
+    # An identified patient stays identified for the rest of the session
+    kept = {k: state[k] for k in ('patient_id', 'patient_name') if k in state}
+    return {'step': 'start', **kept}
+
+
+# -- steps -------------------------------------------------------------------------
+
+def start(state, text, reply):
+    kept = _restart(state)
+    state.clear()
+    state.update(kept)
+    state['problem'] = None if BOOKING_INTENT.search(text) else text
+    if state.get('patient_id'):
+        reply.say(f"Booking for {state['patient_name']}.")
+        _ask_problem(state, reply)
+        return
+    state['step'] = 'ask_patient_type'
+    reply.say('Are you an existing patient or a new patient? (reply: existing / new)')
+
+
+def ask_patient_type(state, text, reply):
+    if EXISTING.search(text):
+        state['step'] = 'ask_existing_id'
+        reply.say('Please provide Patient ID or registered phone number.')
+    elif NEW.search(text):
+        state['step'] = 'collect_new'
+        state['new'] = {}
+        reply.say(NEW_PATIENT_FIELDS[0][1])
+    else:
+        reply.say('Reply with "existing" or "new".')
+
+
+def ask_existing_id(state, text, reply):
+    if text.isdigit() and len(text) < search.PHONE_DIGITS:
+        patient = Patient.objects.filter(patient_id=int(text)).first()
+    else:
+        patient = Patient.objects.filter(phone=text).first()
+    if not patient:
+        state['step'] = 'ask_patient_type'
+        reply.say('No patient found. Type "new" to register or "existing" to try phone/ID again.')
+        return
+    _identified(state, patient, reply)
+    reply.say(f'Patient validated: {patient.first_name} {patient.last_name}')
+
+    # Archived visits included (app1.archive)
+    previous, _ = archive.patient_history(patient.pk, limit=PREVIOUS_VISITS_SHOWN)
+    if previous:
+        reply.say('Previous visits:')
+        for enc in previous:
+            doctor = (
+                f"Dr. {enc['doctor__first_name']} {enc['doctor__last_name']} ({enc['doctor__specialization']})"
+                if enc['doctor__first_name'] else 'Unknown'
+            )
+            reply.say(
+                f"- OP {enc['encounter_id']}, {enc['visit_date'].date().isoformat()}: {enc['problem']} "
+                f"with {doctor} - Status: {enc['status']}"
+            )
+        reply.say('Is this related to a previous visit or a new issue? (reply: previous / new)')
+        state['step'] = 'ask_visit_type'
+        return
+    _ask_problem(state, reply)
+
+
+def collect_new(state, text, reply):
+    new = state['new']
+    field = NEW_PATIENT_FIELDS[len(new)][0]
+    error = _invalid(field, text)
+    if error:
+        reply.say(error)
+        return
+    new[field] = '' if field == 'email' and text.lower() == 'skip' else text
+    if len(new) < len(NEW_PATIENT_FIELDS):
+        reply.say(NEW_PATIENT_FIELDS[len(new)][1])
+        return
+    patient = Patient.objects.create(
+        first_name=new['first_name'], last_name=new['last_name'], dob=new['dob'], gender=new['gender'].upper(),
+        phone=new['phone'], email=new['email'] or None, address=new['address'], blood_group=new['blood_group'],
+    )
+    del state['new']
+    _identified(state, patient, reply)
+    reply.say(f'Registered successfully. Patient ID: {patient.patient_id}')
+    _ask_problem(state, reply)
+
+
+def _invalid(field, text):
+    if not text:
+        return 'Please enter a value.'
+    if field == 'dob':
+        try:
+            dob = date.fromisoformat(text)
+        except ValueError:
+            return 'Please enter the date of birth as YYYY-MM-DD.'
+        if dob > date.today():
+            return 'The date of birth cannot be in the future.'
+    if field == 'gender' and text.upper() not in ('M', 'F', 'O'):
+        return 'Please reply M, F or O.'
+    return None
+
+
+def ask_visit_type(state, text, reply):
+    if PREVIOUS.search(text):
+        state['step'] = 'ask_previous_op_id'
+        reply.say('Please provide the OP ID of the previous visit you want to follow up on:')
+    elif NEW.search(text):
+        _ask_problem(state, reply)
+    else:
+        reply.say('Reply with "previous" or "new".')
+
+
+def ask_previous_op_id(state, text, reply):
+    if not text.isdigit() or not any(
+        model.objects.filter(pk=int(text), patient_id=state['patient_id']).exists()
+        for model in (Encounter, ArchivedEncounter)
+    ):
+        reply.say('That OP ID is not one of your visits. Please check it and try again.')
+        return
+    state['previous_encounter_id'] = int(text)
+    _ask_problem(state, reply, 'Briefly describe your health problem related to this previous visit.')
+
+
+def ask_problem(state, text, reply):
+    state['problem'] = text
+    _triage(state, reply)
+
+
+def choose_slot(state, text, reply):
+    if AUTO.search(text):
+        _book(state, reply, None)
+        return
+    if text.isdigit() and 1 <= int(text) <= len(state['slots']):
+        _book(state, reply, state['slots'][int(text) - 1])
+        return
+    reply.say(f'Please select a valid slot number (1-{len(state["slots"])}) or type "auto" for automatic selection.')
+
+
+def ask_payment(state, text, reply):
+    if YES.search(text):
+        # payment_status is not a rollup field, so no signal work is needed
+        Encounter.objects.filter(pk=state['encounter_id']).update(payment_status='PAID')
+        reply.say('Payment successful!')
+    else:
+        reply.say('Appointment booked without payment. You can pay at the hospital.')
+    reply.say('Reminder scheduled 24 hours before your appointment.')
+    reply.data['encounter_id'] = state['encounter_id']
+    state['step'] = 'done'
+
+
+STEPS = {
+    'start': start,
+    'ask_patient_type': ask_patient_type,
+    'ask_existing_id': ask_existing_id,
+    'collect_new': collect_new,
+    'ask_visit_type': ask_visit_type,
+    'ask_previous_op_id': ask_previous_op_id,
+    'ask_problem': ask_problem,
+    'choose_slot': choose_slot,
+    'ask_payment': ask_payment,
+    # A finished booking starts the next conversation
+    'done': start,
+}
+
+
+# -- transitions ---------------------------------------------------------------------
+
+def _identified(state, patient, reply):
+    state['patient_id'] = patient.patient_id
+    state['patient_name'] = f'{patient.first_name} {patient.last_name}'
+    reply.data['patient'] = {
+        'patient_id': patient.patient_id, 'first_name': patient.first_name,
+        'last_name': patient.last_name, 'phone': patient.phone,
+    }
+
+
+def _ask_problem(state, reply, prompt='Briefly describe your health problem.'):
+    # A problem given in the opening message is triaged straight away
+    if state.get('problem'):
+        _triage(state, reply)
+        return
+    state['step'] = 'ask_problem'
+    reply.say(prompt)
+
+
+def _triage(state, reply):
+    spec = map_symptom_to_specialization(state['problem'])
+    doctor = find_doctor_for_specialization(spec, state.get('patient_id'))
+    if not doctor:
+        state['step'] = 'start'
+        reply.say('No doctor available; please try again later.')
+        return
+    state['doctor_id'] = doctor.doctor_id
+    reply.say(f'Assigned to Dr. {doctor.first_name} {doctor.last_name} ({doctor.specialization})')
+    reply.data['doctor'] = {
+        'doctor_id': doctor.doctor_id, 'first_name': doctor.first_name,
+        'last_name': doctor.last_name, 'specialization': doctor.specialization,
+    }
+    _propose_slots(state, reply, doctor)
+
+
+def _propose_slots(state, reply, doctor):
+    options = slot_options(get_available_slots(doctor))
+    if not options:
+        reply.say('No specific slots available right now. We will assign the soonest available slot.')
+        _book(state, reply, None, doctor)
+        return
+    state['slots'] = [o['datetime'] for o in options]
+    state['step'] = 'choose_slot'
+    reply.data['available_slots'] = options
+    reply.say('Available slots:')
+    for o in options:
+        reply.say(f"{o['id']}. {o['date']} at {o['time']}")
+    reply.say(f'Please select a slot by entering its number (1-{len(options)}), or type "auto" for automatic selection:')
+
+
+def _book(state, reply, slot, doctor=None):
+    doctor = doctor or Doctor.objects.get(pk=state['doctor_id'])
+    if slot:
+        appt_dt = datetime.fromisoformat(slot)
+        # The page hears about taken slots over /events, but may not have yet
+        if slot_taken(doctor.pk, appt_dt):
+            reply.say('Sorry, that slot was just booked by someone else.')
+            _propose_slots(state, reply, doctor)
+            return
+    else:
+        appt_dt = choose_appointment_slot(doctor)
+    enc = book(
+        Patient(pk=state['patient_id']), doctor, state['problem'], appt_dt, state.get('previous_encounter_id'),
+    )
+    state.pop('slots', None)
+    state['encounter_id'] = enc.encounter_id
+    state['step'] = 'ask_payment'
+    reply.data['encounter'] = {
+        'encounter_id': enc.encounter_id,
+        'appointment_date': enc.visit_date.isoformat(),
+        'appointment_time': enc.visit_date.time().isoformat(),
+        'status': enc.status,
+        'visit_type': enc.visit_type,
+    }
+    reply.say('Appointment booked!')
+    reply.say(f'OP ID: {enc.encounter_id}')
+    reply.say(f'Doctor: Dr. {doctor.first_name} {doctor.last_name} ({doctor.specialization})')
+    reply.say(f'Date & Time: {enc.visit_date.isoformat()}')
+    reply.say(f"Visit Type: {'Follow-up' if enc.visit_type == 'FU' else 'New Visit'}")
+    reply.say('Would you like to proceed with payment now? (reply: yes / no)')
@@ -0,0 +1,236 @@
+"""
+Reminder delivery through pluggable channels.
+
+process_reminders turns each due reminder into deliveries: one on the
+reminder's own channel (Reminder.method: CALL, SMS or EMAIL) and, as before,
+an email as well when the patient has an address. REMINDER_CHANNELS
+configures the channels, in the style of EMAIL_BACKEND:
+
+    REMINDER_CHANNELS = {
+        'CALL': {'BACKEND': 'app1.dispatch.ConsoleChannel', 'CONCURRENCY': 2, 'RATE': 2},
+        ...
+    }
+
+BACKEND is a Channel subclass, built with OPTIONS as keyword arguments.
+Every channel has its own pool of CONCURRENCY threads and a token bucket of
+RATE sends per second (None: unlimited). A slow telephony provider therefore
+fills only the CALL pool while email keeps flowing. Throughput per channel
+grows with CONCURRENCY up to its RATE.
+
+Workers only call the backend. They return an unsaved ReminderAttempt, which
+the caller stores, so the threads never touch the database.
+"""
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ReminderAttempt
+
+
+DEFAULT_CHANNELS = {
+    'EMAIL': {'BACKEND': 'app1.dispatch.EmailChannel', 'CONCURRENCY': 4, 'RATE': 10},
+    'CALL': {'BACKEND': 'app1.dispatch.ConsoleChannel', 'CONCURRENCY': 2, 'RATE': 2},
+    'SMS': {'BACKEND': 'app1.dispatch.ConsoleChannel', 'CONCURRENCY': 2, 'RATE': 5},
+}
+
+
+class Delivery:
+    __slots__ = ('reminder_id', 'channel', 'to', 'subject', 'body')
+
+    def __init__(self, reminder_id, channel, to, subject, body):
+        self.reminder_id = reminder_id
+        self.channel = channel
+        self.to = to
+        self.subject = subject
+        self.body = body
+
+
+def deliveries_for(reminder):
+    """The deliveries for a reminder loaded with encounter__patient and
+    encounter__doctor."""
+    encounter = reminder.encounter
+    patient = encounter.patient
+    when = timezone.localtime(encounter.visit_date).strftime('%Y-%m-%d %H:%M')
+    doctor = f'Dr. {encounter.doctor.first_name} {encounter.doctor.last_name}' if encounter.doctor else 'your doctor'
+    short = f'Reminder: appointment {encounter.encounter_id} with {doctor} on {when}.'
+    subject = f'Reminder: Upcoming Appointment #{encounter.encounter_id}'
+    message = f'''
+Health Check Reminder
+
+Dear {patient.first_name} {patient.last_name},
+
+This is a reminder for your upcoming appointment:
+
+Appointment ID: {encounter.encounter_id}
+Doctor: {doctor}
+Date & Time: {when}
+
+Please confirm your attendance and let us know if you have any health concerns before the visit.
+
+Contact us if you need to reschedule.
+
+Best regards,
+Hospital Administration
+    '''.strip()
+
+    deliveries = []
+    if reminder.method in ('CALL', 'SMS'):
+        deliveries.append(Delivery(reminder.reminder_id, reminder.method, patient.phone, subject, short))
+    if patient.email:
+        deliveries.append(Delivery(reminder.reminder_id, 'EMAIL', patient.email, subject, message))
+    elif reminder.method == 'EMAIL':
+        # Recorded as a failed attempt
+        deliveries.append(Delivery(reminder.reminder_id, 'EMAIL', '', subject, message))
+    return deliveries
+
+
+# -- backends --------------------------------------------------------------------
+
+class Channel:
+    """Base class for channel backends. send() is called from worker threads
+    and raises on failure."""
+
+    def __init__(self, name, **options):
+        self.name = name
+
+    def send(self, delivery):
+        raise NotImplementedError
+
+
+class EmailChannel(Channel):
+    """Email through Django's EMAIL_BACKEND."""
+
+    def send(self, delivery):
+        if not delivery.to:
+            raise ValueError('Patient has no email address')
+        send_mail(
+            delivery.subject, delivery.body,
+            getattr(settings, 'DEFAULT_FROM_EMAIL', None) or 'noreply@hospital.com', [delivery.to],
+            fail_silently=False,
+        )
+
+
+class ConsoleChannel(Channel):
+    """Writes each delivery to a stream (stdout by default). Stand-in for CALL
+    and SMS until a provider is configured."""
+
+    def __init__(self, name, stream=None, **options):
+        super().__init__(name, **options)
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def send(self, delivery):
+        with self.lock:
+            self.stream.write(f'[{self.name}] to {delivery.to}: {delivery.body}\n')
+
+
+class LocmemChannel(Channel):
+    """Keeps deliveries in `outbox[name]`, for tests. `delay` seconds per
+    send stands in for a slow provider; recipients in `fail_for` fail."""
+    outbox = {}
+
+    def __init__(self, name, delay=0, fail_for=(), **options):
+        super().__init__(name, **options)
+        self.delay = delay
+        self.fail_for = set(fail_for)
+        self.outbox.setdefault(name, [])
+
+    def send(self, delivery):
+        if self.delay:
+            time.sleep(self.delay)
+        if delivery.to in self.fail_for:
+            raise ConnectionError(f'{self.name} provider rejected {delivery.to}')
+        self.outbox[self.name].append(delivery)
+
+
+# -- dispatching -----------------------------------------------------------------
+
+class TokenBucket:
+    """`rate` acquisitions per second on average, bursts of up to `rate`.
+    Thread safe; acquire() blocks the calling worker until a token is free."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class _Lane:
+    """A channel's backend with its own worker pool and rate limit."""
+
+    def __init__(self, name, config):
+        self.backend = import_string(config['BACKEND'])(name, **config.get('OPTIONS', {}))
+        self.pool = ThreadPoolExecutor(config.get('CONCURRENCY', 1), thread_name_prefix=f'reminder-{name.lower()}')
+        rate = config.get('RATE')
+        self.bucket = TokenBucket(rate) if rate else None
+
+    def attempt(self, delivery):
+        if self.bucket is not None:
+            self.bucket.acquire()
+        attempted_at = timezone.now()
+        started = time.perf_counter()
+        try:
+            self.backend.send(delivery)
+            status, error = 'SENT', ''
+        except Exception as e:
+            status, error = 'FAILED', f'{type(e).__name__}: {e}'
+        return ReminderAttempt(
+            reminder_id=delivery.reminder_id, channel=delivery.channel, status=status, error=error,
+            attempted_at=attempted_at, duration_ms=(time.perf_counter() - started) * 1000,
+        )
+
+
+class Dispatcher:
+    """Sends deliveries on their channels' pools. Use as a context manager;
+    leaving it waits for everything submitted."""
+
+    def __init__(self, channels=None):
+        if channels is None:
+            channels = getattr(settings, 'REMINDER_CHANNELS', DEFAULT_CHANNELS)
+        self.lanes = {name: _Lane(name, config) for name, config in channels.items()}
+
+    def submit(self, delivery):
+        """A Future for the delivery's unsaved ReminderAttempt."""
+        lane = self.lanes.get(delivery.channel)
+        if lane is None:
+            return _failed(delivery, f'No {delivery.channel} channel configured')
+        return lane.pool.submit(lane.attempt, delivery)
+
+    def close(self):
+        for lane in self.lanes.values():
+            lane.pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _failed(delivery, error):
+    future = Future()
+    future.set_result(ReminderAttempt(
+        reminder_id=delivery.reminder_id, channel=delivery.channel, status='FAILED', error=error,
+        attempted_at=timezone.now(), duration_ms=0,
+    ))
+    return future
@@ -0,0 +1,272 @@
+"""
+Early-warning scores (NEWS2 style) from vitals.
+
+When a Vital is saved (pre_save signal), score() parses blood_pressure
+("120/80") into systolic and diastolic and stores the reading's news_score:
+the NEWS2 points of the parameters recorded here, i.e. SpO2 (scale 1),
+systolic pressure, pulse and temperature. Respiration rate, consciousness and
+supplemental oxygen are not recorded, so scores run lower than a full NEWS2.
+
+EncounterRisk holds one row per encounter with vitals: the score of its
+latest reading, the peak, and the number of readings. A new reading updates
+that row in one UPDATE (post_save); the encounter's history is only read
+again when a reading is edited or deleted. highest_risk() ranks the
+encounters read recently, found through the (ward, recorded_at) indexes.
+
+Writes that bypass save() must call score() themselves and then
+recompute_encounter(). For backfills, recompute_encounters() and
+score_archived() (the recompute_ews command) score vitals in bulk with NumPy.
+"""
+import heapq
+import re
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
+
+from .models import ArchivedVital, Encounter, EncounterRisk, Vital
+
+
+# (upper bounds, points): a value up to bounds[i] scores points[i], above
+# the last bound points[-1]. A missing value scores 0.
+SPO2 = ((91, 93, 95), (3, 2, 1, 0))
+SYSTOLIC = ((90, 100, 110, 219), (3, 2, 1, 0, 3))
+PULSE = ((40, 50, 90, 110, 130), (3, 1, 0, 1, 2, 3))
+TEMPERATURE = ((35.0, 36.0, 38.0, 39.0), (3, 1, 0, 1, 2))
+PARAMETERS = (
+    ('oxygen_saturation', SPO2), ('systolic', SYSTOLIC), ('heart_rate', PULSE), ('temperature', TEMPERATURE),
+)
+
+# NEWS2 clinical response bands
+MEDIUM = 5
+HIGH = 7
+
+_BP_RE = re.compile(r'^\s*(\d{2,3})\s*/\s*(\d{2,3})(?!\d)')
+
+
+def parse_blood_pressure(text):
+    """(systolic, diastolic) from "120/80" or "120 / 80 mmHg"; (None, None)
+    when unreadable."""
+    match = _BP_RE.match(text or '')
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2))
+
+
+def points(band, value):
+    if value is None:
+        return 0
+    bounds, scores = band
+    return scores[bisect_left(bounds, value)]
+
+
+def score(vital):
+    """Fill systolic, diastolic and news_score of a Vital (or ArchivedVital).
+    Returns it."""
+    vital.systolic, vital.diastolic = parse_blood_pressure(vital.blood_pressure)
+    vital.news_score = sum(points(band, getattr(vital, field)) for field, band in PARAMETERS)
+    return vital
+
+
+def red_flag(vital):
+    """Whether a single parameter of the reading scores 3."""
+    return any(points(band, getattr(vital, field)) == 3 for field, band in PARAMETERS)
+
+
+def level(news_score, red=False):
+    if news_score >= HIGH:
+        return 'HIGH'
+    if news_score >= MEDIUM:
+        return 'MEDIUM'
+    return 'LOW_MEDIUM' if red else 'LOW'
+
+
+# -- per encounter ------------------------------------------------------------------
+
+def vital_saved(vital, created):
+    if not created:
+        recompute_encounter(vital.encounter_id)
+        return
+    red = red_flag(vital)
+    # Only a reading at least as recent as the current one replaces it
+    latest = dict(score=vital.news_score, red_flag=red, last_vital_id=vital.pk, recorded_at=vital.recorded_at)
+    counted = dict(peak_score=Greatest('peak_score', Value(vital.news_score)), readings=F('readings') + 1)
+    risk = EncounterRisk.objects.filter(pk=vital.encounter_id)
+    if risk.filter(recorded_at__lte=vital.recorded_at).update(**latest, **counted) or risk.update(**counted):
+        return
+    try:
+        with transaction.atomic():
+            EncounterRisk.objects.create(
+                encounter_id=vital.encounter_id, peak_score=vital.news_score, readings=1,
+                ward=vital.encounter.visit_type, **latest,
+            )
+    except IntegrityError:
+        # Another reading of the encounter created the row first
+        recompute_encounter(vital.encounter_id)
+
+
+def vital_deleted(vital):
+    recompute_encounter(vital.encounter_id, create=False)
+
+
+def recompute_encounter(encounter_id, create=True):
+    """Rebuild an encounter's EncounterRisk from its vitals. With create=False
+    only an existing row is updated (an encounter being deleted takes its
+    vitals and row with it)."""
+    vitals = list(
+        Vital.objects.filter(encounter_id=encounter_id).order_by('recorded_at', 'vital_id')
+        .only('vital_id', 'recorded_at', 'news_score', *(field for field, _ in PARAMETERS))
+    )
+    if not vitals:
+        EncounterRisk.objects.filter(pk=encounter_id).delete()
+        return
+    last = vitals[-1]
+    values = dict(
+        score=last.news_score or 0, peak_score=max(v.news_score or 0 for v in vitals), red_flag=red_flag(last),
+        readings=len(vitals), last_vital_id=last.vital_id, recorded_at=last.recorded_at,
+    )
+    if EncounterRisk.objects.filter(pk=encounter_id).update(**values) or not create:
+        return
+    ward = Encounter.objects.filter(pk=encounter_id).values_list('visit_type', flat=True).first()
+    if ward is not None:
+        EncounterRisk.objects.update_or_create(encounter_id=encounter_id, defaults=dict(values, ward=ward))
+
+
+def highest_risk(ward=None, hours=24, limit=20):
+    """The highest-scoring encounters whose latest reading is within the last
+    `hours`, optionally on one ward, by score then recency."""
+    risks = EncounterRisk.objects.filter(recorded_at__gte=timezone.now() - timedelta(hours=hours))
+    if ward:
+        risks = risks.filter(ward=ward)
+    # The window is a small slice of the table: rank its keys, read from the
+    # (ward, recorded_at, score) index alone, rather than walk a score index
+    # through every encounter that scored high long ago. The times stay text,
+    # which sorts the same and skips the datetime conversion.
+    keys = risks.values_list('score', Cast('recorded_at', CharField()), 'encounter_id')
+    top = heapq.nlargest(limit, keys)
+    rows = EncounterRisk.objects.select_related('encounter__patient', 'encounter__doctor').in_bulk(
+        [pk for _, _, pk in top]
+    )
+    return [rows[pk] for _, _, pk in top if pk in rows]
+
+
+# -- bulk ---------------------------------------------------------------------------
+
+BULK_FIELDS = (
+    'vital_id', 'encounter_id', 'encounter__visit_type', 'recorded_at', 'blood_pressure',
+    'oxygen_saturation', 'heart_rate', 'temperature',
+)
+
+
+def parse_blood_pressures(texts):
+    """parse_blood_pressure() over a sequence: two float arrays, NaN where
+    unreadable. Plain "120/80" is split in NumPy; anything else goes through
+    the regex."""
+    import numpy as np
+
+    texts = np.array(texts, dtype=str)
+    parts = np.char.partition(np.char.strip(texts), '/')
+    high, low = np.char.strip(parts[:, 0]), np.char.strip(parts[:, 2])
+    plain = np.char.isdigit(high) & np.char.isdigit(low)
+    plain &= np.isin(np.char.str_len(high), (2, 3)) & np.isin(np.char.str_len(low), (2, 3))
+    systolic = np.full(len(texts), np.nan)
+    diastolic = np.full(len(texts), np.nan)
+    systolic[plain] = high[plain].astype(float)
+    diastolic[plain] = low[plain].astype(float)
+    for i in np.flatnonzero(~plain).tolist():
+        s, d = parse_blood_pressure(str(texts[i]))
+        if s is not None:
+            systolic[i], diastolic[i] = s, d
+    return systolic, diastolic
+
+
+def score_arrays(oxygen_saturation, systolic, heart_rate, temperature):
+    """NEWS points of many readings: (total, red flag) arrays. Inputs are
+    float arrays with NaN for missing values, in PARAMETERS order."""
+    import numpy as np
+
+    total = np.zeros(len(oxygen_saturation), dtype=np.int64)
+    worst = np.zeros_like(total)
+    for values, (_, (bounds, scores)) in zip((oxygen_saturation, systolic, heart_rate, temperature), PARAMETERS):
+        values = np.asarray(values, dtype=float)
+        p = np.array(scores)[np.searchsorted(bounds, values, side='left')]
+        p[np.isnan(values)] = 0
+        total += p
+        np.maximum(worst, p, out=worst)
+    return total, worst == 3
+
+
+def _store_scores(model, ids, systolic, diastolic, total):
+    qn = connection.ops.quote_name
+    # Plain UPDATEs by primary key: bulk_update's CASE expressions get slow on big batches
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {qn(model._meta.db_table)} SET systolic = %s, diastolic = %s, news_score = %s '
+            f'WHERE vital_id = %s',
+            zip(_nullable_ints(systolic), _nullable_ints(diastolic), total.tolist(), ids),
+        )
+
+
+def recompute_encounters(first_id, last_id):
+    """Score every vital of encounters first_id <= id < last_id and rebuild
+    their EncounterRisk rows, in bulk. Returns the number of vitals."""
+    import numpy as np
+
+    rows = list(
+        Vital.objects.filter(encounter_id__gte=first_id, encounter_id__lt=last_id)
+        .order_by('encounter_id', 'recorded_at', 'vital_id')
+        # As stored, and written back to EncounterRisk the same way
+        .values_list(*(Cast(f, CharField()) if f == 'recorded_at' else f for f in BULK_FIELDS))
+    )
+    with transaction.atomic():
+        EncounterRisk.objects.filter(encounter_id__gte=first_id, encounter_id__lt=last_id).delete()
+        if not rows:
+            return 0
+        ids, encounters, wards, recorded_at, bp, spo2, pulse, temperature = zip(*rows)
+        encounters = np.array(encounters)
+        systolic, diastolic = parse_blood_pressures(bp)
+        total, red = score_arrays(spo2, systolic, pulse, temperature)
+        _store_scores(Vital, ids, systolic, diastolic, total)
+
+        # Rows are in reading order within each encounter: the last one of
+        # each run is the latest reading.
+        starts = np.flatnonzero(np.r_[True, encounters[1:] != encounters[:-1]])
+        lasts = np.r_[starts[1:], len(rows)] - 1
+        peak = np.maximum.reduceat(total, starts)
+        at = lasts.tolist()
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {qn(EncounterRisk._meta.db_table)} (encounter_id, score, peak_score, red_flag, '
+                f'readings, last_vital_id, recorded_at, ward) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)',
+                zip(
+                    encounters[lasts].tolist(), total[lasts].tolist(), peak.tolist(), red[lasts].tolist(),
+                    (lasts - starts + 1).tolist(), [ids[i] for i in at], [recorded_at[i] for i in at],
+                    [wards[i] for i in at],
+                ),
+            )
+    return len(rows)
+
+
+def score_archived(first_id, last_id):
+    """Fill the score columns of the archived vitals of encounters
+    first_id <= id < last_id. Returns the number of vitals."""
+    rows = list(
+        ArchivedVital.objects.filter(encounter_id__gte=first_id, encounter_id__lt=last_id)
+        .values_list('vital_id', 'blood_pressure', 'oxygen_saturation', 'heart_rate', 'temperature')
+    )
+    if not rows:
+        return 0
+    ids, bp, spo2, pulse, temperature = zip(*rows)
+    systolic, diastolic = parse_blood_pressures(bp)
+    total, _ = score_arrays(spo2, systolic, pulse, temperature)
+    with transaction.atomic():
+        _store_scores(ArchivedVital, ids, systolic, diastolic, total)
+    return len(rows)
+
+
+def _nullable_ints(array):
+    return [None if v != v else int(v) for v in array.tolist()]
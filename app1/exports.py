@@ -0,0 +1,146 @@
+"""
+Chunked export of encounters joined with patient, doctor, diagnoses and
+feedback, for analytics.
+
+Rows are read by keyset pagination on encounter_id (`encounter_id > last
+seen ... LIMIT n`), so each chunk is one short query regardless of table size
+and no cursor or transaction stays open while the consumer is slow. Diagnoses
+and feedback for a chunk are fetched with one query each. Memory is bounded
+by the chunk size.
+
+An export covers encounter ids in (since_id, until_id]; until_id is fixed
+when the export starts, and the next incremental export passes it back as
+since_id. Only new encounters are picked up that way: changes to encounters
+that were already exported are not.
+
+Archived encounters (app1.archive) keep their ids and are exported with the
+hot ones: each read is a UNION ALL of the hot and archived tables.
+
+Used by the `export_encounters` command and the `export/encounters` view.
+"""
+import csv
+import json
+
+from django.db.models import Avg, Count, Max, Q
+
+from .models import ArchivedDiagnosis, ArchivedEncounter, ArchivedFeedback, Encounter, Diagnosis, Feedback
+
+
+# Encounter, patient and doctor columns, as values() lookups.
+BASE_FIELDS = [
+    'encounter_id', 'visit_date', 'visit_type', 'status', 'payment_status', 'problem',
+    'patient_id', 'patient__dob', 'patient__gender', 'patient__blood_group',
+    'doctor_id', 'doctor__first_name', 'doctor__last_name', 'doctor__specialization',
+]
+COLUMNS = [f.replace('__', '_') for f in BASE_FIELDS] + [
+    'diagnosis_codes', 'diagnoses', 'feedback_count', 'feedback_avg_rating', 'follow_up_required',
+]
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def latest_encounter_id():
+    return max(model.objects.aggregate(m=Max('encounter_id'))['m'] or 0 for model in (Encounter, ArchivedEncounter))
+
+
+def _feedback(model, id_range):
+    return model.objects.filter(**id_range).values('encounter_id').annotate(
+        count=Count('feedback_id'), avg=Avg('rating'),
+        follow_ups=Count('feedback_id', filter=Q(follow_up_required=True)),
+    ).values_list('encounter_id', 'count', 'avg', 'follow_ups')
+
+
+def iter_chunks(since_id=0, until_id=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of export rows (dicts keyed by COLUMNS) in encounter_id order."""
+    if until_id is None:
+        until_id = latest_encounter_id()
+    last = since_id
+    while last < until_id:
+        hot, cold = (
+            model.objects.filter(encounter_id__gt=last, encounter_id__lte=until_id).values_list(*BASE_FIELDS)
+            for model in (Encounter, ArchivedEncounter)
+        )
+        rows = list(hot.union(cold, all=True).order_by('encounter_id')[:chunk_size])
+        if not rows:
+            return
+        first, last = rows[0][0], rows[-1][0]
+        id_range = {'encounter_id__gte': first, 'encounter_id__lte': last}
+
+        diagnoses = {}
+        hot, cold = (
+            model.objects.filter(**id_range).values_list('diag_id', 'encounter_id', 'diagnosis_code', 'description')
+            for model in (Diagnosis, ArchivedDiagnosis)
+        )
+        for _, encounter_id, code, description in hot.union(cold, all=True).order_by('diag_id'):
+            diagnoses.setdefault(encounter_id, []).append((code, description))
+        # An encounter is on one side only, so its feedback is in one group
+        feedback = {
+            encounter_id: {'count': count, 'avg': avg, 'follow_ups': follow_ups}
+            for encounter_id, count, avg, follow_ups in
+            _feedback(Feedback, id_range).union(_feedback(ArchivedFeedback, id_range), all=True)
+        }
+
+        chunk = []
+        for values in rows:
+            row = dict(zip(COLUMNS, values))
+            found = diagnoses.get(row['encounter_id'], ())
+            fb = feedback.get(row['encounter_id'])
+            row['diagnosis_codes'] = ';'.join(code for code, _ in found)
+            row['diagnoses'] = ';'.join(description for _, description in found)
+            row['feedback_count'] = fb['count'] if fb else 0
+            row['feedback_avg_rating'] = round(fb['avg'], 2) if fb and fb['avg'] is not None else None
+            row['follow_up_required'] = bool(fb and fb['follow_ups'])
+            chunk.append(row)
+        yield chunk
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(chunks):
+    """Header plus one CSV line per row, as strings."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for chunk in chunks:
+        yield ''.join(writer.writerow([_text(row[c]) for c in COLUMNS]) for row in chunk)
+
+
+def ndjson_lines(chunks):
+    for chunk in chunks:
+        yield ''.join(json.dumps(row, default=_text) + '\n' for row in chunk)
+
+
+def write_parquet(chunks, path):
+    """Write chunks as row groups of a Parquet file. Requires pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Parquet export requires pyarrow (pip install pyarrow)')
+
+    schema = pa.schema([
+        ('encounter_id', pa.int64()), ('visit_date', pa.timestamp('us', tz='UTC')),
+        ('visit_type', pa.string()), ('status', pa.string()), ('payment_status', pa.string()),
+        ('problem', pa.string()), ('patient_id', pa.int64()), ('patient_dob', pa.date32()),
+        ('patient_gender', pa.string()), ('patient_blood_group', pa.string()), ('doctor_id', pa.int64()),
+        ('doctor_first_name', pa.string()), ('doctor_last_name', pa.string()),
+        ('doctor_specialization', pa.string()), ('diagnosis_codes', pa.string()), ('diagnoses', pa.string()),
+        ('feedback_count', pa.int64()), ('feedback_avg_rating', pa.float64()), ('follow_up_required', pa.bool_()),
+    ])
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            rows += len(chunk)
+    return rows
@@ -0,0 +1,184 @@
+"""
+Idempotency-Key support for the mutating perform_action actions.
+
+A client that may retry an action (after a timeout or a dropped connection)
+sends the same Idempotency-Key header with every attempt. The first attempt
+claims the key by inserting an IdempotencyRecord, runs the action, and stores
+the response in the same transaction as the action's writes: either both are
+committed or neither is. Later attempts get the stored response back, marked
+with an Idempotent-Replayed header, without running the action again.
+Attempts that arrive while the first is still running wait for it, for up to
+IDEMPOTENCY_WAIT seconds, and then get a 409.
+
+Keys belong to the caller: the logged-in user, else the session, else (for
+clients that keep neither) the client address. Two callers that pick the
+same key get separate records, stored under a hash of caller and key.
+
+A failed attempt (an exception or a 5xx) releases the key, so the next retry
+runs the action. Reusing a key for a different request body is a 422. Records
+are kept for IDEMPOTENCY_TTL seconds (24 hours by default).
+"""
+import hashlib
+import json
+import random
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyRecord
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 64
+# Actions that write or send something; the rest are safe to repeat
+ACTIONS = frozenset({
+    'REGISTER_PATIENT', 'CREATE_ENCOUNTER', 'BOOK_APPOINTMENT', 'CANCEL_APPOINTMENT', 'RESCHEDULE_APPOINTMENT',
+    'JOIN_WAITLIST', 'SEND_EMAIL', 'SCHEDULE_REMINDER', 'POST_VISIT_FEEDBACK', 'UPDATE_PAYMENT_STATUS',
+    'SCHEDULE_FOLLOW_UP', 'CHAT_TURN',
+})
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_WAIT = 10
+# A record still running after this long belongs to a worker that died
+DEFAULT_LOCK_TIMEOUT = 60
+POLL_INTERVAL = 0.05
+# Share of new records that also delete the expired ones
+PRUNE_PROBABILITY = 0.01
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def request_hash(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def caller(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return f'session:{session.session_key}'
+    return f"addr:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def record_key(caller, key):
+    """The IdempotencyRecord key for `caller`'s Idempotency-Key `key`."""
+    return hashlib.sha256(f'{caller}\n{key}'.encode()).hexdigest()
+
+
+def idempotent(view):
+    """Decorate perform_action: honour Idempotency-Key for the actions in ACTIONS."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or request.method != 'POST':
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}, status=400)
+        try:
+            action = json.loads(request.body).get('action')
+        except (ValueError, AttributeError):
+            # Not an action request; the view reports the error
+            action = None
+        if action not in ACTIONS:
+            return view(request, *args, **kwargs)
+        # The view tags it too, but a replay or a 409/422 never reaches the view
+        request.chatbot_action = action
+        return execute(
+            record_key(caller(request), key), request_hash(request.body), lambda: view(request, *args, **kwargs),
+        )
+    return wrapper
+
+
+def execute(key, fingerprint, run):
+    """Return the stored response for `key`, or call `run()` once and store
+    its response."""
+    deadline = time.monotonic() + _setting('IDEMPOTENCY_WAIT', DEFAULT_WAIT)
+    while True:
+        claimed, record = _claim(key, fingerprint)
+        if claimed:
+            return _run(key, run)
+        if record is None:
+            # Released or taken over in the meantime; try again
+            continue
+        if record.request_hash != fingerprint:
+            return JsonResponse({'error': f'{HEADER} was already used for a different request'}, status=422)
+        if record.status_code is not None:
+            return _replay(record)
+        if time.monotonic() >= deadline:
+            return JsonResponse({'error': f'A request with this {HEADER} is still in progress'}, status=409)
+        time.sleep(POLL_INTERVAL)
+
+
+def _claim(key, fingerprint):
+    """(True, None) if this request now owns `key`, else (False, record)."""
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            IdempotencyRecord.objects.create(key=key, request_hash=fingerprint, created_at=now)
+    except IntegrityError:
+        pass
+    else:
+        if random.random() < PRUNE_PROBABILITY:
+            prune()
+        return True, None
+    record = IdempotencyRecord.objects.filter(pk=key).first()
+    if record is None:
+        return False, None
+    expired = record.created_at < now - timedelta(seconds=_setting('IDEMPOTENCY_TTL', DEFAULT_TTL))
+    abandoned = record.status_code is None and record.created_at < now - timedelta(
+        seconds=_setting('IDEMPOTENCY_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT))
+    if expired or abandoned:
+        # Conditional on the timestamp read above, so only one waiter takes over
+        taken = IdempotencyRecord.objects.filter(pk=key, created_at=record.created_at).update(
+            request_hash=fingerprint, created_at=now, status_code=None, content_type='', body=b'',
+        )
+        return bool(taken), None
+    return False, record
+
+
+class _Failed(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def _run(key, run):
+    try:
+        with transaction.atomic():
+            response = run()
+            if response.status_code >= 500 or response.streaming:
+                # Roll back and let the next attempt run it again
+                raise _Failed(response)
+            IdempotencyRecord.objects.filter(pk=key).update(
+                status_code=response.status_code, content_type=response.get('Content-Type', ''),
+                body=response.content,
+            )
+    except _Failed as failed:
+        release(key)
+        return failed.response
+    except BaseException:
+        release(key)
+        raise
+    return response
+
+
+def _replay(record):
+    response = HttpResponse(bytes(record.body), status=record.status_code, content_type=record.content_type)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def release(key):
+    IdempotencyRecord.objects.filter(pk=key, status_code__isnull=True).delete()
+
+
+def prune():
+    cutoff = timezone.now() - timedelta(seconds=_setting('IDEMPOTENCY_TTL', DEFAULT_TTL))
+    return IdempotencyRecord.objects.filter(created_at__lt=cutoff).delete()[0]
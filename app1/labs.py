@@ -0,0 +1,194 @@
+"""
+Numeric lab values, trends and abnormal results.
+
+result_value and reference_range are free text ("5.6", "<0.5", "12.0-17.5",
+"<200"). parse() reads them once, when a LabResult is saved (pre_save signal),
+into value_numeric, range_low, range_high and abnormal. Writes that bypass
+save() (bulk_create, raw inserts) must call parse() themselves;
+generate_dataset computes the columns directly.
+
+trends() loads a patient's results, hot and archived, in one query. It sorts
+them into NumPy arrays and computes the flags, deltas and least-squares
+slopes for every test at once, with np.add.reduceat over the test
+boundaries. Python only touches each row to build the arrays.
+
+abnormal_results() lists a day's out-of-range results across patients,
+through a partial index on test_date.
+"""
+import re
+
+from django.db.models import CharField, Count, Q
+from django.db.models.functions import Cast
+
+from .models import ArchivedLabResult, LabResult
+
+
+PAGE_SIZE = 50
+MAX_POINTS = 500
+# Digit-grouping commas: "1,200" is 1200
+_GROUPING_RE = re.compile(r'(?<=\d),(?=\d{3}(?!\d))')
+_VALUE_RE = re.compile(r'^\s*(?:[<>]=?|[≤≥])?\s*(-?\d+(?:\.\d+)?|\.\d+)')
+_INTERVAL_RE = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*(?:-|–|—|to)\s*(-?\d+(?:\.\d+)?)')
+_UPPER_RE = re.compile(r'^\s*(?:<=?|≤|up to)\s*(\d+(?:\.\d+)?)', re.IGNORECASE)
+_LOWER_RE = re.compile(r'^\s*(?:>=?|≥)\s*(\d+(?:\.\d+)?)')
+
+
+def parse_value(text):
+    """The number a result starts with ("5.6 %", "<0.5", "1,200"), or None."""
+    match = _VALUE_RE.match(_GROUPING_RE.sub('', text or ''))
+    return float(match.group(1)) if match else None
+
+
+def parse_range(text):
+    """(low, high) of a reference range; either may be None ("<200")."""
+    text = _GROUPING_RE.sub('', text or '')
+    match = _INTERVAL_RE.match(text)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    match = _UPPER_RE.match(text)
+    if match:
+        return None, float(match.group(1))
+    match = _LOWER_RE.match(text)
+    if match:
+        return float(match.group(1)), None
+    return None, None
+
+
+def is_abnormal(value, low, high):
+    """Whether value is outside [low, high]; None when that is unknown."""
+    if value is None or (low is None and high is None):
+        return None
+    return (low is not None and value < low) or (high is not None and value > high)
+
+
+def parse(lab):
+    """Fill the parsed columns of a LabResult (or ArchivedLabResult). Returns it."""
+    lab.value_numeric = parse_value(lab.result_value)
+    lab.range_low, lab.range_high = parse_range(lab.reference_range)
+    lab.abnormal = is_abnormal(lab.value_numeric, lab.range_low, lab.range_high)
+    return lab
+
+
+# -- trends --------------------------------------------------------------------------
+
+SERIES_FIELDS = ('test_name', 'test_date', 'lab_id', 'value_numeric', 'range_low', 'range_high', 'result_unit')
+
+
+def _series(patient_id, test_names=None, since=None):
+    """The patient's rows of SERIES_FIELDS, unsorted, with test_date as
+    'YYYY-MM-DD' text: trends() sorts and parses the dates in NumPy, which is
+    much cheaper than converting each row to a date object."""
+    condition = Q(patient_id=patient_id)
+    if test_names:
+        condition &= Q(test_name__in=test_names)
+    if since is not None:
+        condition &= Q(test_date__gte=since)
+    fields = [Cast(f, CharField()) if f == 'test_date' else f for f in SERIES_FIELDS]
+    hot = LabResult.objects.filter(condition).values_list(*fields)
+    cold = ArchivedLabResult.objects.filter(condition).values_list(*fields)
+    return list(hot.union(cold, all=True))
+
+
+def _nullable(array):
+    """A float array as a list with NaN as None, for JSON."""
+    return [None if v != v else v for v in array.tolist()]
+
+
+def trends(patient_id, test_names=None, since=None, points=50):
+    """Per test (alphabetical): reading counts, the number out of range, the
+    least-squares slope in units per day, the latest reading, and the last
+    `points` readings with their flag ('L', 'H', 'N' or None when unknown)
+    and change from the previous reading."""
+    import numpy as np
+
+    rows = _series(patient_id, test_names, since)
+    if not rows:
+        return []
+    names, dates, ids, values, lows, highs, units = zip(*rows)
+    n = len(rows)
+    names = np.array(names)
+    day = np.array(dates, dtype='datetime64[D]')
+    order = np.lexsort((np.array(ids), day, names))
+    names, day = names[order], day[order]
+    y = np.array(values, dtype=float)[order]
+    low = np.array(lows, dtype=float)[order]
+    high = np.array(highs, dtype=float)[order]
+    units = np.array(units, dtype=object)[order]
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+    ends = np.r_[starts[1:], n]
+    sizes = ends - starts
+
+    # -1 low, 0 normal, 1 high, 2 unknown (no number or no bound), which
+    # index the letters. Comparisons with NaN are false.
+    code = np.zeros(n, dtype=np.int8)
+    code[y < low] = -1
+    code[y > high] = 1
+    code[np.isnan(y) | (np.isnan(low) & np.isnan(high))] = 2
+    flags = np.array(['N', 'H', None, 'L'], dtype=object)[code]
+    delta = np.empty(n)
+    delta[0] = np.nan
+    delta[1:] = y[1:] - y[:-1]
+    delta[starts] = np.nan
+    delta = np.round(delta, 6)
+
+    # Slope of value against days since each test's first reading, over the
+    # readings that have a number
+    valid = ~np.isnan(y)
+    w = valid.astype(float)
+    x = (day - np.repeat(day[starts], sizes)).astype(np.int64).astype(float)
+    yv = np.where(valid, y, 0.0)
+    count = np.add.reduceat(w, starts)
+    sx = np.add.reduceat(w * x, starts)
+    sy = np.add.reduceat(yv, starts)
+    sxx = np.add.reduceat(w * x * x, starts)
+    sxy = np.add.reduceat(x * yv, starts)
+    denominator = count * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(denominator > 0, (count * sxy - sx * sy) / denominator, np.nan)
+    out_of_range = np.add.reduceat((np.abs(code) == 1).astype(np.int64), starts)
+
+    points = min(max(points, 1), MAX_POINTS)
+    result = []
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        tail = slice(max(start, end - points), end)
+        series = [
+            {'date': d, 'value': v, 'flag': f, 'delta': dv}
+            for d, v, f, dv in zip(day[tail].astype(str).tolist(), _nullable(y[tail]), flags[tail].tolist(),
+                                   _nullable(delta[tail]))
+        ]
+        result.append({
+            'test_name': str(names[start]),
+            'unit': units[end - 1],
+            'count': int(sizes[i]),
+            'numeric_count': int(count[i]),
+            'abnormal_count': int(out_of_range[i]),
+            'slope_per_day': None if np.isnan(slope[i]) else round(float(slope[i]), 6),
+            'latest': series[-1],
+            'points': series,
+        })
+    return result
+
+
+# -- cohort --------------------------------------------------------------------------
+
+ABNORMAL_FIELDS = (
+    'lab_id', 'patient_id', 'patient__first_name', 'patient__last_name', 'encounter_id', 'test_name',
+    'result_value', 'result_unit', 'value_numeric', 'range_low', 'range_high',
+)
+
+
+def abnormal_results(day, test_name=None, after=None, limit=PAGE_SIZE):
+    """A page of the out-of-range results dated `day`, by lab_id, and the
+    count per test for the whole day. `after` is the last lab_id of the
+    previous page. Returns (rows, counts, cursor for the next page or None).
+
+    Only the hot table is read: results move to the archive with encounters
+    closed long ago."""
+    results = LabResult.objects.filter(test_date=day, abnormal=True)
+    if test_name:
+        results = results.filter(test_name=test_name)
+    page = results.filter(lab_id__gt=after) if after is not None else results
+    rows = list(page.order_by('lab_id').values(*ABNORMAL_FIELDS)[:limit])
+    counts = dict(results.order_by().values_list('test_name').annotate(n=Count('*')))
+    cursor = rows[-1]['lab_id'] if len(rows) == limit else None
+    return rows, counts, cursor
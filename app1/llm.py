@@ -1,12 +1,33 @@
 import json
-import requests
+import os
+
 from django.conf import settings
 
+from . import metrics
+
 
 class GroqError(Exception):
     pass
 
 
+_session = None
+_session_pid = None
+
+
+def session():
+    """This process's requests.Session, so LLM calls reuse pooled connections.
+    A forked worker builds its own instead of sharing the parent's sockets."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        # Imported on first use: cron commands that never call the LLM skip
+        # loading requests (see README, Startup Time)
+        import requests
+
+        _session = requests.Session()
+        _session_pid = os.getpid()
+    return _session
+
+
 def call_groq(prompt: str, model: str = 'groq-mini', max_tokens: int = 256) -> dict:
     """
     Minimal wrapper to call a Groq-style completion API.
@@ -36,11 +57,15 @@ def call_groq(prompt: str, model: str = 'groq-mini', max_tokens: int = 256) -> d
         'max_tokens': max_tokens,
     }
 
-    try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=15)
-        resp.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        raise GroqError(f'HTTP error calling Groq API: {e}')
+    import requests
+
+    with metrics.LLM_LATENCY.time(outcome='ok') as labels:
+        try:
+            resp = session().post(url, headers=headers, json=payload, timeout=15)
+            resp.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            labels['outcome'] = 'error'
+            raise GroqError(f'HTTP error calling Groq API: {e}')
 
     try:
         return resp.json()
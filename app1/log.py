@@ -0,0 +1,123 @@
+"""
+Structured logging that keeps log I/O off the request thread.
+
+LOGGING (settings) routes the `app1` loggers to BackgroundHandler. The calling
+thread only resolves the message and puts the record on a bounded queue; a
+listener thread formats it as one JSON line and writes it. When the queue is
+full the record is dropped and counted in chatbot_log_dropped_total, rather
+than making the request wait.
+
+The message is the event name and `extra` fields become keys of the line:
+
+    logger.info('action', extra={'action': 'BOOK_APPOINTMENT', 'encounter_id': 12, 'latency_ms': 31.2})
+
+    {"ts": "...", "level": "INFO", "logger": "app1.requests", "event": "action",
+     "action": "BOOK_APPOINTMENT", "encounter_id": 12, "latency_ms": 31.2}
+
+SampleFilter keeps a fraction of high-volume events (LOG_SAMPLE_RATES, by event
+name). Warnings and errors are always kept.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from . import metrics
+
+
+# LogRecord attributes; everything else on a record came from `extra`
+_RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        line = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                line[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line['exc'] = record.exc_text
+        return json.dumps(line, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Keep each INFO-or-lower record whose event is in `rates` with that
+    probability."""
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.msg)
+        return rate is None or random.random() < rate
+
+
+class BackgroundHandler(QueueHandler):
+    """Queue records for a listener thread that writes JSON lines to `stream`
+    (stderr by default). Holds at most `maxsize` records.
+
+    Threads do not survive fork, so each process (every gunicorn worker)
+    starts its own queue and listener on its first record.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(None)
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.target.setFormatter(JsonFormatter())
+        self.maxsize = maxsize
+        self.listener = None
+        self.pid = None
+        atexit.register(self.stop)
+
+    def start(self):
+        self.queue = queue.Queue(self.maxsize)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        self.pid = os.getpid()
+
+    def stop(self):
+        """Write out everything queued and stop the listener."""
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+        self.listener = None
+        self.pid = None
+
+    def prepare(self, record):
+        # Only what has to happen on the calling thread: the arguments and
+        # the traceback may change or go away once the call returns.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self.target.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # Called under the handler lock (Handler.handle)
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_DROPPED.inc()
+
+    def close(self):
+        self.stop()
+        super().close()
@@ -0,0 +1,19 @@
+import time
+
+from django.core.mail.backends.smtp import EmailBackend as SMTPEmailBackend
+
+from . import metrics
+
+
+class EmailBackend(SMTPEmailBackend):
+    """SMTP backend that records send latency in `chatbot_smtp_latency_seconds`."""
+
+    def send_messages(self, email_messages):
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            sent = super().send_messages(email_messages)
+            outcome = 'ok'
+            return sent
+        finally:
+            metrics.SMTP_LATENCY.observe(time.perf_counter() - start, outcome=outcome)
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app1 import archive
+
+
+class Command(BaseCommand):
+    help = 'Move encounters closed more than N months ago, with their clinical rows, to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=None,
+                            help='Archive visits older than this many months; default: ARCHIVE_AFTER_MONTHS')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Encounters moved per transaction')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between chunks, to leave room for other writers')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be moved')
+
+    def handle(self, *args, **options):
+        months = archive.archive_months() if options['months'] is None else options['months']
+        if months < 1:
+            raise CommandError('--months must be at least 1')
+        unmapped = archive.unmapped_children()
+        if unmapped:
+            names = ', '.join(model.__name__ for model in unmapped)
+            raise CommandError(f'No archive table for {names}; add it to app1.archive.TABLES')
+
+        cutoff = archive.months_ago(months)
+        if options['dry_run']:
+            count = archive.archivable(cutoff).count()
+            self.stdout.write(f'{count} encounters closed before {cutoff:%Y-%m-%d} would be archived')
+            return
+
+        started = time.perf_counter()
+        moved = last_id = 0
+        while True:
+            # Short transactions: each holds the write lock for one chunk only
+            with transaction.atomic():
+                ids = list(
+                    archive.archivable(cutoff).filter(encounter_id__gt=last_id)
+                    .order_by('encounter_id').values_list('encounter_id', flat=True)[:options['chunk_size']]
+                )
+                if not ids:
+                    break
+                archive.move(ids)
+            moved += len(ids)
+            last_id = ids[-1]
+            self.stdout.write(f'{moved} encounters archived, {moved / (time.perf_counter() - started):,.0f}/s')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} encounters closed before {cutoff:%Y-%m-%d} in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from app1 import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Replay a weighted mix of chatbot actions against /api/perform_action/ and report latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', default=None,
+                            help='Action weights, e.g. "ASSIGN_DOCTOR=40,BOOK_APPOINTMENT=20,GET_PATIENT_HISTORY=20"')
+        parser.add_argument('--requests', type=int, default=2000, help='Total number of requests to send')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests kept in flight')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the dataset and the request schedule')
+        parser.add_argument('--doctors', type=int, default=20)
+        parser.add_argument('--patients', type=int, default=2000)
+        parser.add_argument('--url', default=None,
+                            help='Benchmark a running server instead of an in-process throwaway database')
+        parser.add_argument('--seed-data', action='store_true',
+                            help='With --url, seed the configured database before running')
+        parser.add_argument('--output', default=None, help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', default=None,
+                            help='Fail if a tracked metric regressed against this results file')
+        parser.add_argument('--threshold', type=float, default=0.10,
+                            help='Allowed regression against the baseline, as a fraction')
+
+    def handle(self, *args, **options):
+        try:
+            mix = benchmark.parse_mix(options['mix']) if options['mix'] else benchmark.DEFAULT_MIX
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['url']:
+            results = self.run_live(options, mix)
+        else:
+            results = self.run_in_process(options, mix)
+        results['mix'] = mix
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = benchmark.compare(results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError(
+                    f"{len(regressions)} metric(s) regressed by more than {options['threshold']:.0%}:\n  "
+                    + '\n  '.join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
+
+    def run_live(self, options, mix):
+        if options['seed_data']:
+            dataset = benchmark.seed_dataset(options['doctors'], options['patients'], seed=options['seed'])
+        else:
+            dataset = benchmark.load_dataset()
+        if not dataset['doctors'] or not dataset['patients']:
+            raise CommandError('The database has no doctors or patients; pass --seed-data')
+        transport = benchmark.HttpTransport(options['url'])
+        return benchmark.run(transport, dataset, mix, options['requests'], options['concurrency'], options['seed'])
+
+    def run_in_process(self, options, mix):
+        # A file-backed test database lets every worker thread open its own
+        # connection; the real database is never touched.
+        workdir = tempfile.mkdtemp(prefix='chatbot-bench-')
+        if connection.vendor == 'sqlite':
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(
+                GROQ_API_KEY='',
+                EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                ALLOWED_HOSTS=['testserver'],
+                DEBUG=False,
+            ):
+                dataset = benchmark.seed_dataset(options['doctors'], options['patients'], seed=options['seed'])
+                transport = benchmark.InProcessTransport()
+                return benchmark.run(
+                    transport, dataset, mix, options['requests'], options['concurrency'], options['seed']
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def report(self, results):
+        self.stdout.write(
+            f"{results['requests']} requests in {results['duration_s']}s at concurrency "
+            f"{results['concurrency']}: {results['throughput_rps']} req/s, "
+            f"error rate {results['error_rate']:.2%}"
+        )
+        self.stdout.write(f"{'action':<24}{'count':>7}{'errors':>7}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for action, stats in sorted(results['actions'].items()):
+            self.stdout.write(
+                f"{action:<24}{stats['count']:>7}{stats['errors']:>7}{stats['throughput_rps']:>9}"
+                f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}"
+            )
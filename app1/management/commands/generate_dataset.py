@@ -0,0 +1,471 @@
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from app1 import assignment, ews, search
+from app1.reminders import BUCKET_SECONDS
+from app1.models import (
+    Patient, Doctor, Encounter, Reminder, ReminderDue, Medication, LabResult, Vital, EncounterRisk
+)
+
+
+SPECIALIZATIONS = [
+    ('General Medicine', 30), ('Cardiology', 12), ('Orthopedics', 12), ('Pediatrics', 12),
+    ('Gynecology', 10), ('Dermatology', 8), ('ENT', 8),
+]
+VISIT_TYPES = [('OPD', 60), ('FU', 20), ('TELE', 10), ('ER', 7), ('IPD', 3)]
+PAST_STATUSES = [('COMPLETED', 85), ('NO_SHOW', 8), ('CANCELLED', 7)]
+FIRST_NAMES = [
+    'Asha', 'Ravi', 'Meera', 'John', 'Priya', 'Arjun', 'Sara', 'Vikram', 'Nisha', 'Kiran',
+    'Anil', 'Divya', 'Rahul', 'Sneha', 'Mohan', 'Lakshmi', 'David', 'Fatima', 'Suresh', 'Anita',
+]
+LAST_NAMES = [
+    'Rao', 'Sharma', 'Iyer', 'Reddy', 'Patel', 'Nair', 'Das', 'Singh', 'Khan', 'Menon',
+    'Gupta', 'Pillai', 'Joshi', 'Thomas', 'Verma', 'Kumar', 'Bose', 'Shah', 'Naidu', 'Fernandes',
+]
+PROBLEMS = [
+    'chest pain', 'high bp', 'shortness of breath', 'knee joint pain', 'back pain', 'fever',
+    'stomach ache', 'cold and flu', 'skin rash', 'itching', 'ear pain', 'sore throat',
+    'irregular periods', 'child cough', 'headache', 'diabetes review', 'fatigue',
+]
+BLOOD_GROUPS = [('O+', 37), ('B+', 22), ('A+', 21), ('AB+', 7), ('O-', 6), ('A-', 3), ('B-', 3), ('AB-', 1)]
+# (test, unit, reference low, reference high, mean, standard deviation)
+LAB_TESTS = [
+    ('Hemoglobin', 'g/dL', 12.0, 17.5, 13.8, 1.9),
+    ('Fasting Glucose', 'mg/dL', 70, 100, 98, 22),
+    ('HbA1c', '%', 4.0, 5.6, 5.7, 0.9),
+    ('Total Cholesterol', 'mg/dL', 125, 200, 188, 38),
+    ('Creatinine', 'mg/dL', 0.6, 1.3, 0.95, 0.3),
+    ('TSH', 'mIU/L', 0.4, 4.0, 2.3, 1.4),
+    ('WBC', '10^3/uL', 4.0, 11.0, 7.4, 2.2),
+    ('Platelets', '10^3/uL', 150, 450, 260, 70),
+]
+MEDICATIONS = [
+    ('Paracetamol', '500mg', 'Three times a day'), ('Amlodipine', '5mg', 'Once a day'),
+    ('Metformin', '500mg', 'Twice a day'), ('Atorvastatin', '10mg', 'Once a day'),
+    ('Amoxicillin', '500mg', 'Three times a day'), ('Cetirizine', '10mg', 'Once a day'),
+    ('Pantoprazole', '40mg', 'Once a day'), ('Ibuprofen', '400mg', 'Twice a day'),
+]
+
+PAST_DAYS = 3 * 365
+FUTURE_DAYS = 30
+DOB_ORIGIN = date(1940, 1, 1)
+
+# Column order of the value tuples built in Command.generate_chunk.
+PATIENT_FIELDS = [
+    'patient_id', 'first_name', 'last_name', 'dob', 'gender', 'email', 'phone', 'address', 'blood_group',
+]
+ENCOUNTER_FIELDS = [
+    'encounter_id', 'patient', 'doctor', 'visit_type', 'visit_date', 'notes', 'problem', 'status',
+    'payment_status',
+]
+REMINDER_FIELDS = [
+    'reminder_id', 'encounter', 'remind_at', 'method', 'health_check_required', 'health_check_done',
+]
+REMINDER_DUE_FIELDS = ['reminder', 'bucket', 'remind_at']
+MEDICATION_FIELDS = [
+    'medication_id', 'patient', 'encounter', 'name', 'dosage', 'frequency', 'start_date', 'end_date',
+]
+LAB_RESULT_FIELDS = [
+    'lab_id', 'patient', 'encounter', 'test_name', 'result_value', 'result_unit', 'reference_range',
+    'test_date', 'value_numeric', 'range_low', 'range_high', 'abnormal',
+]
+VITAL_FIELDS = [
+    'vital_id', 'encounter', 'temperature', 'heart_rate', 'blood_pressure', 'oxygen_saturation',
+    'recorded_at', 'systolic', 'diastolic', 'news_score',
+]
+ENCOUNTER_RISK_FIELDS = [
+    'encounter', 'score', 'peak_score', 'red_flag', 'readings', 'last_vital_id', 'recorded_at', 'ward',
+]
+
+
+class TimeGrid:
+    """Storage-format timestamps on the generator's grid (whole hours plus the
+    20-minute vitals offsets) and dates, keyed by integer offsets from today.
+
+    Values are adapted once on first use; millions of rows then only index
+    into lists instead of doing datetime arithmetic and adaptation per row.
+    """
+
+    def __init__(self, now, past_days, future_days):
+        self.midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.past_days = past_days
+        days = past_days + future_days + 2
+        self.timestamps = [None] * (days * 24 * 3)
+        self.dates = [None] * (days + 64)
+        self.adapt_dt = connection.ops.adapt_datetimefield_value
+        self.adapt_date = connection.ops.adapt_datefield_value
+
+    def hour_index(self, day_offset, hour):
+        return (day_offset + self.past_days + 1) * 24 + hour
+
+    def epoch_seconds(self, hour_indexes):
+        """Unix time of each hour index, as a NumPy array."""
+        return int(self.midnight.timestamp()) + (hour_indexes - (self.past_days + 1) * 24) * 3600
+
+    def timestamp(self, hour_index, third=0):
+        """`hour_index` plus `third` * 20 minutes."""
+        i = hour_index * 3 + third
+        value = self.timestamps[i]
+        if value is None:
+            hours = hour_index - (self.past_days + 1) * 24
+            value = self.timestamps[i] = self.adapt_dt(
+                self.midnight + timedelta(hours=hours, minutes=20 * third)
+            )
+        return value
+
+    def date(self, day_offset):
+        i = day_offset + self.past_days + 1
+        value = self.dates[i]
+        if value is None:
+            value = self.dates[i] = self.adapt_date((self.midnight + timedelta(days=day_offset)).date())
+        return value
+
+    def timestamps_at(self, hour_indexes, thirds=None):
+        if thirds is None:
+            return [self.timestamp(i) for i in hour_indexes.tolist()]
+        return [self.timestamp(i, t) for i, t in zip(hour_indexes.tolist(), thirds.tolist())]
+
+    def dates_at(self, day_offsets):
+        return [self.date(d) for d in day_offsets.tolist()]
+
+
+@contextmanager
+def relaxed_sqlite_pragmas():
+    """Trade durability for insert speed for the duration of the load. A crash
+    mid-load can corrupt the database, which is acceptable for synthetic data.
+    Foreign key enforcement is switched off too: generated ids are consistent
+    by construction and checking them costs an index probe per row."""
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA synchronous')
+        synchronous = cursor.fetchone()[0]
+        cursor.execute('PRAGMA journal_mode')
+        journal_mode = cursor.fetchone()[0]
+        cursor.execute('PRAGMA synchronous = OFF')
+        cursor.execute('PRAGMA journal_mode = MEMORY')
+        cursor.execute('PRAGMA cache_size = -262144')
+        cursor.execute('PRAGMA temp_store = MEMORY')
+    connection.disable_constraint_checking()
+    try:
+        yield
+    finally:
+        connection.enable_constraint_checking()
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+            cursor.execute(f'PRAGMA synchronous = {int(synchronous)}')
+
+
+@contextmanager
+def deferred_sqlite_indexes(models):
+    """Drop the secondary indexes and triggers of `models` for the duration of
+    the load and recreate them afterwards. Building an index once over sorted
+    data is much cheaper than maintaining it row by row under random foreign
+    keys. The patient search index is fed by triggers, so it is rebuilt too."""
+    if connection.vendor != 'sqlite' or not models:
+        yield
+        return
+    tables = [model._meta.db_table for model in models]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL "
+            f"AND tbl_name IN ({', '.join(['%s'] * len(tables))})",
+            tables,
+        )
+        objects = cursor.fetchall()
+        for kind, name, _ in objects:
+            cursor.execute(f'DROP {kind.upper()} {connection.ops.quote_name(name)}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for _, _, sql in objects:
+                cursor.execute(sql)
+        if Patient in models:
+            search.rebuild_index()
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic, deterministic dataset of patients, encounters and clinical rows for scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--encounters', type=int, default=10000,
+                            help='Number of encounters to generate (1k to 10M); other tables scale with it')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--chunk-size', type=int, default=50000,
+                            help='Encounters generated and committed per transaction')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per executemany call')
+        parser.add_argument('--patients-per-encounter', type=float, default=0.25)
+        parser.add_argument('--keep-indexes', action='store_true',
+                            help='Maintain secondary indexes during the load instead of rebuilding them at the end')
+
+    def handle(self, *args, **options):
+        import numpy as np
+
+        total = options['encounters']
+        if not 1 <= total <= 10_000_000:
+            raise CommandError('--encounters must be between 1 and 10,000,000')
+        self.np = np
+        self.rng = np.random.default_rng(options['seed'])
+        self.batch_size = options['batch_size']
+        self.counts = {}
+
+        started = time.perf_counter()
+        with relaxed_sqlite_pragmas():
+            self.doctors = np.array(self.create_doctors(max(20, min(total // 2000, 1000))))
+            self.next_ids = {
+                model: (model.objects.aggregate(m=Max(model._meta.pk.name))['m'] or 0) + 1
+                for model in (Patient, Encounter, Reminder, Medication, LabResult, Vital)
+            }
+            self.first_patient_id = self.next_ids[Patient]
+            self.now = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+            self.grid = TimeGrid(self.now, PAST_DAYS, FUTURE_DAYS)
+
+            tables = [] if options['keep_indexes'] else [*self.next_ids, ReminderDue, EncounterRisk]
+            with deferred_sqlite_indexes(tables):
+                done = 0
+                while done < total:
+                    size = min(options['chunk_size'], total - done)
+                    inserts = self.generate_chunk(size, options['patients_per_encounter'])
+                    with transaction.atomic():
+                        for model, fields, rows in inserts:
+                            self.insert(model, fields, rows)
+                    done += size
+                    elapsed = time.perf_counter() - started
+                    rows = sum(self.counts.values())
+                    self.stdout.write(
+                        f'{done}/{total} encounters, {rows} rows, {rows / elapsed:,.0f} rows/s'
+                    )
+                if tables:
+                    self.stdout.write('Rebuilding indexes...')
+            # The raw inserts skip the signals that keep the doctors' order
+            assignment.rebuild()
+
+        elapsed = time.perf_counter() - started
+        rows = sum(self.counts.values())
+        for name, count in self.counts.items():
+            self.stdout.write(f'  {name}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {rows} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)'
+        ))
+
+    def insert(self, model, fields, rows):
+        """Multi-row INSERT of pre-adapted value tuples.
+
+        Rows skip model instantiation and per-field value preparation, which is
+        where bulk_create spends most of its time; values must already be in
+        the backend's storage format (connection.ops.adapt_*field_value).
+        """
+        if not rows:
+            return
+        qn = connection.ops.quote_name
+        columns = ', '.join(qn(model._meta.get_field(f).column) for f in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        sql = f'INSERT INTO {qn(model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+        with connection.cursor() as cursor:
+            for i in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[i:i + self.batch_size])
+        name = model._meta.verbose_name_plural
+        self.counts[name] = self.counts.get(name, 0) + len(rows)
+
+    def take_ids(self, model, n):
+        start = self.next_ids[model]
+        self.next_ids[model] = start + n
+        return self.np.arange(start, start + n)
+
+    def choice(self, table, n):
+        """`n` draws from a weighted [(value, weight), ...] table."""
+        values = [value for value, _ in table]
+        weights = self.np.array([weight for _, weight in table], dtype=float)
+        picks = self.rng.choice(len(values), size=n, p=weights / weights.sum())
+        return [values[i] for i in picks.tolist()]
+
+    def create_doctors(self, n):
+        existing = list(Doctor.objects.values_list('doctor_id', flat=True))
+        if len(existing) < n:
+            missing = n - len(existing)
+            first = self.rng.integers(0, len(FIRST_NAMES), missing).tolist()
+            last = self.rng.integers(0, len(LAST_NAMES), missing).tolist()
+            Doctor.objects.bulk_create([
+                Doctor(first_name=FIRST_NAMES[f], last_name=LAST_NAMES[l], specialization=spec)
+                for f, l, spec in zip(first, last, self.choice(SPECIALIZATIONS, missing))
+            ])
+            self.counts['doctors'] = missing
+            existing = list(Doctor.objects.values_list('doctor_id', flat=True))
+        return existing
+
+    def generate_chunk(self, size, patients_per_encounter):
+        """Generate one chunk column by column with NumPy and return the rows
+        to insert as [(model, fields, value tuples), ...]."""
+        np, rng, grid = self.np, self.rng, self.grid
+
+        # Patients
+        patient_ids = self.take_ids(Patient, max(1, int(size * patients_per_encounter)))
+        m = len(patient_ids)
+        pids = patient_ids.tolist()
+        gender = rng.random(m)
+        patients = list(zip(
+            pids,
+            [FIRST_NAMES[i] for i in rng.integers(0, len(FIRST_NAMES), m).tolist()],
+            [LAST_NAMES[i] for i in rng.integers(0, len(LAST_NAMES), m).tolist()],
+            [grid.adapt_date(DOB_ORIGIN + timedelta(days=d)) for d in rng.integers(0, 30000, m).tolist()],
+            np.where(gender < 0.51, 'F', np.where(gender < 0.99, 'M', 'O')).tolist(),
+            [f'patient{pid}@example.com' if has else None
+             for pid, has in zip(pids, (rng.random(m) < 0.6).tolist())],
+            [f'9{pid:09d}' for pid in pids],
+            [f'{n} Main Road' for n in rng.integers(1, 1000, m).tolist()],
+            self.choice(BLOOD_GROUPS, m),
+        ))
+
+        # Encounters: most visits belong to patients created in this chunk,
+        # the rest to anyone generated so far. 95% are in the past three
+        # years, 5% booked in the next 30 days, all within clinic hours.
+        encounter_ids = self.take_ids(Encounter, size)
+        returning = rng.random(size) >= 0.7
+        patient = np.where(
+            returning,
+            self.first_patient_id + rng.integers(0, patient_ids[-1] - self.first_patient_id + 1, size),
+            patient_ids[0] + rng.integers(0, m, size),
+        )
+        past = rng.random(size) < 0.95
+        day = np.where(past, -1 - rng.integers(0, PAST_DAYS, size), 1 + rng.integers(0, FUTURE_DAYS, size))
+        hour_index = grid.hour_index(day, 9 + rng.integers(0, 9, size))
+        status = np.where(past, np.array(self.choice(PAST_STATUSES, size), dtype=object), 'BOOKED')
+        completed = status == 'COMPLETED'
+        payment = np.where(completed & (rng.random(size) < 0.9), 'PAID', 'PENDING')
+        problems = [PROBLEMS[i] for i in rng.integers(0, len(PROBLEMS), size).tolist()]
+        doctors = self.doctors[rng.integers(0, len(self.doctors), size)]
+        visit_types = self.choice(VISIT_TYPES, size)
+        encounters = list(zip(
+            encounter_ids.tolist(),
+            patient.tolist(),
+            doctors.tolist(),
+            visit_types,
+            grid.timestamps_at(hour_index),
+            problems,
+            problems,
+            status.tolist(),
+            payment.tolist(),
+        ))
+
+        # One reminder 24 hours before each visit; past ones are done and the
+        # rest go on the due-queue (app1.reminders).
+        remind_index = hour_index - 24
+        reminder_ids = self.take_ids(Reminder, size)
+        remind_at = grid.timestamps_at(remind_index)
+        reminder_done = remind_index < grid.hour_index(0, self.now.hour)
+        reminders = list(zip(
+            reminder_ids.tolist(),
+            encounter_ids.tolist(),
+            remind_at,
+            np.where(rng.random(size) < 0.7, 'CALL', 'EMAIL').tolist(),
+            [True] * size,
+            reminder_done.tolist(),
+        ))
+        pending = np.flatnonzero(~reminder_done)
+        reminders_due = list(zip(
+            reminder_ids[pending].tolist(),
+            (grid.epoch_seconds(remind_index[pending]) // BUCKET_SECONDS).tolist(),
+            [remind_at[i] for i in pending.tolist()],
+        ))
+
+        # Clinical rows only for completed visits: 0-2 medications, 0-3 lab
+        # results and 1-3 vitals readings 20 minutes apart.
+        done = np.flatnonzero(completed)
+
+        rows = np.repeat(done, rng.integers(0, 3, len(done)))
+        n = len(rows)
+        picks = rng.integers(0, len(MEDICATIONS), n).tolist()
+        medications = list(zip(
+            self.take_ids(Medication, n).tolist(),
+            patient[rows].tolist(),
+            encounter_ids[rows].tolist(),
+            [MEDICATIONS[i][0] for i in picks],
+            [MEDICATIONS[i][1] for i in picks],
+            [MEDICATIONS[i][2] for i in picks],
+            grid.dates_at(day[rows]),
+            grid.dates_at(day[rows] + 5 + rng.integers(0, 25, n)),
+        ))
+
+        rows = np.repeat(done, rng.integers(0, 4, len(done)))
+        n = len(rows)
+        tests = rng.integers(0, len(LAB_TESTS), n)
+        mean = np.array([t[4] for t in LAB_TESTS])[tests]
+        sd = np.array([t[5] for t in LAB_TESTS])[tests]
+        # Rounded first, so the numeric column equals the text (app1.labs)
+        values = np.round(np.maximum(mean + sd * rng.standard_normal(n), 0), 1)
+        low = np.array([t[2] for t in LAB_TESTS], dtype=float)[tests]
+        high = np.array([t[3] for t in LAB_TESTS], dtype=float)[tests]
+        ranges = [f'{t[2]}-{t[3]}' for t in LAB_TESTS]
+        tests = tests.tolist()
+        labs = list(zip(
+            self.take_ids(LabResult, n).tolist(),
+            patient[rows].tolist(),
+            encounter_ids[rows].tolist(),
+            [LAB_TESTS[i][0] for i in tests],
+            [f'{v:.1f}' for v in values.tolist()],
+            [LAB_TESTS[i][1] for i in tests],
+            [ranges[i] for i in tests],
+            grid.dates_at(day[rows]),
+            values.tolist(),
+            low.tolist(),
+            high.tolist(),
+            ((values < low) | (values > high)).tolist(),
+        ))
+
+        readings = 1 + rng.integers(0, 3, len(done))
+        rows = np.repeat(done, readings)
+        n = len(rows)
+        # Position of each reading within its visit: 0, 1, 2.
+        third = np.arange(n) - np.repeat(np.cumsum(readings) - readings, readings)
+        systolic = (122 + 16 * rng.standard_normal(n)).astype(int)
+        diastolic = (80 + 10 * rng.standard_normal(n)).astype(int)
+        temperature = np.round(36.9 + 0.6 * rng.standard_normal(n), 1)
+        heart_rate = (80 + 14 * rng.standard_normal(n)).astype(int)
+        spo2 = np.minimum(100, (97 + 2 * rng.standard_normal(n)).astype(int))
+        score, red = ews.score_arrays(spo2, systolic, heart_rate, temperature)
+        vital_ids = self.take_ids(Vital, n)
+        recorded_at = grid.timestamps_at(hour_index[rows], third)
+        vitals = list(zip(
+            vital_ids.tolist(),
+            encounter_ids[rows].tolist(),
+            temperature.tolist(),
+            heart_rate.tolist(),
+            [f'{s}/{d}' for s, d in zip(systolic.tolist(), diastolic.tolist())],
+            spo2.tolist(),
+            recorded_at,
+            systolic.tolist(),
+            diastolic.tolist(),
+            score.tolist(),
+        ))
+
+        # Early-warning rows from each visit's last reading (app1.ews)
+        last = np.cumsum(readings) - 1
+        risks = list(zip(
+            encounter_ids[done].tolist(),
+            score[last].tolist(),
+            np.maximum.reduceat(score, last - readings + 1).tolist(),
+            red[last].tolist(),
+            readings.tolist(),
+            vital_ids[last].tolist(),
+            [recorded_at[i] for i in last.tolist()],
+            [visit_types[i] for i in done.tolist()],
+        ))
+
+        return [
+            (Patient, PATIENT_FIELDS, patients),
+            (Encounter, ENCOUNTER_FIELDS, encounters),
+            (Reminder, REMINDER_FIELDS, reminders),
+            (ReminderDue, REMINDER_DUE_FIELDS, reminders_due),
+            (Medication, MEDICATION_FIELDS, medications),
+            (LabResult, LAB_RESULT_FIELDS, labs),
+            (Vital, VITAL_FIELDS, vitals),
+            (EncounterRisk, ENCOUNTER_RISK_FIELDS, risks),
+        ]
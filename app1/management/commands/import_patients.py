@@ -0,0 +1,217 @@
+import csv
+import json
+import resource
+import time
+from datetime import date
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import IntegrityError, connection, transaction
+
+from app1.models import Patient
+
+
+# Columns written on insert and compared/overwritten on update.
+FIELDS = ['first_name', 'last_name', 'dob', 'gender', 'email', 'phone', 'address', 'blood_group', 'external_id']
+# Optional columns: a blank cell keeps the stored value on update rather than clearing it.
+KEEP_IF_BLANK = {'email', 'phone', 'address', 'blood_group', 'external_id'}
+GENDERS = {'M': 'M', 'MALE': 'M', 'F': 'F', 'FEMALE': 'F', 'O': 'O', 'OTHER': 'O'}
+
+
+def read_rows(path, fmt):
+    """Yield (line number, row dict) from a CSV or JSONL file without loading it."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_num, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield line_num, None
+                    continue
+                yield line_num, row if isinstance(row, dict) else None
+
+
+def clean_row(row, key):
+    """Validate one input row and return the Patient field values.
+    Raises ValueError with a readable message for rejects."""
+    if row is None:
+        raise ValueError('not a JSON object')
+
+    def text(name, max_length, required=False):
+        value = row.get(name)
+        value = '' if value is None else str(value).strip()
+        if required and not value:
+            raise ValueError(f'{name} is required')
+        if len(value) > max_length:
+            raise ValueError(f'{name} longer than {max_length} characters')
+        return value
+
+    values = {
+        'first_name': text('first_name', 100, required=True),
+        'last_name': text('last_name', 100, required=True),
+        'phone': text('phone', 15, required=(key == 'phone')),
+        'address': text('address', 10000),
+        'blood_group': text('blood_group', 5) or None,
+        'external_id': text('external_id', 64, required=(key == 'external_id')) or None,
+        'email': text('email', 254) or None,
+    }
+    try:
+        values['dob'] = date.fromisoformat(text('dob', 10, required=True))
+    except ValueError as e:
+        raise ValueError(f'dob: {e}')
+    gender = GENDERS.get(text('gender', 10, required=True).upper())
+    if not gender:
+        raise ValueError('gender must be one of M, F, O')
+    values['gender'] = gender
+    if values['email']:
+        try:
+            validate_email(values['email'])
+        except ValidationError:
+            raise ValueError('invalid email')
+    return values
+
+
+class Command(BaseCommand):
+    help = 'Import patients from a CSV or JSONL file, updating existing patients matched by phone or external ID'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or JSONL file')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                            help='Input format; detected from the file extension by default')
+        parser.add_argument('--key', choices=['phone', 'external_id'], default='phone',
+                            help='Field that identifies an existing patient')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--rejects', default=None,
+                            help='Write rejected rows as JSONL to this file (default: <path>.rejects.jsonl)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and match, but write nothing')
+
+    def handle(self, *args, **options):
+        path, key = options['path'], options['key']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv')
+        self.key = key
+        self.dry_run = options['dry_run']
+        self.stats = {'read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'duplicates': 0, 'rejected': 0}
+
+        rejects_path = options['rejects'] or f'{path}.rejects.jsonl'
+        started = time.perf_counter()
+        try:
+            rows = read_rows(path, fmt)
+            with open(rejects_path, 'w', encoding='utf-8') as rejects:
+                while True:
+                    batch = list(islice(rows, options['batch_size']))
+                    if not batch:
+                        break
+                    self.import_batch(batch, rejects)
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{self.stats['read']} rows, {self.stats['read'] / elapsed:,.0f} rows/s", ending='\r'
+                    )
+        except OSError as e:
+            raise CommandError(str(e))
+
+        elapsed = time.perf_counter() - started
+        # ru_maxrss is reported in kilobytes on Linux.
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write('')
+        self.stdout.write(', '.join(f'{name}: {count}' for name, count in self.stats.items()))
+        if self.stats['rejected']:
+            self.stdout.write(self.style.WARNING(f'Rejected rows written to {rejects_path}'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.stats['read']} rows in {elapsed:.1f}s "
+            f"({self.stats['read'] / elapsed if elapsed else 0:,.0f} rows/s, peak RSS {peak_rss_mb:.0f} MB)"
+            + (' [dry run]' if self.dry_run else '')
+        ))
+
+    def import_batch(self, batch, rejects):
+        key = self.key
+        cleaned = {}
+        for line_num, row in batch:
+            self.stats['read'] += 1
+            try:
+                values = clean_row(row, key)
+            except ValueError as e:
+                self.reject(rejects, line_num, row, e)
+                continue
+            # Last occurrence of a key within the batch wins.
+            if values[key] in cleaned:
+                self.stats['duplicates'] += 1
+            cleaned[values[key]] = (line_num, row, values)
+        if not cleaned:
+            return
+
+        # One query matches the whole batch. If the table already holds
+        # several patients with the same phone, the oldest one is updated.
+        existing = {}
+        for row in (Patient.objects.filter(**{f'{key}__in': list(cleaned)})
+                    .order_by('-patient_id').values('patient_id', *FIELDS)):
+            existing[row[key]] = row
+
+        to_create, to_update = [], []
+        for value, (line_num, row, values) in cleaned.items():
+            current = existing.get(value)
+            if current is None:
+                to_create.append((None, line_num, row, values))
+            elif all(current[f] == values[f] or (f in KEEP_IF_BLANK and not values[f]) for f in FIELDS):
+                self.stats['unchanged'] += 1
+            else:
+                to_update.append((current['patient_id'], line_num, row, values))
+
+        if self.dry_run:
+            self.stats['inserted'] += len(to_create)
+            self.stats['updated'] += len(to_update)
+            return
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                self.write(cursor, to_create, to_update)
+            self.stats['inserted'] += len(to_create)
+            self.stats['updated'] += len(to_update)
+        except IntegrityError:
+            # Typically an external_id already used by another patient. Redo
+            # the batch a row at a time so only the offending rows are rejected.
+            for item in to_create + to_update:
+                pk, line_num, row, _ = item
+                try:
+                    with transaction.atomic(), connection.cursor() as cursor:
+                        self.write(cursor, [item] if pk is None else [], [] if pk is None else [item])
+                except IntegrityError as e:
+                    self.reject(rejects, line_num, row, e)
+                else:
+                    self.stats['inserted' if pk is None else 'updated'] += 1
+
+    def reject(self, rejects, line_num, row, error):
+        self.stats['rejected'] += 1
+        rejects.write(json.dumps({'line': line_num, 'error': str(error), 'row': row}, default=str) + '\n')
+
+    def write(self, cursor, to_create, to_update):
+        """INSERT and UPDATE through executemany of plain tuples.
+
+        bulk_create/bulk_update spend most of their time preparing values per
+        field and building a CASE expression per updated row; the rows here are
+        already validated, so only the date needs adapting for the backend.
+        """
+        qn = connection.ops.quote_name
+        adapt_date = connection.ops.adapt_datefield_value
+        table = qn(Patient._meta.db_table)
+        columns = [qn(Patient._meta.get_field(f).column) for f in FIELDS]
+        insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        assignments = [
+            f"{c} = COALESCE(NULLIF(%s, ''), {c})" if f in KEEP_IF_BLANK else f'{c} = %s'
+            for f, c in zip(FIELDS, columns)
+        ]
+        update_sql = f"UPDATE {table} SET {', '.join(assignments)} WHERE {qn(Patient._meta.pk.column)} = %s"
+
+        def params(values):
+            return [adapt_date(values[f]) if f == 'dob' else values[f] for f in FIELDS]
+
+        if to_create:
+            cursor.executemany(insert_sql, [params(values) for _, _, _, values in to_create])
+        if to_update:
+            cursor.executemany(update_sql, [params(values) + [pk] for pk, _, _, values in to_update])
@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Run in a fresh interpreter, so nothing this process has imported is cached
+SCRIPT = '''
+import django
+django.setup()
+from django.core.management import get_commands, load_command_class
+name = {command!r}
+if name:
+    load_command_class(get_commands()[name], name)
+'''
+
+
+def import_times(command=None):
+    """[(module, self µs, cumulative µs)] for django.setup() under the current
+    settings, plus importing `command` when given, from `python -X importtime`.
+
+    Modules loaded with importlib (models modules, the command itself) are not
+    listed; what they import is.
+    """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', SCRIPT.format(command=command)],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode:
+        raise CommandError(result.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Report what django.setup() (and optionally a management command) spends importing'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('command', nargs='?', help='Also import this management command, e.g. process_reminders')
+        parser.add_argument('--limit', type=int, default=20, help='Modules and packages to list')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = import_times(options['command'])
+        wall = time.perf_counter() - started
+        total = sum(self_us for _, self_us, _ in rows)
+        packages = {}
+        for name, self_us, _ in rows:
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0) + self_us
+
+        self.stdout.write(
+            f'{settings.SETTINGS_MODULE}: {len(rows)} modules, {total / 1000:.0f} ms importing, '
+            f'{wall * 1000:.0f} ms wall including interpreter start'
+        )
+        self.stdout.write('\nSlowest imports (cumulative ms, self ms):')
+        for name, self_us, cumulative_us in sorted(rows, key=lambda row: -row[2])[:options['limit']]:
+            self.stdout.write(f'  {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {name}')
+        self.stdout.write('\nBy top-level package (ms):')
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:options['limit']]:
+            self.stdout.write(f'  {self_us / 1000:8.1f}  {package}')
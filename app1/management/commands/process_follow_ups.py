@@ -1,11 +1,20 @@
+import logging
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
+from app1 import push
 from app1.models import Encounter
 
+
+logger = logging.getLogger('app1.reminders')
+
+
 class Command(BaseCommand):
     help = 'Process upcoming follow-up appointments and send reminders'
+    # Run from cron: skip the system checks, which import the URLconf and every view
+    requires_system_checks = []
 
     def handle(self, *args, **options):
         # Get all follow-up appointments scheduled for the next 7 days
@@ -51,6 +60,12 @@ Best regards,
 Hospital Administration
         '''.strip()
         
+        push.notify_patient(
+            'follow_up', encounter.patient_id,
+            f"Reminder: follow-up appointment {encounter.encounter_id} on {encounter.visit_date.strftime('%Y-%m-%d %H:%M')}.",
+            encounter_id=encounter.encounter_id,
+        )
+
         # Send email reminder if patient has email
         if encounter.patient.email:
             try:
@@ -61,13 +76,9 @@ Hospital Administration
                     [encounter.patient.email],
                     fail_silently=False,
                 )
-                self.stdout.write(
-                    f'Sent follow-up reminder to {encounter.patient.email} for appointment {encounter.encounter_id}'
-                )
+                logger.info('follow_up_sent', extra={'encounter_id': encounter.encounter_id, 'channel': 'EMAIL'})
             except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'Failed to send email to {encounter.patient.email}: {e}')
-                )
+                logger.warning('follow_up_failed', extra={'encounter_id': encounter.encounter_id, 'channel': 'EMAIL', 'error': str(e)})
         
         # Print reminder to console for phone calls
         self.stdout.write(
@@ -1,78 +1,104 @@
+import logging
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
 from django.utils import timezone
-from django.core.mail import send_mail
-from django.conf import settings
-from app1.models import Reminder
+from app1 import dispatch, push, reminders
+from app1.models import Reminder, ReminderAttempt
 
-class Command(BaseCommand):
-    help = 'Process pending reminders and send health check calls'
 
-    def handle(self, *args, **options):
-        # Get all pending reminders that are due
-        now = timezone.now()
-        pending_reminders = Reminder.objects.filter(
-            remind_at__lte=now,
-            health_check_done=False
-        )
-        
-        self.stdout.write(
-            self.style.SUCCESS(f'Found {pending_reminders.count()} pending reminders')
-        )
-        
-        for reminder in pending_reminders:
-            # Process the reminder
-            self.process_reminder(reminder)
-            
-        self.stdout.write(
-            self.style.SUCCESS('Successfully processed all pending reminders')
-        )
-    
-    def process_reminder(self, reminder):
-        # Mark the health check as done
-        reminder.health_check_done = True
-        reminder.save()
-        
-        # Prepare message content
-        message = f'''
-Health Check Reminder
+logger = logging.getLogger('app1.reminders')
+
+# A failed delivery is tried again after RETRY_DELAY, up to MAX_ATTEMPTS
+# times per channel
+RETRY_DELAY = timedelta(minutes=15)
+MAX_ATTEMPTS = 3
 
-Dear {reminder.encounter.patient.first_name} {reminder.encounter.patient.last_name},
 
-This is a reminder for your upcoming appointment:
+class Command(BaseCommand):
+    help = 'Process pending reminders and send them by call, SMS and email'
+    # Run from cron: skip the system checks, which import the URLconf and every view
+    requires_system_checks = []
 
-Appointment ID: {reminder.encounter.encounter_id}
-Doctor: Dr. {reminder.encounter.doctor.first_name} {reminder.encounter.doctor.last_name}
-Date & Time: {reminder.encounter.visit_date.strftime('%Y-%m-%d %H:%M')}
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Reminders claimed per transaction')
 
-Please confirm your attendance and let us know if you have any health concerns before the visit.
+    def handle(self, *args, **options):
+        # Due reminders come from the due-queue (app1.reminders), which only
+        # holds pending ones, so this does not scan the reminder history.
+        now = timezone.now()
+        processed = 0
+        self.failed = 0
+        pending = set()
+        # Each channel sends on its own pool (app1.dispatch); batches keep
+        # being claimed while earlier deliveries are still in flight.
+        with dispatch.Dispatcher() as dispatcher:
+            while True:
+                with transaction.atomic():
+                    ids = list(reminders.due(now)[:options['batch_size']])
+                    if not ids:
+                        break
+                    # Claim them by leaving the queue, so an overlapping run
+                    # does not send them too. Failed deliveries queue them
+                    # again (see record()).
+                    Reminder.objects.filter(pk__in=ids).update(health_check_done=True)
+                    reminders.dequeue(ids)
+                batch = Reminder.objects.filter(pk__in=ids).select_related('encounter__patient', 'encounter__doctor')
+                # Earlier runs' attempts: a retry only resends what failed
+                attempted = {}
+                for reminder_id, channel, status in (
+                    ReminderAttempt.objects.filter(reminder_id__in=ids).values_list('reminder_id', 'channel', 'status')
+                ):
+                    attempted.setdefault(reminder_id, set()).add((channel, status))
+                for reminder in batch:
+                    self.process_reminder(reminder, dispatcher, pending, attempted.get(reminder.pk, set()))
+                processed += len(ids)
+                pending = self.record(pending)
+            self.record(pending, wait=True)
 
-Contact us if you need to reschedule.
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully processed {processed} pending reminders')
+        )
+        if self.failed:
+            self.stdout.write(self.style.ERROR(f'{self.failed} deliveries failed, see the reminder_failed log events'))
 
-Best regards,
-Hospital Administration
-        '''.strip()
-        
-        # Send SMS or make call (placeholder)
-        if reminder.method == 'CALL':
-            self.stdout.write(
-                f'Making call to {reminder.encounter.patient.phone} for appointment {reminder.encounter.encounter_id}'
+    def process_reminder(self, reminder, dispatcher, pending, attempted):
+        """`attempted` holds the (channel, status) of its earlier attempts."""
+        if not attempted:
+            # Show it in any chat page the patient has open
+            push.notify_patient(
+                'reminder', reminder.encounter.patient_id,
+                f"Reminder: appointment {reminder.encounter.encounter_id} on {reminder.encounter.visit_date.strftime('%Y-%m-%d %H:%M')}.",
+                encounter_id=reminder.encounter.encounter_id,
             )
-            # In a real implementation, you would integrate with a telephony service here
-            
-        # Also send email reminder if patient has email
-        if reminder.encounter.patient.email:
-            try:
-                send_mail(
-                    f'Reminder: Upcoming Appointment #{reminder.encounter.encounter_id}',
-                    message,
-                    getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@hospital.com'),
-                    [reminder.encounter.patient.email],
-                    fail_silently=False,
-                )
-                self.stdout.write(
-                    f'Sent email reminder to {reminder.encounter.patient.email}'
-                )
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'Failed to send email: {e}')
-                )
\ No newline at end of file
+        for delivery in dispatch.deliveries_for(reminder):
+            if (delivery.channel, 'SENT') not in attempted:
+                pending.add(dispatcher.submit(delivery))
+
+    def record(self, pending, wait=False):
+        """Store the attempts of finished deliveries and queue the reminders
+        with failed ones again; returns the unfinished deliveries."""
+        done = pending if wait else {future for future in pending if future.done()}
+        attempts = [future.result() for future in done]
+        failed = set()
+        for attempt in attempts:
+            fields = {'reminder_id': attempt.reminder_id, 'channel': attempt.channel, 'duration_ms': round(attempt.duration_ms, 1)}
+            if attempt.status == 'SENT':
+                logger.info('reminder_sent', extra=fields)
+            else:
+                self.failed += 1
+                failed.add((attempt.reminder_id, attempt.channel))
+                logger.warning('reminder_failed', extra={**fields, 'error': attempt.error})
+        ReminderAttempt.objects.bulk_create(attempts)
+        if failed:
+            tries = ReminderAttempt.objects.filter(
+                reminder_id__in={reminder_id for reminder_id, _ in failed}, status='FAILED',
+            ).values_list('reminder_id', 'channel').annotate(n=Count('pk'))
+            retry = {
+                reminder_id for reminder_id, channel, n in tries if (reminder_id, channel) in failed and n < MAX_ATTEMPTS
+            }
+            if retry:
+                reminders.retry(retry, timezone.now() + RETRY_DELAY)
+        return pending - done
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app1 import assignment
+
+
+class Command(BaseCommand):
+    help = 'Recompute every doctor\'s place in the assignment order of their specialization'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        doctors = assignment.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ranked {doctors} doctors in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app1 import availability
+
+
+class Command(BaseCommand):
+    help = 'Reload the shared doctor slot calendar (DOCTOR_CALENDAR_PATH) from the Encounter table'
+
+    def handle(self, *args, **options):
+        calendar = availability.calendar()
+        if calendar is None:
+            raise CommandError('DOCTOR_CALENDAR_PATH is not set or bitarray is not installed')
+        started = time.perf_counter()
+        days = calendar.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {days} days for {calendar.capacity} doctor rows into {calendar.path} '
+            f'in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,44 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from app1 import rollups
+from app1.models import ArchivedEncounter, Encounter
+
+
+class Command(BaseCommand):
+    help = 'Rebuild daily rollups from the Encounter and Feedback tables and their archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', default=None, help='First day (YYYY-MM-DD); default: earliest visit')
+        parser.add_argument('--to', dest='end', default=None, help='Last day (YYYY-MM-DD); default: latest visit')
+
+    def handle(self, *args, **options):
+        sides = [model.objects.aggregate(first=Min('visit_date'), last=Max('visit_date'))
+                 for model in (Encounter, ArchivedEncounter)]
+        firsts = [side['first'] for side in sides if side['first']]
+        lasts = [side['last'] for side in sides if side['last']]
+        bounds = {'first': min(firsts, default=None), 'last': max(lasts, default=None)}
+        try:
+            start = date.fromisoformat(options['start']) if options['start'] else None
+            end = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+        if start is None and bounds['first']:
+            start = rollups.local_date(bounds['first'])
+        if end is None and bounds['last']:
+            end = rollups.local_date(bounds['last'])
+        if start is None or end is None:
+            self.stdout.write('No encounters to roll up')
+            return
+
+        started = time.perf_counter()
+        # Rows created while the rebuild runs are left to the next refresh.
+        latest = rollups.latest_ids()
+        rows = rollups.rebuild(start, end)
+        rollups.set_watermarks(*latest)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {rows} rollup rows for {start}..{end} in {time.perf_counter() - started:.1f}s'
+        ))
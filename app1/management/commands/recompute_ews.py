@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from app1 import ews
+from app1.models import ArchivedVital, Vital
+
+
+class Command(BaseCommand):
+    help = 'Score all vitals and rebuild the per-encounter early-warning scores, in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=20000, help='Encounters per transaction')
+        parser.add_argument('--archived', action='store_true', help='Also score the archived vitals')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        models = [(Vital, ews.recompute_encounters)]
+        if options['archived']:
+            models.append((ArchivedVital, ews.score_archived))
+
+        started = time.perf_counter()
+        total = 0
+        for model, recompute in models:
+            bounds = model.objects.aggregate(first=Min('encounter_id'), last=Max('encounter_id'))
+            if bounds['first'] is None:
+                continue
+            for first in range(bounds['first'], bounds['last'] + 1, options['chunk_size']):
+                total += recompute(first, first + options['chunk_size'])
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{model._meta.verbose_name_plural}: {total} vitals, {total / elapsed:,.0f}/s')
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored {total} vitals in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app1 import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute daily rollups for days touched by encounters and feedback created since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=0,
+                            help='Also recompute the last N days, to pick up status changes made without signals')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        days, rows = rollups.refresh(recent_days=options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed {days} days ({rows} rollup rows) in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,288 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Recording is a dict lookup plus a list-slot increment, with no locks: gunicorn
+sync workers are single threaded and under the GIL a lost increment from a
+threaded server is an acceptable error for monitoring data.
+
+When `METRICS_MULTIPROC_DIR` is set, every process periodically dumps its
+values to `<dir>/metrics_<pid>_<token>.json` and the `/metrics` view sums all
+dumps, so the numbers cover every gunicorn worker and not only the one that
+happened to serve the scrape. Dumps of processes that have exited are folded
+into a single `metrics_dead.json` so the directory does not grow with worker
+recycling.
+"""
+import atexit
+import fcntl
+import json
+import os
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _cell(self, labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        cell = self.values.get(key)
+        if cell is None:
+            cell = self.values.setdefault(key, self.empty())
+        return cell
+
+    def empty(self):
+        return [0.0]
+
+    def inc(self, amount=1, **labels):
+        self._cell(labels)[0] += amount
+
+    def samples(self, values):
+        for key, cell in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), cell[0]
+
+
+class Histogram(Counter):
+    """Fixed-bucket histogram.
+
+    Each label set maps to one list: per-bucket counts (the last slot is +Inf)
+    followed by the running sum. Buckets are made cumulative at render time.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def empty(self):
+        return [0.0] * (len(self.buckets) + 2)
+
+    def observe(self, value, **labels):
+        cell = self._cell(labels)
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block. Labels may be added or changed
+        inside the block through the yielded dict (e.g. an outcome)."""
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self, values):
+        bounds = [_format_value(b) for b in self.buckets] + ['+Inf']
+        for key, cell in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0.0
+            for bound, n in zip(bounds, cell[:-1]):
+                cumulative += n
+                yield f'{self.name}_bucket', {**labels, 'le': bound}, cumulative
+            yield f'{self.name}_count', labels, cumulative
+            yield f'{self.name}_sum', labels, cell[-1]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._pid = os.getpid()
+        self._token = uuid.uuid4().hex[:8]
+        self._last_flush = 0.0
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def _check_fork(self):
+        # A forked worker inherits the parent's values; those are reported by
+        # the parent's own dump, so the child starts from zero. Runs in the
+        # child right after the fork (see below), before it records anything.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._token = uuid.uuid4().hex[:8]
+            self._last_flush = 0.0
+            for metric in self.metrics.values():
+                metric.values = {}
+
+    def snapshot(self):
+        self._check_fork()
+        return {
+            name: [[list(key), list(cell)] for key, cell in metric.values.items()]
+            for name, metric in self.metrics.items()
+        }
+
+    # -- multi-process aggregation -------------------------------------------
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+
+    def dump_path(self):
+        return os.path.join(self.directory, f'metrics_{self._pid}_{self._token}.json')
+
+    def flush(self):
+        if not self.directory:
+            return
+        snapshot = self.snapshot()
+        path = self.dump_path()
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        """Flush if the last dump is older than `METRICS_FLUSH_INTERVAL` seconds."""
+        if not self.directory:
+            return
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0)
+        if time.monotonic() - self._last_flush >= interval:
+            self.flush()
+
+    def collect(self):
+        """Values summed over this process and every other process dump."""
+        merged = {name: {} for name in self.metrics}
+        _merge(merged, self.snapshot())
+        if self.directory:
+            own = os.path.basename(self.dump_path())
+            with _locked(os.path.join(self.directory, 'metrics.lock')):
+                self._compact_dead()
+                for fname in os.listdir(self.directory):
+                    if not fname.startswith('metrics_') or not fname.endswith('.json') or fname == own:
+                        continue
+                    try:
+                        with open(os.path.join(self.directory, fname)) as f:
+                            _merge(merged, json.load(f))
+                    except (OSError, ValueError):
+                        continue
+        return merged
+
+    def _compact_dead(self):
+        dead_path = os.path.join(self.directory, 'metrics_dead.json')
+        dead, stale = None, []
+        for fname in os.listdir(self.directory):
+            parts = fname[:-len('.json')].split('_') if fname.endswith('.json') else []
+            if len(parts) != 3 or not parts[1].isdigit() or _alive(int(parts[1])):
+                continue
+            if dead is None:
+                dead = {}
+                if os.path.exists(dead_path):
+                    with open(dead_path) as f:
+                        _merge(dead, json.load(f))
+            try:
+                with open(os.path.join(self.directory, fname)) as f:
+                    _merge(dead, json.load(f))
+            except (OSError, ValueError):
+                pass
+            stale.append(fname)
+        if not stale:
+            return
+        tmp = f'{dead_path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                name: [[list(key), cell] for key, cell in values.items()]
+                for name, values in dead.items()
+            }, f)
+        os.replace(tmp, dead_path)
+        for fname in stale:
+            os.unlink(os.path.join(self.directory, fname))
+
+    def render(self):
+        values = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for sample, labels, value in metric.samples(values.get(name, {})):
+                lines.append(f'{sample}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(into, snapshot):
+    for name, rows in snapshot.items():
+        target = into.setdefault(name, {})
+        for key, cell in rows:
+            key = tuple(key)
+            current = target.get(key)
+            if current is None:
+                target[key] = list(cell)
+            else:
+                for i, v in enumerate(cell):
+                    current[i] += v
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def _locked(path):
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    body = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels.items()
+    )
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+# Resetting at the fork keeps recording free of a getpid() per observation
+os.register_at_fork(after_in_child=REGISTRY._check_fork)
+
+ACTION_REQUESTS = REGISTRY.counter(
+    'chatbot_action_requests_total', 'perform_action requests by action.', ['action'])
+ACTION_ERRORS = REGISTRY.counter(
+    'chatbot_action_errors_total', 'perform_action responses with status >= 400 by action.', ['action'])
+ACTION_LATENCY = REGISTRY.histogram(
+    'chatbot_action_latency_seconds', 'perform_action wall-clock latency by action.', ['action'])
+DB_TIME = REGISTRY.histogram(
+    'chatbot_db_time_seconds', 'Time spent in database queries per request by action.', ['action'])
+LLM_LATENCY = REGISTRY.histogram(
+    'chatbot_llm_latency_seconds', 'llm.call_groq latency by outcome.', ['outcome'],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0))
+SMTP_LATENCY = REGISTRY.histogram(
+    'chatbot_smtp_latency_seconds', 'SMTP send latency by outcome.', ['outcome'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0))
+LOG_DROPPED = REGISTRY.counter(
+    'chatbot_log_dropped_total', 'Log records dropped because the log queue (app1.log) was full.')
@@ -0,0 +1,289 @@
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import random
+import re
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connection
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from . import metrics
+
+
+logger = logging.getLogger('app1.sql')
+request_logger = logging.getLogger('app1.requests')
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN \((?:[^()]*)\)', re.IGNORECASE)
+
+
+def fingerprint(sql: str) -> str:
+    """Reduce a SQL statement to its shape so that executions which only differ
+    in parameter values (or IN-list length) compare equal."""
+    shape = _WHITESPACE_RE.sub(' ', sql).strip()
+    shape = _STRING_RE.sub('?', shape)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return shape
+
+
+def fingerprint_id(shape: str) -> str:
+    return hashlib.sha1(shape.encode('utf-8')).hexdigest()[:12]
+
+
+class QueryProfile:
+    """Per-request record of executed queries.
+
+    Raw SQL strings are counted as they execute (a dict increment); fingerprints
+    are only computed once per distinct statement when the request finishes.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def shapes(self):
+        shapes = Counter()
+        for sql, n in self.statements.items():
+            shapes[fingerprint(sql)] += n
+        return shapes
+
+    def duplicates(self):
+        """Number of executions that repeated an already seen query shape."""
+        return sum(n - 1 for n in self.shapes().values() if n > 1)
+
+    def n_plus_one(self, threshold):
+        """Query shapes repeated at least `threshold` times, most frequent first."""
+        return [(shape, n) for shape, n in self.shapes().most_common() if n >= threshold]
+
+
+class QueryProfilerMiddleware:
+    """Record query count, DB time and repeated query shapes for each request.
+
+    Views tag the request with `request.chatbot_action`; the tag is reported
+    alongside the numbers. In DEBUG the results are returned as `X-DB-*`
+    response headers, otherwise a sample of requests is logged to `app1.sql`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'SQL_PROFILER_ENABLED', True)
+        self.sample_rate = getattr(settings, 'SQL_PROFILER_SAMPLE_RATE', 0.01)
+        self.threshold = getattr(settings, 'SQL_PROFILER_N_PLUS_ONE_THRESHOLD', 3)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        profile = QueryProfile()
+        request.db_profile = profile
+        with connection.execute_wrapper(profile):
+            response = self.get_response(request)
+
+        if settings.DEBUG:
+            self.add_headers(response, profile)
+            # Show the offending SQL locally; headers only carry fingerprints.
+            if profile.n_plus_one(self.threshold):
+                self.log(request, response, profile)
+        elif random.random() < self.sample_rate:
+            self.log(request, response, profile)
+        return response
+
+    def add_headers(self, response, profile):
+        response['X-DB-Query-Count'] = str(profile.count)
+        response['X-DB-Time-Ms'] = f'{profile.duration * 1000:.2f}'
+        response['X-DB-Duplicate-Queries'] = str(profile.duplicates())
+        suspects = profile.n_plus_one(self.threshold)
+        if suspects:
+            response['X-DB-N-Plus-One'] = ', '.join(
+                f'{n}x {fingerprint_id(shape)}' for shape, n in suspects
+            )
+
+    def log(self, request, response, profile):
+        suspects = profile.n_plus_one(self.threshold)
+        record = {
+            'path': request.path,
+            'action': getattr(request, 'chatbot_action', None),
+            'status': response.status_code,
+            'query_count': profile.count,
+            'db_time_ms': round(profile.duration * 1000, 2),
+            'duplicate_queries': profile.duplicates(),
+            'n_plus_one': [
+                {'fingerprint': fingerprint_id(shape), 'count': n, 'sql': shape}
+                for shape, n in suspects
+            ],
+        }
+        level = logging.WARNING if suspects else logging.INFO
+        logger.log(level, 'sql_profile', extra=record)
+
+
+class ActionMetricsMiddleware:
+    """Record request count, error count, latency and DB time per chatbot action,
+    and log an `action` event to `app1.requests` (sampled, see app1.log;
+    server errors are always logged).
+
+    Only requests tagged with `request.chatbot_action` are recorded. DB time
+    comes from QueryProfilerMiddleware, which must be listed after this one.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        action = getattr(request, 'chatbot_action', None)
+        if action is not None:
+            metrics.ACTION_REQUESTS.inc(action=action)
+            if response.status_code >= 400:
+                metrics.ACTION_ERRORS.inc(action=action)
+            latency = time.perf_counter() - start
+            metrics.ACTION_LATENCY.observe(latency, action=action)
+            profile = getattr(request, 'db_profile', None)
+            if profile is not None:
+                metrics.DB_TIME.observe(profile.duration, action=action)
+            metrics.REGISTRY.maybe_flush()
+            request_logger.log(
+                logging.WARNING if response.status_code >= 500 else logging.INFO, 'action', extra={
+                    'action': action,
+                    'encounter_id': getattr(request, 'chatbot_encounter_id', None),
+                    'status': response.status_code,
+                    'latency_ms': round(latency * 1000, 2),
+                    'db_time_ms': round(profile.duration * 1000, 2) if profile is not None else None,
+                },
+            )
+        return response
+
+
+# Preferred first; the file suffixes written by app1.storage
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Unhashed names (images referenced from CSS, admin files) may change in place
+SHORT_CACHE = 'public, max-age=300'
+
+
+class StaticFile:
+    __slots__ = ('path', 'content_type', 'cache_control', 'variants')
+
+    def __init__(self, path, cache_control):
+        self.path = path
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type.endswith(('javascript', 'json', '+xml')):
+            self.content_type += '; charset=utf-8'
+        self.cache_control = cache_control
+        # encoding -> (path, etag); None is the identity encoding
+        self.variants = {None: (path, _etag(path, ''))}
+        for encoding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                self.variants[encoding] = (path + suffix, _etag(path + suffix, encoding))
+
+
+def _etag(path, encoding):
+    stat = os.stat(path)
+    tag = f'{int(stat.st_mtime):x}-{stat.st_size:x}'
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+
+def _accepted_encodings(header):
+    """Encodings the client accepts (q > 0) from an Accept-Encoding header."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """Serve the collected STATIC_ROOT from the application process.
+
+    Built for the output of app1.storage: the files are indexed once at
+    startup, content-hashed names (the values of staticfiles.json) are sent
+    with a one-year immutable Cache-Control, and the precompressed .br/.gz
+    variants are picked by Accept-Encoding and streamed with sendfile where
+    the server supports it. ETags make revalidation of the rest a 304.
+
+    On by default when DEBUG is off (runserver serves static files in DEBUG);
+    STATIC_SERVE overrides. Off when STATIC_URL points at another host.
+    Must be listed before SessionMiddleware so asset requests skip the rest
+    of the stack.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL or ''
+        self.files = {}
+        enabled = getattr(settings, 'STATIC_SERVE', not settings.DEBUG)
+        if enabled and settings.STATIC_ROOT and not urlsplit(self.prefix).netloc:
+            self.files = self.scan(str(settings.STATIC_ROOT))
+
+    def scan(self, root):
+        hashed = set()
+        try:
+            with open(os.path.join(root, 'staticfiles.json'), encoding='utf-8') as f:
+                hashed.update(json.load(f).get('paths', {}).values())
+        except (OSError, ValueError):
+            pass
+        files = {}
+        for directory, _, names in os.walk(root):
+            for filename in names:
+                path = os.path.join(directory, filename)
+                if filename.endswith(tuple(s for _, s in ENCODINGS)) and os.path.isfile(path[:path.rfind('.')]):
+                    continue
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                files[name] = StaticFile(path, IMMUTABLE if name in hashed else SHORT_CACHE)
+        return files
+
+    def __call__(self, request):
+        if self.files and request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            static = self.files.get(request.path[len(self.prefix):])
+            if static is not None:
+                return self.serve(request, static)
+        return self.get_response(request)
+
+    def serve(self, request, static):
+        accepted = _accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        encoding = next((e for e, _ in ENCODINGS if e in static.variants and e in accepted), None)
+        path, etag = static.variants[encoding]
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=static.content_type)
+            response['Content-Length'] = os.path.getsize(path)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=static.content_type)
+            del response['Content-Disposition']
+        response['ETag'] = etag
+        response['Cache-Control'] = static.cache_control
+        if len(static.variants) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        if encoding:
+            response['Content-Encoding'] = encoding
+        return response
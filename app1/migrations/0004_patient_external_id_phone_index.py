@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0003_reminder_health_check_done_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="patient",
+            name="external_id",
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="patient",
+            name="phone",
+            field=models.CharField(db_index=True, max_length=15),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0004_patient_external_id_phone_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                ("name", models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ("last_id", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="encounter",
+            name="visit_date",
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.CreateModel(
+            name="DailyRollup",
+            fields=[
+                ("rollup_id", models.AutoField(primary_key=True, serialize=False)),
+                ("date", models.DateField()),
+                ("doctor_id", models.IntegerField(default=0)),
+                ("specialization", models.CharField(blank=True, max_length=100)),
+                ("visit_type", models.CharField(max_length=10)),
+                ("encounters", models.IntegerField(default=0)),
+                ("completed", models.IntegerField(default=0)),
+                ("no_shows", models.IntegerField(default=0)),
+                ("cancelled", models.IntegerField(default=0)),
+                ("feedback_count", models.IntegerField(default=0)),
+                ("rating_count", models.IntegerField(default=0)),
+                ("rating_sum", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["date", "specialization"], name="app1_dailyr_date_3d20e0_idx")],
+                "constraints": [models.UniqueConstraint(fields=("date", "doctor_id", "specialization", "visit_type"), name="daily_rollup_key")],
+            },
+        ),
+    ]
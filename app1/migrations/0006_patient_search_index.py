@@ -0,0 +1,66 @@
+from django.db import migrations
+
+
+# External-content FTS5 table over the patient columns, tokenized into
+# trigrams so any substring of 3+ characters is an index lookup. Triggers keep
+# it in sync with every write, including raw bulk inserts. SQLite only; on
+# other backends app1.search falls back to prefix filters.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE app1_patient_fts USING fts5(
+        first_name, last_name, phone, email,
+        content='app1_patient', content_rowid='patient_id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER app1_patient_fts_ai AFTER INSERT ON app1_patient BEGIN
+        INSERT INTO app1_patient_fts(rowid, first_name, last_name, phone, email)
+        VALUES (new.patient_id, new.first_name, new.last_name, new.phone, new.email);
+    END
+    """,
+    """
+    CREATE TRIGGER app1_patient_fts_ad AFTER DELETE ON app1_patient BEGIN
+        INSERT INTO app1_patient_fts(app1_patient_fts, rowid, first_name, last_name, phone, email)
+        VALUES ('delete', old.patient_id, old.first_name, old.last_name, old.phone, old.email);
+    END
+    """,
+    """
+    CREATE TRIGGER app1_patient_fts_au AFTER UPDATE OF first_name, last_name, phone, email ON app1_patient BEGIN
+        INSERT INTO app1_patient_fts(app1_patient_fts, rowid, first_name, last_name, phone, email)
+        VALUES ('delete', old.patient_id, old.first_name, old.last_name, old.phone, old.email);
+        INSERT INTO app1_patient_fts(rowid, first_name, last_name, phone, email)
+        VALUES (new.patient_id, new.first_name, new.last_name, new.phone, new.email);
+    END
+    """,
+    "INSERT INTO app1_patient_fts(app1_patient_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS app1_patient_fts_au",
+    "DROP TRIGGER IF EXISTS app1_patient_fts_ad",
+    "DROP TRIGGER IF EXISTS app1_patient_fts_ai",
+    "DROP TABLE IF EXISTS app1_patient_fts",
+]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in CREATE_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in DROP_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0005_daily_rollups"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0006_patient_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PushEvent",
+            fields=[
+                ("event_id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("kind", models.CharField(max_length=20)),
+                ("data", models.JSONField(default=dict)),
+                ("session_key", models.CharField(blank=True, default="", max_length=40)),
+                ("patient_id", models.IntegerField(blank=True, null=True)),
+                ("doctor_id", models.IntegerField(blank=True, null=True)),
+            ],
+        ),
+    ]
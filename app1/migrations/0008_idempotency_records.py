@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0007_push_events"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdempotencyRecord",
+            fields=[
+                ("key", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("request_hash", models.CharField(max_length=32)),
+                ("created_at", models.DateTimeField(db_index=True)),
+                ("status_code", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("content_type", models.CharField(blank=True, default="", max_length=64)),
+                ("body", models.BinaryField(default=b"")),
+            ],
+        ),
+    ]
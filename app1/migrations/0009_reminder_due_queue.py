@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Same bucketing as app1.reminders.BUCKET_SECONDS at the time of writing
+BUCKET_SECONDS = 60 * 60
+BATCH = 5000
+
+
+def queue_pending(apps, schema_editor):
+    Reminder = apps.get_model("app1", "Reminder")
+    ReminderDue = apps.get_model("app1", "ReminderDue")
+    pending = Reminder.objects.filter(health_check_done=False).values_list("reminder_id", "remind_at")
+    batch = []
+    for reminder_id, remind_at in pending.iterator(chunk_size=BATCH):
+        batch.append(ReminderDue(
+            reminder_id=reminder_id, remind_at=remind_at, bucket=int(remind_at.timestamp()) // BUCKET_SECONDS,
+        ))
+        if len(batch) == BATCH:
+            ReminderDue.objects.bulk_create(batch)
+            batch = []
+    ReminderDue.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0008_idempotency_records"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReminderDue",
+            fields=[
+                ("reminder", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name="due", serialize=False, to="app1.reminder")),
+                ("bucket", models.IntegerField()),
+                ("remind_at", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [models.Index(fields=["bucket", "remind_at"], name="app1_remind_bucket_6a522e_idx")],
+            },
+        ),
+        migrations.RunPython(queue_pending, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0009_reminder_due_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedEncounter",
+            fields=[
+                ("encounter_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("visit_type", models.CharField(choices=[("OPD", "Outpatient"), ("IPD", "Inpatient Admission"), ("ER", "Emergency"), ("FU", "Follow-Up"), ("TELE", "Teleconsultation")], max_length=10)),
+                ("visit_date", models.DateTimeField(db_index=True)),
+                ("notes", models.TextField(blank=True, null=True)),
+                ("status", models.CharField(max_length=20)),
+                ("payment_status", models.CharField(max_length=20)),
+                ("problem", models.CharField(blank=True, max_length=255, null=True)),
+                ("doctor", models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="+", to="app1.doctor")),
+                ("patient", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="archived_encounters", to="app1.patient")),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedDiagnosis",
+            fields=[
+                ("diag_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("diagnosis_code", models.CharField(max_length=20)),
+                ("description", models.CharField(max_length=255)),
+                ("encounter", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="diagnoses", to="app1.archivedencounter")),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedFeedback",
+            fields=[
+                ("feedback_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("rating", models.IntegerField(blank=True, null=True)),
+                ("comments", models.TextField(blank=True, null=True)),
+                ("follow_up_required", models.BooleanField(default=False)),
+                ("encounter", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="feedbacks", to="app1.archivedencounter")),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedLabResult",
+            fields=[
+                ("lab_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("test_name", models.CharField(max_length=100)),
+                ("result_value", models.CharField(max_length=100)),
+                ("result_unit", models.CharField(blank=True, max_length=50)),
+                ("reference_range", models.CharField(blank=True, max_length=100)),
+                ("test_date", models.DateField()),
+                ("encounter", models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="lab_results", to="app1.archivedencounter")),
+                ("patient", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="archived_lab_results", to="app1.patient")),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedMedication",
+            fields=[
+                ("medication_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("name", models.CharField(max_length=100)),
+                ("dosage", models.CharField(max_length=50)),
+                ("frequency", models.CharField(max_length=50)),
+                ("start_date", models.DateField()),
+                ("end_date", models.DateField(blank=True, null=True)),
+                ("encounter", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="medications", to="app1.archivedencounter")),
+                ("patient", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="+", to="app1.patient")),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedReminder",
+            fields=[
+                ("reminder_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("remind_at", models.DateTimeField()),
+                ("method", models.CharField(max_length=20)),
+                ("health_check_required", models.BooleanField(default=False)),
+                ("health_check_done", models.BooleanField(default=False)),
+                ("encounter", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="reminders", to="app1.archivedencounter")),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ArchivedVital",
+            fields=[
+                ("vital_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("temperature", models.FloatField()),
+                ("heart_rate", models.IntegerField()),
+                ("blood_pressure", models.CharField(max_length=20)),
+                ("oxygen_saturation", models.IntegerField()),
+                ("recorded_at", models.DateTimeField()),
+                ("encounter", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="vitals", to="app1.archivedencounter")),
+            ],
+        ),
+    ]
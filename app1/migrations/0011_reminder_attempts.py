@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0010_encounter_archive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedReminderAttempt",
+            fields=[
+                ("attempt_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("channel", models.CharField(max_length=10)),
+                ("status", models.CharField(choices=[("SENT", "Sent"), ("FAILED", "Failed")], max_length=10)),
+                ("error", models.TextField(blank=True, default="")),
+                ("attempted_at", models.DateTimeField()),
+                ("duration_ms", models.FloatField()),
+                ("reminder", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="attempts", to="app1.archivedreminder")),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ReminderAttempt",
+            fields=[
+                ("attempt_id", models.AutoField(primary_key=True, serialize=False)),
+                ("channel", models.CharField(max_length=10)),
+                ("status", models.CharField(choices=[("SENT", "Sent"), ("FAILED", "Failed")], max_length=10)),
+                ("error", models.TextField(blank=True, default="")),
+                ("attempted_at", models.DateTimeField()),
+                ("duration_ms", models.FloatField()),
+                ("reminder", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="attempts", to="app1.reminder")),
+            ],
+        ),
+    ]
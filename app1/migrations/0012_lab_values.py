@@ -0,0 +1,103 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:40
+
+from django.db import migrations, models
+
+from app1.labs import is_abnormal, parse_range, parse_value
+
+
+BATCH = 5000
+
+
+def parse_existing(apps, schema_editor):
+    qn = schema_editor.connection.ops.quote_name
+    for name in ("LabResult", "ArchivedLabResult"):
+        model = apps.get_model("app1", name)
+        # Plain UPDATEs by primary key: bulk_update's CASE expressions get slow on big batches
+        sql = (
+            f"UPDATE {qn(model._meta.db_table)} SET value_numeric = %s, range_low = %s, range_high = %s, "
+            f"abnormal = %s WHERE lab_id = %s"
+        )
+        rows = model.objects.values_list("lab_id", "result_value", "reference_range")
+        batch = []
+        for lab_id, value, reference_range in rows.iterator(chunk_size=BATCH):
+            number = parse_value(value)
+            low, high = parse_range(reference_range)
+            batch.append((number, low, high, is_abnormal(number, low, high), lab_id))
+            if len(batch) == BATCH:
+                with schema_editor.connection.cursor() as cursor:
+                    cursor.executemany(sql, batch)
+                batch = []
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0011_reminder_attempts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedlabresult",
+            name="abnormal",
+            field=models.BooleanField(null=True),
+        ),
+        migrations.AddField(
+            model_name="archivedlabresult",
+            name="range_high",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="archivedlabresult",
+            name="range_low",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="archivedlabresult",
+            name="value_numeric",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="labresult",
+            name="abnormal",
+            field=models.BooleanField(null=True),
+        ),
+        migrations.AddField(
+            model_name="labresult",
+            name="range_high",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="labresult",
+            name="range_low",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="labresult",
+            name="value_numeric",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        # Before the indexes: filling the columns does not have to maintain them
+        migrations.RunPython(parse_existing, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="archivedlabresult",
+            index=models.Index(fields=["patient", "test_date"], name="app1_archiv_patient_08feef_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="archivedlabresult",
+            index=models.Index(fields=["patient", "test_name", "test_date"], name="app1_archiv_patient_f3ad33_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="labresult",
+            index=models.Index(fields=["patient", "test_date"], name="app1_labres_patient_cd0baa_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="labresult",
+            index=models.Index(fields=["patient", "test_name", "test_date"], name="app1_labres_patient_04f070_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="labresult",
+            index=models.Index(condition=models.Q(("abnormal", True)), fields=["test_date"], name="labresult_abnormal_date_idx"),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0012_lab_values"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedvital",
+            name="diastolic",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="archivedvital",
+            name="news_score",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="archivedvital",
+            name="systolic",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="vital",
+            name="diastolic",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="vital",
+            name="news_score",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="vital",
+            name="systolic",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="EncounterRisk",
+            fields=[
+                ("encounter", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name="risk", serialize=False, to="app1.encounter")),
+                ("score", models.IntegerField()),
+                ("peak_score", models.IntegerField()),
+                ("red_flag", models.BooleanField(default=False)),
+                ("readings", models.IntegerField()),
+                ("last_vital_id", models.IntegerField()),
+                ("recorded_at", models.DateTimeField()),
+                ("ward", models.CharField(max_length=10)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["recorded_at", "score"], name="risk_recent_idx"), models.Index(fields=["ward", "recorded_at", "score"], name="risk_ward_recent_idx")],
+            },
+        ),
+    ]
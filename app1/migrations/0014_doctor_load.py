@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0013_early_warning_scores"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DoctorLoad",
+            fields=[
+                ("doctor", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name="load", serialize=False, to="app1.doctor")),
+                ("specialization", models.CharField(max_length=100)),
+                ("next_free_at", models.DateTimeField(blank=True, null=True)),
+                ("day", models.DateField()),
+                ("load", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [models.Index(fields=["specialization", "next_free_at", "load", "doctor"], name="doctor_load_order_idx")],
+            },
+        ),
+    ]
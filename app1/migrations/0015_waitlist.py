@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app1", "0014_doctor_load"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WaitlistEntry",
+            fields=[
+                ("entry_id", models.AutoField(primary_key=True, serialize=False)),
+                ("specialization", models.CharField(max_length=100)),
+                ("problem", models.CharField(blank=True, default="", max_length=255)),
+                ("wanted_before", models.DateTimeField(blank=True, null=True)),
+                ("priority", models.IntegerField(default=0)),
+                ("status", models.CharField(choices=[("WAITING", "Waiting"), ("BOOKED", "Booked"), ("CANCELLED", "Cancelled")], default="WAITING", max_length=20)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("booked_at", models.DateTimeField(blank=True, null=True)),
+                ("doctor", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name="waitlist_entries", to="app1.doctor")),
+                ("encounter", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="waitlist_entries", to="app1.encounter")),
+                ("patient", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="waitlist_entries", to="app1.patient")),
+            ],
+            options={
+                "indexes": [models.Index(fields=["status", "doctor", "-priority", "created_at"], name="waitlist_doctor_queue_idx"), models.Index(fields=["status", "specialization", "doctor", "-priority", "created_at"], name="waitlist_spec_queue_idx")],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 
@@ -18,10 +19,12 @@ class Patient(models.Model):
     dob = models.DateField()
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
     email = models.EmailField(blank=True, null=True)
-    phone = models.CharField(max_length=15)
+    phone = models.CharField(max_length=15, db_index=True)
     address = models.TextField()
     blood_group = models.CharField(max_length=5, blank=True, null=True)
     allergies = models.TextField(blank=True, null=True)  # Free text input
+    # Identifier in the system a patient was imported from (see import_patients)
+    external_id = models.CharField(max_length=64, unique=True, blank=True, null=True)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -40,6 +43,24 @@ class Doctor(models.Model):
         return f"Dr. {self.first_name} {self.last_name} ({self.specialization})"
 
 
+class DoctorLoad(models.Model):
+    """A doctor's place in the assignment order of their specialization
+    (app1.assignment): earliest free slot, then bookings on `day`."""
+    doctor = models.OneToOneField(Doctor, on_delete=models.CASCADE, primary_key=True, related_name="load")
+    # Doctor.specialization in lower case, as triage matches it
+    specialization = models.CharField(max_length=100)
+    # None: no free slot within the booking horizon
+    next_free_at = models.DateTimeField(null=True, blank=True)
+    day = models.DateField()
+    load = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['specialization', 'next_free_at', 'load', 'doctor'], name='doctor_load_order_idx')]
+
+    def __str__(self):
+        return f"{self.doctor_id}: next free {self.next_free_at}, {self.load} on {self.day}"
+
+
 # -------------------------
 # ENCOUNTERS (Visits)
 # -------------------------
@@ -56,17 +77,72 @@ class Encounter(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="encounters")
     doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True)
     visit_type = models.CharField(max_length=10, choices=VISIT_TYPES)
-    visit_date = models.DateTimeField()
+    visit_date = models.DateTimeField(db_index=True)
     notes = models.TextField(blank=True, null=True)
     # Minimal appointment lifecycle fields
     status = models.CharField(max_length=20, default='BOOKED')
     payment_status = models.CharField(max_length=20, default='PENDING')
     problem = models.CharField(max_length=255, blank=True, null=True)
 
+    # Fields that decide which DailyRollup row an encounter is counted in
+    ROLLUP_FIELDS = ('visit_date', 'doctor_id', 'visit_type', 'status')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded values so a save can move the encounter between
+        # rollup rows without re-reading it (see app1.rollups)
+        instance._rollup_state = _loaded_state(instance, cls.ROLLUP_FIELDS)
+        return instance
+
     def __str__(self):
         return f"Encounter {self.encounter_id} - {self.patient}"
 
 
+# -------------------------
+# WAITLIST
+# -------------------------
+class WaitlistEntry(models.Model):
+    """A patient waiting for an earlier slot with a doctor, or with anyone in
+    a specialization. Offered freed slots by priority, then wait (see
+    app1.waitlist)."""
+    STATUS_CHOICES = [
+        ('WAITING', 'Waiting'),
+        ('BOOKED', 'Booked'),
+        ('CANCELLED', 'Cancelled'),
+    ]
+
+    entry_id = models.AutoField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='waitlist_entries')
+    # None: any doctor of the specialization
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, null=True, blank=True, related_name='waitlist_entries')
+    # Lower case, as DoctorLoad
+    specialization = models.CharField(max_length=100)
+    problem = models.CharField(max_length=255, blank=True, default='')
+    # The booking to bring forward, if the patient has one; once matched, the
+    # booking made
+    encounter = models.ForeignKey(
+        Encounter, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_entries',
+    )
+    # Only slots before this are offered (None: any)
+    wanted_before = models.DateTimeField(null=True, blank=True)
+    priority = models.IntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='WAITING')
+    created_at = models.DateTimeField(default=timezone.now)
+    booked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'doctor', '-priority', 'created_at'], name='waitlist_doctor_queue_idx'),
+            models.Index(
+                fields=['status', 'specialization', 'doctor', '-priority', 'created_at'], name='waitlist_spec_queue_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Waitlist {self.entry_id}: patient {self.patient_id} ({self.status})"
+
+
 # -------------------------
 # REMINDERS
 # -------------------------
@@ -83,6 +159,40 @@ class Reminder(models.Model):
         return f"Reminder {self.reminder_id} for {self.encounter}"
 
 
+class ReminderDue(models.Model):
+    """Due-queue entry for a pending reminder, bucketed by the hour of
+    remind_at (see app1.reminders). Deleted once the reminder is dispatched;
+    the Reminder row stays as history."""
+    reminder = models.OneToOneField(Reminder, on_delete=models.CASCADE, primary_key=True, related_name='due')
+    bucket = models.IntegerField()
+    remind_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['bucket', 'remind_at'])]
+
+    def __str__(self):
+        return f"Due {self.reminder_id} at {self.remind_at}"
+
+
+class ReminderAttempt(models.Model):
+    """One delivery of a reminder through one channel (see app1.dispatch)."""
+    STATUS_CHOICES = [
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    attempt_id = models.AutoField(primary_key=True)
+    reminder = models.ForeignKey(Reminder, on_delete=models.CASCADE, related_name='attempts')
+    channel = models.CharField(max_length=10)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    error = models.TextField(blank=True, default='')
+    attempted_at = models.DateTimeField()
+    duration_ms = models.FloatField()
+
+    def __str__(self):
+        return f"{self.channel} attempt for reminder {self.reminder_id}: {self.status}"
+
+
 # -------------------------
 # FEEDBACK
 # -------------------------
@@ -93,6 +203,14 @@ class Feedback(models.Model):
     comments = models.TextField(blank=True, null=True)
     follow_up_required = models.BooleanField(default=False)
 
+    ROLLUP_FIELDS = ('encounter_id', 'rating')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._rollup_state = _loaded_state(instance, cls.ROLLUP_FIELDS)
+        return instance
+
     def __str__(self):
         return f"Feedback {self.feedback_id} for {self.encounter}"
 
@@ -126,6 +244,20 @@ class LabResult(models.Model):
     result_unit = models.CharField(max_length=50, blank=True)
     reference_range = models.CharField(max_length=100, blank=True)
     test_date = models.DateField()
+    # Parsed from result_value and reference_range on save (app1.labs);
+    # null when the text holds no number.
+    value_numeric = models.FloatField(null=True, blank=True)
+    range_low = models.FloatField(null=True, blank=True)
+    range_high = models.FloatField(null=True, blank=True)
+    abnormal = models.BooleanField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'test_date']),
+            models.Index(fields=['patient', 'test_name', 'test_date']),
+            # The day's abnormal results (app1.labs.abnormal_results)
+            models.Index(fields=['test_date'], condition=models.Q(abnormal=True), name='labresult_abnormal_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.test_name} - {self.patient}"
@@ -183,11 +315,39 @@ class Vital(models.Model):
     blood_pressure = models.CharField(max_length=20)  # e.g., "120/80"
     oxygen_saturation = models.IntegerField()
     recorded_at = models.DateTimeField()
+    # Parsed from blood_pressure and scored on save (app1.ews)
+    systolic = models.IntegerField(null=True, blank=True)
+    diastolic = models.IntegerField(null=True, blank=True)
+    news_score = models.IntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"Vitals for {self.encounter}"
 
 
+class EncounterRisk(models.Model):
+    """Early-warning score of an encounter's latest vitals, kept current as
+    vitals are recorded (app1.ews)."""
+    encounter = models.OneToOneField(Encounter, on_delete=models.CASCADE, primary_key=True, related_name="risk")
+    score = models.IntegerField()
+    peak_score = models.IntegerField()
+    # A single parameter of the latest reading scored 3
+    red_flag = models.BooleanField(default=False)
+    readings = models.IntegerField()
+    last_vital_id = models.IntegerField()
+    recorded_at = models.DateTimeField()
+    # Encounter.visit_type (OPD, ER, IPD...): the closest thing to a ward
+    ward = models.CharField(max_length=10)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recorded_at', 'score'], name='risk_recent_idx'),
+            models.Index(fields=['ward', 'recorded_at', 'score'], name='risk_ward_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"NEWS {self.score} for {self.encounter_id}"
+
+
 # -------------------------
 # INSURANCE
 # -------------------------
@@ -201,3 +361,186 @@ class Insurance(models.Model):
 
     def __str__(self):
         return self.provider_name
+
+
+# -------------------------
+# DAILY ROLLUPS
+# -------------------------
+class DailyRollup(models.Model):
+    """Encounter and feedback counts per day, doctor, specialization and visit
+    type. Maintained by app1.rollups; dashboards read this instead of
+    scanning Encounter and Feedback."""
+    rollup_id = models.AutoField(primary_key=True)
+    date = models.DateField()
+    # Not a foreign key so history survives doctor deletion; 0 means no doctor was assigned
+    doctor_id = models.IntegerField(default=0)
+    specialization = models.CharField(max_length=100, blank=True)
+    visit_type = models.CharField(max_length=10)
+    encounters = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    no_shows = models.IntegerField(default=0)
+    cancelled = models.IntegerField(default=0)
+    feedback_count = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'doctor_id', 'specialization', 'visit_type'], name='daily_rollup_key'
+            ),
+        ]
+        indexes = [models.Index(fields=['date', 'specialization'])]
+
+    def __str__(self):
+        return f"Rollup {self.date} doctor {self.doctor_id} {self.visit_type}"
+
+
+class RollupWatermark(models.Model):
+    """Highest source row id already folded into the rollups by refresh_rollups."""
+    name = models.CharField(max_length=50, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} watermark {self.last_id}"
+
+
+# -------------------------
+# PUSH EVENTS
+# -------------------------
+class PushEvent(models.Model):
+    """Outbox of server-sent events for connected chat pages (see app1.push).
+    An event is addressed to a session, a patient and/or a doctor's slot list."""
+    event_id = models.BigAutoField(primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    kind = models.CharField(max_length=20)
+    data = models.JSONField(default=dict)
+    session_key = models.CharField(max_length=40, blank=True, default='')
+    patient_id = models.IntegerField(null=True, blank=True)
+    doctor_id = models.IntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Push {self.event_id} {self.kind}"
+
+
+class IdempotencyRecord(models.Model):
+    """Stored outcome of a perform_action request sent with an Idempotency-Key
+    (see app1.idempotency). status_code is null while the first request runs."""
+    key = models.CharField(max_length=64, primary_key=True)
+    request_hash = models.CharField(max_length=32)
+    created_at = models.DateTimeField(db_index=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=64, blank=True, default='')
+    body = models.BinaryField(default=b'')
+
+    def __str__(self):
+        return f"Idempotency {self.key} ({self.status_code or 'running'})"
+
+
+
+# -------------------------
+# ARCHIVE
+# -------------------------
+# Closed encounters older than ARCHIVE_AFTER_MONTHS and their child rows,
+# moved out of the hot tables by archive_encounters (see app1.archive). Same
+# columns and primary keys as the hot tables; children point at the archived
+# encounter.
+class ArchivedEncounter(models.Model):
+    encounter_id = models.IntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="archived_encounters")
+    doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True, related_name="+")
+    visit_type = models.CharField(max_length=10, choices=Encounter.VISIT_TYPES)
+    visit_date = models.DateTimeField(db_index=True)
+    notes = models.TextField(blank=True, null=True)
+    status = models.CharField(max_length=20)
+    payment_status = models.CharField(max_length=20)
+    problem = models.CharField(max_length=255, blank=True, null=True)
+
+    def __str__(self):
+        return f"Archived encounter {self.encounter_id}"
+
+
+class ArchivedReminder(models.Model):
+    reminder_id = models.IntegerField(primary_key=True)
+    encounter = models.ForeignKey(ArchivedEncounter, on_delete=models.CASCADE, related_name="reminders")
+    remind_at = models.DateTimeField()
+    method = models.CharField(max_length=20)
+    health_check_required = models.BooleanField(default=False)
+    health_check_done = models.BooleanField(default=False)
+
+
+class ArchivedFeedback(models.Model):
+    feedback_id = models.IntegerField(primary_key=True)
+    encounter = models.ForeignKey(ArchivedEncounter, on_delete=models.CASCADE, related_name="feedbacks")
+    rating = models.IntegerField(null=True, blank=True)
+    comments = models.TextField(blank=True, null=True)
+    follow_up_required = models.BooleanField(default=False)
+
+
+class ArchivedMedication(models.Model):
+    medication_id = models.IntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="+")
+    encounter = models.ForeignKey(ArchivedEncounter, on_delete=models.CASCADE, related_name="medications")
+    name = models.CharField(max_length=100)
+    dosage = models.CharField(max_length=50)
+    frequency = models.CharField(max_length=50)
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+
+
+class ArchivedLabResult(models.Model):
+    lab_id = models.IntegerField(primary_key=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name="archived_lab_results")
+    encounter = models.ForeignKey(ArchivedEncounter, on_delete=models.SET_NULL, null=True, related_name="lab_results")
+    test_name = models.CharField(max_length=100)
+    result_value = models.CharField(max_length=100)
+    result_unit = models.CharField(max_length=50, blank=True)
+    reference_range = models.CharField(max_length=100, blank=True)
+    test_date = models.DateField()
+    value_numeric = models.FloatField(null=True, blank=True)
+    range_low = models.FloatField(null=True, blank=True)
+    range_high = models.FloatField(null=True, blank=True)
+    abnormal = models.BooleanField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'test_date']),
+            models.Index(fields=['patient', 'test_name', 'test_date']),
+        ]
+
+
+class ArchivedDiagnosis(models.Model):
+    diag_id = models.IntegerField(primary_key=True)
+    encounter = models.ForeignKey(ArchivedEncounter, on_delete=models.CASCADE, related_name="diagnoses")
+    diagnosis_code = models.CharField(max_length=20)
+    description = models.CharField(max_length=255)
+
+
+class ArchivedVital(models.Model):
+    vital_id = models.IntegerField(primary_key=True)
+    encounter = models.ForeignKey(ArchivedEncounter, on_delete=models.CASCADE, related_name="vitals")
+    temperature = models.FloatField()
+    heart_rate = models.IntegerField()
+    blood_pressure = models.CharField(max_length=20)
+    oxygen_saturation = models.IntegerField()
+    recorded_at = models.DateTimeField()
+    systolic = models.IntegerField(null=True, blank=True)
+    diastolic = models.IntegerField(null=True, blank=True)
+    news_score = models.IntegerField(null=True, blank=True)
+
+
+class ArchivedReminderAttempt(models.Model):
+    attempt_id = models.IntegerField(primary_key=True)
+    reminder = models.ForeignKey(ArchivedReminder, on_delete=models.CASCADE, related_name="attempts")
+    channel = models.CharField(max_length=10)
+    status = models.CharField(max_length=10, choices=ReminderAttempt.STATUS_CHOICES)
+    error = models.TextField(blank=True, default="")
+    attempted_at = models.DateTimeField()
+    duration_ms = models.FloatField()
+
+
+def _loaded_state(instance, fields):
+    # None when any of the fields was deferred, i.e. the state is unknown
+    if instance.get_deferred_fields().intersection(fields):
+        return None
+    return tuple(getattr(instance, f) for f in fields)
@@ -0,0 +1,312 @@
+"""
+Server-sent events for the chat page at /events.
+
+Anything that wants to notify a page (a request handler, a signal, a
+management command, another process) calls publish(), which stores a
+PushEvent row once the current transaction commits. Each ASGI process runs
+a single Hub task that, while it has connections, polls the table for new
+rows every PUSH_POLL_INTERVAL seconds and hands each one to the connections
+it is addressed to: a session, a patient, or the doctor whose slots are on
+screen. An idle connection is a suspended async generator and a bounded
+queue; the database sees one polling query per process, not one per
+connection.
+
+HospitalChatbot/asgi.py routes /events to asgi_events() ahead of Django.
+Django's request handler keeps a dedicated executor thread for the lifetime
+of each request, which for a stream would mean one idle thread per
+connection. There are no events under WSGI (runserver, sync workers): an
+endless response would hold the worker for good, so views.events answers
+501 and the page does not listen.
+
+Events are kept for PUSH_RETENTION seconds so a reconnecting EventSource can
+replay what it missed (Last-Event-ID); one write in 1/PRUNE_PROBABILITY
+deletes the older ones. A connection that falls behind by
+more than QUEUE_SIZE events is closed and replays on reconnect.
+
+Kinds sent today: `slots` (a doctor's slot was taken or freed), `reminder`
+and `follow_up` (notifications with a `text` line for the chat).
+"""
+import asyncio
+import json
+import logging
+import random
+from datetime import timedelta
+from importlib import import_module
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.http import parse_cookie
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import PushEvent
+
+
+logger = logging.getLogger('app1.push')
+
+QUEUE_SIZE = 100
+# Rows read per poll
+BATCH = 500
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_KEEPALIVE = 20
+DEFAULT_RETENTION = 10 * 60
+PRUNE_PROBABILITY = 0.01
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# -- publishing ----------------------------------------------------------------------
+
+def publish(kind, data, session_key='', patient_id=None, doctor_id=None):
+    """Queue an event for the addressed connections, after the current
+    transaction commits (immediately in autocommit)."""
+    transaction.on_commit(lambda: _store(PushEvent(
+        kind=kind, data=data, session_key=session_key or '', patient_id=patient_id, doctor_id=doctor_id,
+    )))
+
+
+def _store(event):
+    event.save()
+    if random.random() < PRUNE_PROBABILITY:
+        prune()
+
+
+def prune():
+    """Delete events older than PUSH_RETENTION. Returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=_setting('PUSH_RETENTION', DEFAULT_RETENTION))
+    return PushEvent.objects.filter(created_at__lt=cutoff).delete()[0]
+
+
+def notify_patient(kind, patient_id, text, **data):
+    """A chat line for every page the patient has open."""
+    publish(kind, {'text': text, **data}, patient_id=patient_id)
+
+
+def encounter_saved(encounter, created):
+    """Tell pages showing the doctor's slots that one was taken or freed.
+    Must run before app1.rollups replaces the encounter's loaded state."""
+    old = None if created else getattr(encounter, '_rollup_state', None)
+    now = timezone.now()
+    slots = {}
+    if old is not None:
+        visit_date, doctor_id, _, status = old
+        if doctor_id and status != 'CANCELLED' and visit_date >= now:
+            slots[(doctor_id, visit_date)] = 'freed'
+    if encounter.doctor_id and encounter.status != 'CANCELLED' and encounter.visit_date >= now:
+        key = (encounter.doctor_id, encounter.visit_date)
+        if slots.pop(key, None) is None:
+            slots[key] = 'taken'
+    for (doctor_id, visit_date), change in slots.items():
+        publish('slots', {
+            'doctor_id': doctor_id, change: timezone.localtime(visit_date).isoformat(),
+        }, doctor_id=doctor_id)
+
+
+# -- delivery --------------------------------------------------------------------------
+
+class Subscriber:
+    __slots__ = ('keys', 'queue', 'last_id')
+
+    def __init__(self, keys):
+        # ('session', key), ('patient', id) and/or ('doctor', id)
+        self.keys = keys
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.last_id = 0
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind: end the stream; the client reconnects and replays.
+            self.queue = _Closed()
+
+
+class _Closed:
+    async def get(self):
+        return None
+
+    def put_nowait(self, event):
+        pass
+
+
+def _event_keys(event):
+    keys = []
+    if event.session_key:
+        keys.append(('session', event.session_key))
+    if event.patient_id is not None:
+        keys.append(('patient', event.patient_id))
+    if event.doctor_id is not None:
+        keys.append(('doctor', event.doctor_id))
+    return keys
+
+
+class Hub:
+    """Per-process fan-out from the PushEvent table to open connections."""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.last_id = None
+        self.task = None
+        self.ready = None
+
+    async def subscribe(self, subscriber):
+        for key in subscriber.keys:
+            self.subscribers.setdefault(key, set()).add(subscriber)
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.ready = asyncio.Event()
+            self.last_id = None
+            self.task = loop.create_task(self.run())
+        # Events published from here on reach the subscriber
+        await self.ready.wait()
+
+    def unsubscribe(self, subscriber):
+        for key in subscriber.keys:
+            group = self.subscribers.get(key)
+            if group is not None:
+                group.discard(subscriber)
+                if not group:
+                    del self.subscribers[key]
+
+    def dispatch(self, event):
+        targets = set()
+        for key in _event_keys(event):
+            targets.update(self.subscribers.get(key, ()))
+        for subscriber in targets:
+            subscriber.offer(event)
+
+    async def run(self):
+        while self.subscribers:
+            try:
+                if self.last_id is None:
+                    # Start from the newest row; earlier ones are replayed per connection.
+                    self.last_id = (await PushEvent.objects.aaggregate(m=Max('event_id')))['m'] or 0
+                else:
+                    events = [
+                        e async for e in
+                        PushEvent.objects.filter(event_id__gt=self.last_id).order_by('event_id')[:BATCH]
+                    ]
+                    for event in events:
+                        self.last_id = event.event_id
+                        self.dispatch(event)
+            except Exception:
+                logger.exception('push poll failed')
+                # Reconnect on the next poll if the connection broke
+                await sync_to_async(close_old_connections)()
+            finally:
+                self.ready.set()
+            await asyncio.sleep(_setting('PUSH_POLL_INTERVAL', DEFAULT_POLL_INTERVAL))
+
+
+HUB = Hub()
+
+
+def format_event(event):
+    return f'id: {event.event_id}\nevent: {event.kind}\ndata: {json.dumps(event.data)}\n\n'
+
+
+async def stream(keys, last_event_id=None):
+    """SSE lines for the events addressed to any of `keys`, until the client
+    goes away. `last_event_id` replays retained events after that id."""
+    subscriber = Subscriber(keys)
+    await HUB.subscribe(subscriber)
+    try:
+        yield f"retry: {int(_setting('PUSH_RETRY_MS', 3000))}\n\n"
+        if last_event_id is not None:
+            condition = Q()
+            for kind, value in keys:
+                condition |= Q(**{'session_key' if kind == 'session' else f'{kind}_id': value})
+            missed = PushEvent.objects.filter(condition, event_id__gt=last_event_id).order_by('event_id')[:QUEUE_SIZE]
+            async for event in missed:
+                subscriber.last_id = event.event_id
+                yield format_event(event)
+        keepalive = _setting('PUSH_KEEPALIVE', DEFAULT_KEEPALIVE)
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                break
+            if event.event_id > subscriber.last_id:
+                subscriber.last_id = event.event_id
+                yield format_event(event)
+    finally:
+        HUB.unsubscribe(subscriber)
+
+
+# -- connections ---------------------------------------------------------------------
+
+async def subscription_keys(session_key, doctor_id=None):
+    """What a connection hears: its session, the patient identified in that
+    session's chat (app1.conversation) and optionally a doctor's slots."""
+    # Imported here: signal handlers in batch commands load this module and
+    # must not pull in the chat flow and the LLM client with it
+    from . import conversation
+
+    keys = []
+    if session_key:
+        store = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+        state = await store.aget(conversation.SESSION_KEY) or {}
+        # session_key is None when the cookie named no live session
+        if store.session_key:
+            keys.append(('session', store.session_key))
+            if state.get('patient_id'):
+                keys.append(('patient', state['patient_id']))
+    if doctor_id is not None:
+        keys.append(('doctor', doctor_id))
+    return keys
+
+
+async def asgi_events(scope, receive, send):
+    """ASGI endpoint for /events: the session's events and, with `doctor_id`,
+    that doctor's slot changes, after the Last-Event-ID header if given."""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    headers = dict(scope.get('headers', ()))
+    try:
+        doctor_id = int(query['doctor_id'][0]) if query.get('doctor_id') else None
+        last_event_id = int(headers[b'last-event-id']) if headers.get(b'last-event-id') else None
+    except ValueError:
+        await _respond(send, 400, b'doctor_id and Last-Event-ID must be integers')
+        return
+    cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin-1'))
+    keys = await subscription_keys(cookies.get(settings.SESSION_COOKIE_NAME), doctor_id)
+    if not keys:
+        # 204 tells EventSource not to reconnect
+        await _respond(send, 204, b'')
+        return
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no'),
+    ]})
+    lines = stream(keys, last_event_id)
+
+    async def pump():
+        async for line in lines:
+            await send({'type': 'http.response.body', 'body': line.encode(), 'more_body': True})
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    sending, listening = asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())
+    try:
+        done, _ = await asyncio.wait([sending, listening], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (sending, listening):
+            task.cancel()
+        await asyncio.gather(sending, listening, return_exceptions=True)
+        await lines.aclose()
+    if sending in done and sending.exception() is None:
+        # The stream ended on our side (fell behind); the client reconnects
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def _respond(send, status, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': body})
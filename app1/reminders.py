@@ -0,0 +1,76 @@
+"""
+Due-queue for reminders.
+
+ReminderDue holds one slim row per pending reminder: its id, remind_at and
+the hour bucket remind_at falls in. The post_save signal keeps it in step
+with Reminder; dispatching a reminder deletes its row and leaves the
+Reminder row as history, and a failed delivery queues it again (retry()).
+Polling reads the buckets up to the current one through the
+(bucket, remind_at) index, so its cost follows the number of reminders due
+rather than the number ever created.
+
+Writes that bypass save() (QuerySet.update(), bulk inserts) must call
+enqueue()/dequeue() themselves.
+"""
+from django.utils import timezone
+
+from .models import Reminder, ReminderDue
+
+
+BUCKET_SECONDS = 60 * 60
+
+
+def bucket_of(when):
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return int(when.timestamp()) // BUCKET_SECONDS
+
+
+def reminder_saved(reminder, created):
+    if reminder.health_check_done:
+        if not created:
+            dequeue([reminder.pk])
+        return
+    values = {'bucket': bucket_of(reminder.remind_at), 'remind_at': reminder.remind_at}
+    if created or not ReminderDue.objects.filter(pk=reminder.pk).update(**values):
+        ReminderDue.objects.create(reminder_id=reminder.pk, **values)
+
+
+def enqueue(reminders):
+    """Queue pending reminders that were written without save()."""
+    ReminderDue.objects.bulk_create([
+        ReminderDue(reminder_id=r.pk, bucket=bucket_of(r.remind_at), remind_at=r.remind_at)
+        for r in reminders if not r.health_check_done
+    ], ignore_conflicts=True)
+
+
+def dequeue(reminder_ids):
+    """Drop reminders from the queue; `reminder_ids` may be a values() queryset."""
+    return ReminderDue.objects.filter(reminder_id__in=reminder_ids).delete()[0]
+
+
+def retry(reminder_ids, when):
+    """Queue claimed reminders again, due at `when`; their Reminder.remind_at
+    is left as it was."""
+    Reminder.objects.filter(pk__in=reminder_ids).update(health_check_done=False)
+    ReminderDue.objects.bulk_create([
+        ReminderDue(reminder_id=pk, bucket=bucket_of(when), remind_at=when) for pk in reminder_ids
+    ], ignore_conflicts=True)
+
+
+def move(encounter_id, remind_at):
+    """Move an encounter's pending reminders, and their queue rows, to
+    `remind_at` (a rescheduled visit)."""
+    Reminder.objects.filter(encounter_id=encounter_id, health_check_done=False).update(remind_at=remind_at)
+    ReminderDue.objects.filter(reminder__encounter_id=encounter_id).update(
+        remind_at=remind_at, bucket=bucket_of(remind_at),
+    )
+
+
+def due(now=None):
+    """Ids of the reminders due at `now`, oldest first."""
+    now = now or timezone.now()
+    return (
+        ReminderDue.objects.filter(bucket__lte=bucket_of(now), remind_at__lte=now)
+        .order_by('bucket', 'remind_at').values_list('reminder_id', flat=True)
+    )
@@ -0,0 +1,303 @@
+"""
+Daily rollups of encounters and feedback for dashboards.
+
+DailyRollup holds one row per (date, doctor, specialization, visit type) with
+counters. Rows are kept current in three ways:
+
+* Signal handlers (app1.signals) apply the difference an Encounter or
+  Feedback save makes as a single INSERT ... ON CONFLICT DO UPDATE that adds
+  to the counters. A save that changes no rollup field (e.g. a payment
+  status update) costs no query.
+* `refresh_rollups` recomputes the days touched by encounters and feedback
+  created since the last run, for writes that skip signals (bulk_create,
+  queryset.update(), imports). `--days N` also recomputes the last N days.
+* `rebuild_rollups` recomputes a date range from scratch.
+
+Deleting encounters or feedback does not decrement the rollups; they count
+what happened. A later recompute of the same day reflects the deletion.
+
+Dates are days in the current time zone (TIME_ZONE).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedEncounter, ArchivedFeedback, DailyRollup, Doctor, Encounter, Feedback, RollupWatermark
+
+
+KEY_FIELDS = ['date', 'doctor_id', 'specialization', 'visit_type']
+COUNTERS = ['encounters', 'completed', 'no_shows', 'cancelled', 'feedback_count', 'rating_count', 'rating_sum']
+STATUS_COUNTERS = {'COMPLETED': 'completed', 'NO_SHOW': 'no_shows', 'CANCELLED': 'cancelled'}
+# Days recomputed per transaction by rebuild()
+REBUILD_WINDOW = 31
+
+
+def local_date(dt):
+    if timezone.is_naive(dt):
+        return dt.date()
+    return timezone.localtime(dt).date()
+
+
+def _specialization(doctor_id, encounter=None):
+    if not doctor_id:
+        return ''
+    if encounter is not None and encounter.doctor_id == doctor_id:
+        return encounter.doctor.specialization
+    return Doctor.objects.filter(pk=doctor_id).values_list('specialization', flat=True).first() or ''
+
+
+# -- incremental updates -------------------------------------------------------
+
+def encounter_changed(encounter, created):
+    """Move an encounter's contribution from its loaded state to its saved one."""
+    new_state = tuple(getattr(encounter, f) for f in Encounter.ROLLUP_FIELDS)
+    old_state = None if created else getattr(encounter, '_rollup_state', None)
+    encounter._rollup_state = new_state
+    if old_state == new_state:
+        return
+    if not created and old_state is None:
+        # Saved without being loaded first; the previous values are unknown.
+        recompute_days([local_date(encounter.visit_date)])
+        return
+
+    new_key = _encounter_key(new_state, encounter)
+    if old_state is None:
+        apply([(new_key, _status_counts(new_state, 1))])
+        return
+    old_key = _encounter_key(old_state, encounter)
+    old_counts, new_counts = _status_counts(old_state, -1), _status_counts(new_state, 1)
+    if old_key != new_key:
+        # Rescheduled or reassigned: the encounter's feedback moves with it.
+        fb = Feedback.objects.filter(encounter_id=encounter.pk).aggregate(
+            feedback_count=Count('pk'), rating_count=Count('rating'), rating_sum=Sum('rating'),
+        )
+        for name, value in fb.items():
+            old_counts[name] = -(value or 0)
+            new_counts[name] = value or 0
+    apply([(old_key, old_counts), (new_key, new_counts)])
+
+
+def _encounter_key(state, encounter):
+    visit_date, doctor_id, visit_type, _ = state
+    return (local_date(visit_date), doctor_id or 0, _specialization(doctor_id, encounter), visit_type)
+
+
+def _status_counts(state, sign):
+    counts = {'encounters': sign}
+    status = state[3]
+    if status in STATUS_COUNTERS:
+        counts[STATUS_COUNTERS[status]] = sign
+    return counts
+
+
+def feedback_changed(feedback, created):
+    new_state = tuple(getattr(feedback, f) for f in Feedback.ROLLUP_FIELDS)
+    old_state = None if created else getattr(feedback, '_rollup_state', None)
+    feedback._rollup_state = new_state
+    if old_state == new_state:
+        return
+    encounter = feedback.encounter
+    if not created and (old_state is None or old_state[0] != feedback.encounter_id):
+        days = {local_date(encounter.visit_date)}
+        if old_state is not None:
+            days.update(
+                local_date(d) for d in Encounter.objects.filter(pk=old_state[0]).values_list('visit_date', flat=True)
+            )
+        recompute_days(days)
+        return
+
+    key = (
+        local_date(encounter.visit_date), encounter.doctor_id or 0,
+        _specialization(encounter.doctor_id, encounter), encounter.visit_type,
+    )
+    counts = {}
+    for sign, state in ((-1, old_state), (1, new_state)):
+        if state is None:
+            continue
+        rating = state[1]
+        counts['feedback_count'] = counts.get('feedback_count', 0) + sign
+        if rating is not None:
+            counts['rating_count'] = counts.get('rating_count', 0) + sign
+            counts['rating_sum'] = counts.get('rating_sum', 0) + sign * int(rating)
+    apply([(key, counts)])
+
+
+def apply(deltas):
+    """Add [(key, {counter: amount})] to the rollups with one upsert statement.
+
+    Needs INSERT ... ON CONFLICT, i.e. SQLite >= 3.24 or PostgreSQL.
+    """
+    qn = connection.ops.quote_name
+    table = qn(DailyRollup._meta.db_table)
+    columns = [qn(DailyRollup._meta.get_field(f).column) for f in KEY_FIELDS + COUNTERS]
+    key_columns = ', '.join(columns[:len(KEY_FIELDS)])
+    updates = ', '.join(f'{c} = {table}.{c} + excluded.{c}' for c in columns[len(KEY_FIELDS):])
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({key_columns}) DO UPDATE SET {updates}"
+    )
+    adapt_date = connection.ops.adapt_datefield_value
+    rows = [
+        [adapt_date(key[0]), *key[1:]] + [counts.get(c, 0) for c in COUNTERS]
+        for key, counts in deltas
+    ]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+# -- recomputation ---------------------------------------------------------------
+
+def _day_bounds(start, end):
+    """Aware datetimes covering local days start..end inclusive."""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+
+def compute(start, end):
+    """{key: {counter: value}} for local days start..end (inclusive), from
+    the hot and archive tables (app1.archive)."""
+    lower, upper = _day_bounds(start, end)
+    rows = {}
+
+    for model in (Encounter, ArchivedEncounter):
+        encounters = (
+            model.objects.filter(visit_date__gte=lower, visit_date__lt=upper)
+            .annotate(day=TruncDate('visit_date'))
+            .values_list('day', 'doctor_id', 'doctor__specialization', 'visit_type')
+            .annotate(
+                encounters=Count('pk'),
+                completed=Count('pk', filter=Q(status='COMPLETED')),
+                no_shows=Count('pk', filter=Q(status='NO_SHOW')),
+                cancelled=Count('pk', filter=Q(status='CANCELLED')),
+            )
+            .order_by()
+        )
+        for day, doctor_id, specialization, visit_type, *counts in encounters:
+            key = (day, doctor_id or 0, specialization or '', visit_type)
+            _add(rows, key, zip(['encounters', 'completed', 'no_shows', 'cancelled'], counts))
+
+    for model in (Feedback, ArchivedFeedback):
+        feedback = (
+            model.objects.filter(encounter__visit_date__gte=lower, encounter__visit_date__lt=upper)
+            .annotate(day=TruncDate('encounter__visit_date'))
+            .values_list('day', 'encounter__doctor_id', 'encounter__doctor__specialization', 'encounter__visit_type')
+            .annotate(feedback_count=Count('pk'), rating_count=Count('rating'), rating_sum=Sum('rating'))
+            .order_by()
+        )
+        for day, doctor_id, specialization, visit_type, *counts in feedback:
+            key = (day, doctor_id or 0, specialization or '', visit_type)
+            _add(rows, key, zip(['feedback_count', 'rating_count', 'rating_sum'], counts))
+    return rows
+
+
+def _add(rows, key, counts):
+    # A day can be partly archived, so both sides add to the same key
+    target = rows.setdefault(key, {})
+    for name, value in counts:
+        target[name] = target.get(name, 0) + (value or 0)
+
+
+def rebuild(start, end):
+    """Replace the rollups of local days start..end, one window per transaction.
+    Returns the number of rows written."""
+    written = 0
+    day = start
+    while day <= end:
+        window_end = min(day + timedelta(days=REBUILD_WINDOW - 1), end)
+        rows = compute(day, window_end)
+        with transaction.atomic():
+            DailyRollup.objects.filter(date__gte=day, date__lte=window_end).delete()
+            # The window is empty now, so the upsert only ever inserts.
+            apply(rows.items())
+        written += len(rows)
+        day = window_end + timedelta(days=1)
+    return written
+
+
+def recompute_days(days):
+    """Rebuild the given local dates, merging consecutive days into one range."""
+    days = sorted(set(days))
+    written = 0
+    while days:
+        start = end = days.pop(0)
+        while days and days[0] == end + timedelta(days=1) and (end - start).days < REBUILD_WINDOW - 1:
+            end = days.pop(0)
+        written += rebuild(start, end)
+    return written
+
+
+def latest_ids():
+    return (
+        Encounter.objects.aggregate(m=Max('encounter_id'))['m'] or 0,
+        Feedback.objects.aggregate(m=Max('feedback_id'))['m'] or 0,
+    )
+
+
+def set_watermarks(encounter_id, feedback_id):
+    RollupWatermark.objects.update_or_create(name='encounter', defaults={'last_id': encounter_id})
+    RollupWatermark.objects.update_or_create(name='feedback', defaults={'last_id': feedback_id})
+
+
+def refresh(recent_days=0):
+    """Fold in encounters and feedback created since the last refresh (and
+    optionally the last `recent_days` days). Returns (days, rows) recomputed."""
+    marks = dict(RollupWatermark.objects.values_list('name', 'last_id'))
+    last_encounter, last_feedback = latest_ids()
+
+    days = set(
+        Encounter.objects.filter(encounter_id__gt=marks.get('encounter', 0), encounter_id__lte=last_encounter)
+        .annotate(day=TruncDate('visit_date')).values_list('day', flat=True).distinct()
+    )
+    days.update(
+        Feedback.objects.filter(feedback_id__gt=marks.get('feedback', 0), feedback_id__lte=last_feedback)
+        .annotate(day=TruncDate('encounter__visit_date')).values_list('day', flat=True).distinct()
+    )
+    today = timezone.localdate()
+    days.update(today - timedelta(days=i) for i in range(recent_days))
+
+    rows = recompute_days(days)
+    set_watermarks(last_encounter, last_feedback)
+    return len(days), rows
+
+
+# -- reads -------------------------------------------------------------------------
+
+GROUPINGS = {'date', 'doctor', 'specialization', 'visit_type'}
+
+
+def summary(start, end, group_by=('date',), specialization=None, doctor_id=None):
+    """Counters for local days start..end, summed per `group_by` (any of
+    GROUPINGS), with derived no-show rate and average rating."""
+    group_by = [g for g in group_by if g in GROUPINGS]
+    columns = ['doctor_id' if g == 'doctor' else g for g in group_by]
+    qs = DailyRollup.objects.filter(date__gte=start, date__lte=end)
+    if specialization:
+        qs = qs.filter(specialization=specialization)
+    if doctor_id is not None:
+        qs = qs.filter(doctor_id=doctor_id)
+    rows = list(
+        qs.values(*columns).annotate(**{c: Sum(c) for c in COUNTERS}).order_by(*columns)
+    )
+
+    names = {}
+    if 'doctor' in group_by:
+        names = {
+            d.doctor_id: str(d)
+            for d in Doctor.objects.filter(pk__in={r['doctor_id'] for r in rows})
+        }
+    for r in rows:
+        if 'date' in r:
+            r['date'] = r['date'].isoformat()
+        if 'doctor_id' in r:
+            r['doctor'] = names.get(r['doctor_id'], '')
+        r['no_show_rate'] = round(r['no_shows'] / r['encounters'], 4) if r['encounters'] else None
+        r['avg_rating'] = round(r['rating_sum'] / r['rating_count'], 2) if r['rating_count'] else None
+    return rows
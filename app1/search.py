@@ -0,0 +1,99 @@
+"""
+Patient search backed by the app1_patient_fts trigram index (migration 0006).
+
+Each whitespace-separated term of 3+ characters must appear somewhere in the
+patient's first name, last name, phone or email, so "asha 98765" finds Asha
+with a phone containing 98765. Results are ordered by bm25 rank with name
+matches weighted above phone and email. Lookup cost grows with the number of
+patients matching a term, not with the table size.
+
+Trigrams cannot match terms shorter than three characters; queries made only
+of such terms, and all queries on databases other than SQLite, fall back to
+prefix matching.
+"""
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Patient
+
+
+# bm25 column weights: first_name, last_name, phone, email
+WEIGHTS = (10.0, 10.0, 5.0, 1.0)
+MIN_TERM = 3
+# Matches ranked per query; newer patients are preferred beyond this
+CANDIDATES = 1000
+# Digit-only queries at least this long are tried as an exact phone number first
+PHONE_DIGITS = 7
+
+
+def _match_expression(query):
+    """FTS5 MATCH string with each usable term quoted as a phrase, or None."""
+    terms = [t for t in query.split() if len(t) >= MIN_TERM]
+    if not terms or connection.vendor != 'sqlite':
+        return None
+    return ' '.join('"{}"'.format(t.replace('"', '""')) for t in terms)
+
+
+def _prefix_filter(query):
+    condition = Q()
+    for term in query.split():
+        condition &= (
+            Q(first_name__istartswith=term) | Q(last_name__istartswith=term) | Q(phone__startswith=term)
+        )
+    return condition
+
+
+def search_patients(query, limit=10):
+    """Best matching patients for `query`, each with a `score` (bm25, lower
+    is better; None for exact phone and prefix matches)."""
+    query = (query or '').strip()
+    if not query:
+        return []
+    digits = ''.join(c for c in query if c not in '+- ()')
+    if digits.isdigit() and len(digits) >= PHONE_DIGITS:
+        # A whole phone number: the plain phone index beats intersecting the
+        # trigram lists of digit runs most phone numbers share.
+        patients = list(Patient.objects.filter(phone=digits)[:limit])
+        if patients:
+            for patient in patients:
+                patient.score = None
+            return patients
+    match = _match_expression(query)
+    if match is None:
+        # Newest first, so the scan stops after `limit` hits.
+        patients = list(Patient.objects.filter(_prefix_filter(query)).order_by('-patient_id')[:limit])
+        for patient in patients:
+            patient.score = None
+        return patients
+    # Only the first CANDIDATES matches are ranked, so a term shared by a large
+    # part of the table (a common surname) does not mean sorting all of them.
+    weights = ', '.join(str(w) for w in WEIGHTS)
+    return list(Patient.objects.raw(
+        'SELECT p.*, c.score FROM ('
+        f'  SELECT rowid, bm25(app1_patient_fts, {weights}) AS score FROM app1_patient_fts'
+        '   WHERE app1_patient_fts MATCH %s ORDER BY rowid DESC LIMIT %s'
+        ') c JOIN app1_patient p ON p.patient_id = c.rowid ORDER BY c.score, p.patient_id DESC LIMIT %s',
+        [match, CANDIDATES, limit],
+    ))
+
+
+def filter_queryset(queryset, query):
+    """Restrict a Patient queryset to matches of `query` (unranked), for the admin."""
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    match = _match_expression(query)
+    if match is None:
+        return queryset.filter(_prefix_filter(query))
+    return queryset.filter(patient_id__in=RawSQL(
+        'SELECT rowid FROM app1_patient_fts WHERE app1_patient_fts MATCH %s', [match]
+    ))
+
+
+def rebuild_index():
+    """Repopulate the index from the patient table, after loads that bypassed
+    the sync triggers."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO app1_patient_fts(app1_patient_fts) VALUES ('rebuild')")
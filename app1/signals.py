@@ -0,0 +1,82 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import assignment, availability, ews, labs, push, reminders, rollups
+from .models import Doctor, Encounter, Feedback, LabResult, Reminder, Vital
+
+
+# Connected first: they compare against the loaded state that the rollups
+# receiver replaces.
+@receiver(post_save, sender=Encounter)
+def push_slot_changes(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        push.encounter_saved(instance, created)
+
+
+@receiver(post_save, sender=Encounter)
+def update_doctor_calendar(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        availability.encounter_saved(instance, created)
+
+
+@receiver(post_delete, sender=Encounter)
+def free_doctor_calendar_slot(sender, instance, **kwargs):
+    availability.encounter_deleted(instance)
+
+
+@receiver(post_save, sender=Encounter)
+def update_doctor_load(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        assignment.encounter_saved(instance, created)
+
+
+@receiver(post_delete, sender=Encounter)
+def recompute_doctor_load(sender, instance, **kwargs):
+    assignment.encounter_deleted(instance)
+
+
+@receiver(post_save, sender=Encounter)
+def update_encounter_rollups(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        rollups.encounter_changed(instance, created)
+
+
+@receiver(post_save, sender=Doctor)
+def rank_doctor(sender, instance, raw=False, **kwargs):
+    if not raw:
+        assignment.doctor_saved(instance)
+
+
+@receiver(post_save, sender=Feedback)
+def update_feedback_rollups(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        rollups.feedback_changed(instance, created)
+
+
+@receiver(post_save, sender=Reminder)
+def queue_pending_reminder(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        reminders.reminder_saved(instance, created)
+
+
+@receiver(pre_save, sender=LabResult)
+def parse_lab_values(sender, instance, raw=False, **kwargs):
+    if not raw:
+        labs.parse(instance)
+
+
+@receiver(pre_save, sender=Vital)
+def score_vital(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ews.score(instance)
+
+
+@receiver(post_save, sender=Vital)
+def update_encounter_risk(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        ews.vital_saved(instance, created)
+
+
+@receiver(post_delete, sender=Vital)
+def recompute_encounter_risk(sender, instance, **kwargs):
+    ews.vital_deleted(instance)
@@ -0,0 +1,379 @@
+const chat = document.getElementById('chat');
+const input = document.getElementById('input');
+const send = document.getElementById('send');
+const chatToggle = document.getElementById('chatToggle');
+const chatWindow = document.getElementById('chatWindow');
+const closeBtn = document.getElementById('closeBtn');
+const typingIndicator = document.getElementById('typingIndicator');
+
+// Toggle chat window
+chatToggle.addEventListener('click', () => {
+  chatWindow.style.display = chatWindow.style.display === 'flex' ? 'none' : 'flex';
+  if (chatWindow.style.display === 'flex') {
+    input.focus();
+    // Scroll to bottom of chat
+    chat.scrollTop = chat.scrollHeight;
+  }
+});
+
+// Close chat window
+closeBtn.addEventListener('click', () => {
+  chatWindow.style.display = 'none';
+});
+
+function addBot(text){
+  const d = document.createElement('div'); d.className='bot'; d.textContent = text; chat.appendChild(d); chat.scrollTop = chat.scrollHeight;
+}
+
+function addUser(text){
+  const d = document.createElement('div'); d.className='user'; d.textContent = text; chat.appendChild(d); chat.scrollTop = chat.scrollHeight;
+}
+
+// The booking flow runs on the server (CHAT_TURN); the page only keeps
+// what it needs for the lookups and the post-visit feedback below.
+const state = {step: 'chat', patient: null, doctor: null, slots: null, current_encounter: null};
+
+// Actions that write or send something carry an Idempotency-Key, so a
+// retry after a timeout or a dropped connection is not run twice.
+const MUTATING = new Set(['REGISTER_PATIENT', 'CREATE_ENCOUNTER', 'BOOK_APPOINTMENT', 'CANCEL_APPOINTMENT',
+  'RESCHEDULE_APPOINTMENT', 'JOIN_WAITLIST', 'SEND_EMAIL', 'SCHEDULE_REMINDER', 'POST_VISIT_FEEDBACK',
+  'UPDATE_PAYMENT_STATUS', 'SCHEDULE_FOLLOW_UP', 'CHAT_TURN']);
+const RETRIES = 2;
+const TIMEOUT_MS = 15000;
+
+function newKey() {
+  if(window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
+async function callAction(action, data){
+  // Show typing indicator
+  typingIndicator.style.display = 'block';
+  chat.scrollTop = chat.scrollHeight;
+
+  const headers = {'Content-Type': 'application/json'};
+  if(MUTATING.has(action)) headers['Idempotency-Key'] = newKey();
+  const body = JSON.stringify({action, data});
+
+  try {
+    let response;
+    for(let attempt = 0; ; attempt++) {
+      try {
+        response = await fetch('/api/perform_action/', {
+          method: 'POST', headers, body, signal: AbortSignal.timeout(TIMEOUT_MS),
+        });
+      } catch (error) {
+        // Only retry what is safe to retry
+        if(attempt < RETRIES && headers['Idempotency-Key']) continue;
+        throw error;
+      }
+      // 409: the first attempt is still running on the server
+      const retryable = response.status >= 500 || response.status === 409;
+      if(!retryable || attempt >= RETRIES || !headers['Idempotency-Key']) break;
+    }
+
+    // Hide typing indicator
+    typingIndicator.style.display = 'none';
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const result = await response.json();
+    return result;
+  } catch (error) {
+    // Hide typing indicator
+    typingIndicator.style.display = 'none';
+    console.error('Error calling action:', error);
+    addBot('Sorry, I encountered an error processing your request. Please try again.');
+    return {error: 'network_error'};
+  }
+}
+
+addBot('Hello! 👋 How can I assist you today?');
+
+async function sendEmailConfirmation(encounterId) {
+  const emailResponse = await callAction('SEND_EMAIL', {encounter_id: encounterId});
+  if(emailResponse.sent) {
+    addBot('Confirmation email sent to ' + emailResponse.patient_email + '. Please check your inbox.');
+  } else {
+    let emailMessage = 'Failed to send confirmation email to ' + emailResponse.patient_email + '.';
+    if(emailResponse.error) {
+      emailMessage += ' Error: ' + emailResponse.error;
+    }
+    emailMessage += ' Please check your spam folder.';
+    addBot(emailMessage);
+  }
+}
+
+// Live updates over /events: slot changes for the doctor whose slots are
+// on screen, reminders and follow-ups for the patient. Only served under
+// ASGI; the page says whether they are on.
+let events = null;
+const listening = {doctor: null, patient: null};
+const shownNotices = new Set();
+
+function listen(doctorId) {
+  const patientId = state.patient ? state.patient.patient_id : null;
+  if(!window.EventSource || document.body.dataset.liveUpdates !== 'on') return;
+  if(events && listening.doctor === doctorId && listening.patient === patientId) return;
+  if(events) events.close();
+  listening.doctor = doctorId;
+  listening.patient = patientId;
+  events = new EventSource('/events' + (doctorId ? '?doctor_id=' + doctorId : ''));
+  events.addEventListener('slots', e => {
+    const change = JSON.parse(e.data);
+    if(!change.taken || !state.slots) return;
+    const taken = new Date(change.taken).getTime();
+    const slot = state.slots.find(s => new Date(s.datetime).getTime() === taken);
+    if(slot) {
+      addBot(`Slot ${slot.id} (${slot.date} at ${slot.time}) was just booked by someone else.`);
+      state.slots = state.slots.filter(s => s !== slot);
+    }
+  });
+  ['reminder', 'follow_up'].forEach(kind => events.addEventListener(kind, e => {
+    const notice = JSON.parse(e.data);
+    const key = kind + ':' + notice.encounter_id;
+    if(shownNotices.has(key)) return;
+    shownNotices.add(key);
+    addBot(notice.text);
+  }));
+}
+
+async function chatTurn(text) {
+  const resp = await callAction('CHAT_TURN', {message: text});
+  if(resp.error) return;
+  (resp.messages || []).forEach(addBot);
+  if(resp.patient) state.patient = resp.patient;
+  if(resp.encounter) state.current_encounter = resp.encounter;
+  if(resp.doctor) state.doctor = resp.doctor;
+  if(resp.available_slots) state.slots = resp.available_slots;
+  if(resp.step !== 'choose_slot') state.slots = null;
+  listen(state.slots && state.doctor ? state.doctor.doctor_id : null);
+  if(resp.step === 'done') {
+    await sendEmailConfirmation(resp.encounter_id);
+    addBot('After visit, you will be asked for feedback.');
+    addBot('If you need anything else, type "book" to create another appointment.');
+    // In a real implementation, this would be triggered after the visit
+    setTimeout(() => {
+      if(state.current_encounter) {
+        addBot('How was your visit? Please rate your experience (1-5 stars):');
+        state.step = 'collect_feedback_rating';
+      }
+    }, 5000); // Wait 5 seconds for demo purposes
+  }
+}
+
+send.onclick = async ()=>{
+  const text = input.value.trim(); if(!text) return; addUser(text); input.value='';
+
+  // Handle general questions first
+  if(/show.*doctor/i.test(text)) {
+    addBot('Fetching list of available doctors...');
+    try {
+      const response = await fetch('/api/perform_action/', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({action: 'LIST_DOCTORS', data: {}})
+      });
+
+      if(response.ok) {
+        const result = await response.json();
+        if(result.doctors && result.doctors.length > 0) {
+          let doctorList = 'Available Doctors:\n';
+          result.doctors.forEach((doc, index) => {
+            doctorList += `${index + 1}. Dr. ${doc.first_name} ${doc.last_name} - ${doc.specialization}\n`;
+          });
+          addBot(doctorList);
+        } else {
+          addBot('No doctors available at the moment.');
+        }
+      } else {
+        addBot('Unable to fetch doctor list at the moment.');
+      }
+    } catch (error) {
+      console.error('Error fetching doctors:', error);
+      addBot('Sorry, I encountered an error fetching the doctor list.');
+    }
+    return;
+  }
+
+  if(/past.*data|previous.*visit|visit.*history/i.test(text)) {
+    if(state.patient && state.patient.patient_id) {
+      addBot('Fetching your visit history...');
+      try {
+        const response = await fetch('/api/perform_action/', {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({action: 'GET_PATIENT_HISTORY', data: {patient_id: state.patient.patient_id}})
+        });
+
+        if(response.ok) {
+          const result = await response.json();
+          if(result.history && result.history.length > 0) {
+            let historyText = 'Your Visit History:\n';
+            result.history.forEach((visit, index) => {
+              historyText += `${index + 1}. ${visit.visit_date.split('T')[0]} - ${visit.problem} with ${visit.doctor_name} (${visit.specialization}) - Status: ${visit.status}\n`;
+            });
+            addBot(historyText);
+          } else {
+            addBot('You have no previous visits recorded.');
+          }
+        } else {
+          addBot('Unable to fetch visit history at the moment.');
+        }
+      } catch (error) {
+        console.error('Error fetching history:', error);
+        addBot('Sorry, I encountered an error fetching your visit history.');
+      }
+    } else {
+      addBot('Please register or log in first to access your visit history.');
+    }
+    return;
+  }
+
+  if(/lab.*report|test.*result/i.test(text)) {
+    if(state.patient && state.patient.patient_id) {
+      addBot('Fetching your recent lab reports...');
+      try {
+        const response = await fetch('/api/perform_action/', {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({action: 'GET_LAB_REPORTS', data: {patient_id: state.patient.patient_id}})
+        });
+
+        if(response.ok) {
+          const result = await response.json();
+          if(result.reports && result.reports.length > 0) {
+            let reportText = 'Recent Lab Reports:\n';
+            result.reports.forEach((report, index) => {
+              reportText += `${index + 1}. ${report.test_name}: ${report.result_value} ${report.result_unit || ''} (Reference: ${report.reference_range || 'N/A'}) - Date: ${report.test_date}\n`;
+            });
+            addBot(reportText);
+          } else {
+            addBot('No recent lab reports found.');
+          }
+        } else {
+          addBot('Unable to fetch lab reports at the moment.');
+        }
+      } catch (error) {
+        console.error('Error fetching lab reports:', error);
+        addBot('Sorry, I encountered an error fetching your lab reports.');
+      }
+    } else {
+      addBot('Please register or log in first to access your lab reports.');
+    }
+    return;
+  }
+
+  if(state.step === 'collect_feedback_rating'){
+    const rating = parseInt(text);
+    if(rating >= 1 && rating <= 5) {
+      state.feedback_rating = rating;
+      addBot('Any additional comments about your visit?');
+      state.step = 'collect_feedback_comments';
+    } else {
+      addBot('Please enter a rating between 1 and 5.');
+    }
+    return;
+  }
+
+  if(state.step === 'collect_feedback_comments'){
+    state.feedback_comments = text;
+    addBot('Do you need a follow-up appointment? (yes/no)');
+    state.step = 'collect_feedback_followup';
+    return;
+  }
+
+  if(state.step === 'collect_feedback_followup'){
+    const followUpRequired = /yes/i.test(text);
+
+    // If follow-up is required, schedule it
+    if(followUpRequired) {
+      addBot('Scheduling follow-up appointment...');
+
+      const followUpResponse = await callAction('SCHEDULE_FOLLOW_UP', {
+        encounter_id: state.current_encounter.encounter_id,
+        follow_up_days: 7, // Default to 7 days
+        reason: 'Follow-up consultation based on previous visit'
+      });
+
+      if(followUpResponse.follow_up_encounter_id) {
+        shownNotices.add('follow_up:' + followUpResponse.follow_up_encounter_id);
+        addBot(`Follow-up appointment scheduled!`);
+        addBot(`Appointment ID: ${followUpResponse.follow_up_encounter_id}`);
+        addBot(`Date & Time: ${followUpResponse.appointment_date}`);
+        addBot('You will receive a confirmation email with details.');
+      } else {
+        addBot('Failed to schedule follow-up appointment. Please contact the hospital directly.');
+      }
+    }
+
+    addBot('Submitting your feedback...');
+
+    // Submit feedback
+    const feedbackData = {
+      encounter_id: state.current_encounter.encounter_id,
+      rating: state.feedback_rating,
+      comments: state.feedback_comments,
+      follow_up_required: followUpRequired
+    };
+
+    const feedbackResponse = await callAction('POST_VISIT_FEEDBACK', feedbackData);
+    if(feedbackResponse.feedback_id) {
+      addBot('Thank you for your feedback!');
+
+      // Get and share visit summary
+      const summaryResponse = await callAction('GET_VISIT_SUMMARY', {
+        encounter_id: state.current_encounter.encounter_id
+      });
+
+      if(summaryResponse.summary) {
+        const summary = summaryResponse.summary;
+        addBot('Here is a summary of your visit:');
+        addBot(`Appointment ID: ${summary.encounter_id}`);
+        addBot(`Doctor: Dr. ${summary.doctor.first_name} ${summary.doctor.last_name} (${summary.doctor.specialization})`);
+        addBot(`Date & Time: ${summary.visit_details.visit_date}`);
+        addBot(`Concern: ${summary.visit_details.problem}`);
+
+        if(summary.medications && summary.medications.length > 0) {
+          addBot('Prescribed Medications:');
+          summary.medications.forEach(med => {
+            addBot(`- ${med.name} (${med.dosage}), ${med.frequency}`);
+          });
+        }
+
+        if(summary.diagnoses && summary.diagnoses.length > 0) {
+          addBot('Diagnoses:');
+          summary.diagnoses.forEach(diag => {
+            addBot(`- ${diag.description} (${diag.code})`);
+          });
+        }
+
+        addBot('A detailed summary has been sent to your email.');
+      }
+    } else {
+      addBot('Failed to submit feedback. Please try again.');
+    }
+
+    state.step = 'chat';
+    return;
+  }
+
+  await chatTurn(text);
+};
+
+input.addEventListener('keydown', function(e){ if(e.key==='Enter') send.click(); });
+
+// Close chat when clicking outside
+document.addEventListener('click', (e) => {
+  if (!chatWindow.contains(e.target) && e.target !== chatToggle && chatWindow.style.display === 'flex') {
+    chatWindow.style.display = 'none';
+  }
+});
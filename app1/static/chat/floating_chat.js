@@ -0,0 +1,93 @@
+// DOM Elements
+const chatToggle = document.getElementById('chatToggle');
+const chatWindow = document.getElementById('chatWindow');
+const closeBtn = document.getElementById('closeBtn');
+const chatMessages = document.getElementById('chatMessages');
+const messageInput = document.getElementById('messageInput');
+const sendButton = document.getElementById('sendButton');
+const typingIndicator = document.getElementById('typingIndicator');
+
+// Toggle chat window
+chatToggle.addEventListener('click', () => {
+    chatWindow.style.display = chatWindow.style.display === 'flex' ? 'none' : 'flex';
+    if (chatWindow.style.display === 'flex') {
+        messageInput.focus();
+    }
+});
+
+// Close chat window
+closeBtn.addEventListener('click', () => {
+    chatWindow.style.display = 'none';
+});
+
+// Add message to chat
+function addMessage(text, isUser = false) {
+    const messageDiv = document.createElement('div');
+    messageDiv.classList.add('message');
+    messageDiv.classList.add(isUser ? 'user-message' : 'bot-message');
+    messageDiv.textContent = text;
+    chatMessages.appendChild(messageDiv);
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+// Show typing indicator
+function showTyping() {
+    typingIndicator.style.display = 'block';
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+// Hide typing indicator
+function hideTyping() {
+    typingIndicator.style.display = 'none';
+}
+
+// Simulate bot response
+function simulateBotResponse(userMessage) {
+    showTyping();
+
+    // Simulate delay
+    setTimeout(() => {
+        hideTyping();
+
+        // Simple responses based on user input
+        let response = "I'm here to help! You can book appointments, check your visit history, or get medical information.";
+
+        if (userMessage.toLowerCase().includes('hello') || userMessage.toLowerCase().includes('hi')) {
+            response = "Hello! How can I assist you today?";
+        } else if (userMessage.toLowerCase().includes('book') || userMessage.toLowerCase().includes('appointment')) {
+            response = "I can help you book an appointment. Are you an existing patient or a new patient?";
+        } else if (userMessage.toLowerCase().includes('thank')) {
+            response = "You're welcome! Is there anything else I can help you with?";
+        } else if (userMessage.toLowerCase().includes('help')) {
+            response = "I can help you with:\n- Booking appointments\n- Checking visit history\n- Medical information\n- Prescription refills\n\nWhat would you like to do?";
+        }
+
+        addMessage(response, false);
+    }, 1000);
+}
+
+// Send message function
+function sendMessage() {
+    const message = messageInput.value.trim();
+    if (message) {
+        addMessage(message, true);
+        messageInput.value = '';
+        simulateBotResponse(message);
+    }
+}
+
+// Event listeners
+sendButton.addEventListener('click', sendMessage);
+
+messageInput.addEventListener('keypress', (e) => {
+    if (e.key === 'Enter') {
+        sendMessage();
+    }
+});
+
+// Close chat when clicking outside
+document.addEventListener('click', (e) => {
+    if (!chatWindow.contains(e.target) && e.target !== chatToggle && chatWindow.style.display === 'flex') {
+        chatWindow.style.display = 'none';
+    }
+});
@@ -0,0 +1,73 @@
+"""
+Static files storage for `collectstatic`.
+
+Every collected file gets a content-hashed copy (chat.3f2a9c1e8b4d.css) listed
+in staticfiles.json, which `{% static %}` resolves to, so the URL changes
+whenever the content does and can be cached forever. Text assets also get
+precompressed .gz and, when the `Brotli` package is installed, .br siblings,
+built once here instead of per response. app1.middleware.StaticFilesMiddleware
+serves the result.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.xml')
+# Smaller files do not gain enough to pay for the extra round of negotiation
+MIN_SIZE = 256
+# A variant is kept only if it is at most this fraction of the original
+MIN_RATIO = 0.95
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Names missing from the manifest resolve unhashed instead of raising
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not collected yet (tests, a fresh checkout): fall back to the plain URL
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            names.add(name)
+            if hashed_name:
+                names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        brotli = _brotli()
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE) and self.exists(name):
+                self.compress(name, brotli)
+
+    def compress(self, name, brotli=None):
+        """Write name.gz (and name.br) next to `name` when they are worth it."""
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < MIN_SIZE:
+            return
+        variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data, quality=11)
+        for suffix, compressed in variants.items():
+            target = path + suffix
+            if len(compressed) <= len(data) * MIN_RATIO:
+                with open(target, 'wb') as f:
+                    f.write(compressed)
+            elif os.path.exists(target):
+                os.remove(target)
@@ -1,3 +1,1179 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import addModuleCleanup, mock
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (
+    archive, assignment, availability, benchmark, booking, dispatch, ews, exports, idempotency, labs, log, metrics,
+    push, reminders, rollups, search, waitlist,
+)
+from .booking import get_available_slots
+from .management.commands.import_report import import_times
+from .models import (
+    Patient, Doctor, DoctorLoad, Encounter, Feedback, Medication, LabResult, Diagnosis, Vital, DailyRollup, PushEvent,
+    IdempotencyRecord, Reminder, ReminderDue, ReminderAttempt, ArchivedEncounter, ArchivedLabResult, EncounterRisk,
+    WaitlistEntry,
+)
+
+
+def setUpModule():
+    # The app1 loggers write JSON lines to stderr (app1.log); keep them out
+    # of the test output
+    for handler in logging.getLogger('app1').handlers:
+        if isinstance(handler, log.BackgroundHandler):
+            addModuleCleanup(handler.target.setStream, handler.target.setStream(StringIO()))
+
+
+@override_settings(GROQ_API_KEY='')
+class BenchmarkTests(TestCase):
+    def test_run_reports_percentiles_per_action(self):
+        dataset = benchmark.seed_dataset(doctors=7, patients=20, seed=1)
+        mix = benchmark.parse_mix('ASSIGN_DOCTOR=2,BOOK_APPOINTMENT=1,GET_PATIENT_HISTORY=1')
+        results = benchmark.run(benchmark.InProcessTransport(), dataset, mix, requests=40, concurrency=1)
+
+        self.assertEqual(results['requests'], 40)
+        self.assertEqual(results['error_rate'], 0)
+        self.assertEqual(set(results['actions']), set(mix))
+        for stats in results['actions'].values():
+            self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+            self.assertLessEqual(stats['p95_ms'], stats['p99_ms'])
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertEqual(benchmark.percentile([7], 95), 7)
+
+    def test_compare_flags_only_regressions_beyond_threshold(self):
+        baseline = {
+            'throughput_rps': 100, 'error_rate': 0,
+            'actions': {'ASSIGN_DOCTOR': {'p95_ms': 10, 'p99_ms': 20}},
+        }
+        within = {
+            'throughput_rps': 95, 'error_rate': 0,
+            'actions': {'ASSIGN_DOCTOR': {'p95_ms': 10.5, 'p99_ms': 21}},
+        }
+        worse = {
+            'throughput_rps': 80, 'error_rate': 0.01,
+            'actions': {'ASSIGN_DOCTOR': {'p95_ms': 12, 'p99_ms': 20}},
+        }
+        self.assertEqual(benchmark.compare(within, baseline, 0.10), [])
+        regressions = benchmark.compare(worse, baseline, 0.10)
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(any(r.startswith('ASSIGN_DOCTOR.p95_ms') for r in regressions))
+
+
+class GenerateDatasetTests(TransactionTestCase):
+    # The command sets SQLite pragmas that cannot change inside a transaction
+    reset_sequences = True
+
+    def generate(self):
+        call_command('generate_dataset', encounters=300, seed=7, chunk_size=120, stdout=StringIO())
+        # Every generated foreign key points at a row
+        connection.check_constraints()
+        return {
+            model.__name__: list(model.objects.order_by('pk').values_list())
+            for model in (Doctor, Patient, Encounter, Reminder, ReminderDue, Medication, LabResult, Vital,
+                          EncounterRisk)
+        }
+
+    def test_same_seed_gives_the_same_linked_rows(self):
+        now = timezone.now().replace(minute=30)
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            first = self.generate()
+            call_command('flush', interactive=False, verbosity=0)
+            second = self.generate()
+
+        self.assertEqual((len(first['Doctor']), len(first['Patient']), len(first['Encounter'])), (20, 75, 300))
+        self.assertEqual(len(first['Reminder']), 300)
+        completed = sum(1 for row in first['Encounter'] if row[6] == 'COMPLETED')
+        self.assertEqual(len(first['EncounterRisk']), completed)
+        self.assertGreaterEqual(len(first['Vital']), completed)
+        self.assertEqual(first, second)
+
+    def test_rejects_an_encounter_count_out_of_range(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', encounters=0, stdout=StringIO())
+
+
+class ImportPatientsTests(TestCase):
+    HEADER = 'first_name,last_name,dob,gender,email,phone,address,blood_group,external_id\n'
+
+    def import_csv(self, text, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'patients.csv'
+            path.write_text(self.HEADER + text)
+            call_command('import_patients', str(path), batch_size=2, stdout=StringIO(), **options)
+            return [json.loads(line) for line in Path(f'{path}.rejects.jsonl').read_text().splitlines()]
+
+    def test_upserts_by_phone_and_rejects_invalid_rows(self):
+        Patient.objects.create(first_name='Asha', last_name='Rao', dob=date(1990, 1, 1), gender='F',
+                               phone='9000000001', address='')
+        rejects = self.import_csv(
+            'Asha,Rao,1990-01-01,female,asha@example.com,9000000001,,O+,\n'
+            'Ravi,Iyer,1985-02-03,M,,9000000002,,,\n'
+            'Ravi,Iyer,1985-02-03,M,ravi@example.com,9000000002,,,\n'
+            'Bad,Date,1985-02-30,M,,9000000003,,,\n'
+        )
+        self.assertEqual(Patient.objects.count(), 2)
+        self.assertEqual(Patient.objects.get(phone='9000000001').email, 'asha@example.com')
+        self.assertEqual(Patient.objects.get(phone='9000000002').email, 'ravi@example.com')
+        self.assertEqual([r['line'] for r in rejects], [5])
+
+    def test_blank_cells_keep_stored_values(self):
+        self.import_csv('Asha,Rao,1990-01-01,F,asha@example.com,9000000001,1 Main St,O+,EXT-1\n')
+        self.import_csv('Asha,Rao-Iyer,1990-01-01,F,,9000000001,,,\n')
+        self.import_csv('Asha,Rao-Iyer,1990-01-01,F,,,,B+,EXT-1\n', key='external_id')
+        patient = Patient.objects.get()
+        self.assertEqual((patient.last_name, patient.blood_group), ('Rao-Iyer', 'B+'))
+        self.assertEqual((patient.email, patient.phone), ('asha@example.com', '9000000001'))
+        self.assertEqual((patient.address, patient.external_id), ('1 Main St', 'EXT-1'))
+
+    def test_duplicate_external_id_rejects_only_that_row(self):
+        rejects = self.import_csv(
+            'Asha,Rao,1990-01-01,F,,9000000001,,,EXT-1\n'
+            'Ravi,Iyer,1985-02-03,M,,9000000002,,,EXT-1\n'
+        )
+        self.assertEqual(list(Patient.objects.values_list('phone', flat=True)), ['9000000001'])
+        self.assertEqual([r['line'] for r in rejects], [3])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        world = build_world(3)
+        self.encounter = world['encounter']
+        Diagnosis.objects.filter(encounter=self.encounter).update(description='Angina')
+
+    def test_command_exports_joined_rows_and_advances_watermark(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output, watermark = Path(tmp) / 'out.ndjson', Path(tmp) / 'watermark.json'
+            call_command('export_encounters', format='ndjson', output=str(output), watermark=str(watermark),
+                         chunk_size=2, stderr=StringIO())
+            rows = [json.loads(line) for line in output.read_text().splitlines()]
+            self.assertEqual([r['encounter_id'] for r in rows],
+                             list(Encounter.objects.order_by('encounter_id').values_list('encounter_id', flat=True)))
+            first = rows[0]
+            self.assertEqual(first['doctor_specialization'], 'Cardiology')
+            self.assertEqual(first['diagnoses'], 'Angina;Angina;Angina')
+            self.assertEqual((first['feedback_count'], first['feedback_avg_rating']), (3, 5.0))
+
+            Encounter.objects.create(patient=self.encounter.patient, visit_type='OPD',
+                                     visit_date=timezone.now(), problem='cough')
+            call_command('export_encounters', format='ndjson', output=str(output), watermark=str(watermark),
+                         stderr=StringIO())
+            rows = [json.loads(line) for line in output.read_text().splitlines()]
+            self.assertEqual([r['problem'] for r in rows], ['cough'])
+            self.assertIsNone(rows[0]['doctor_id'])
+
+    def test_archived_encounters_are_exported(self):
+        Encounter.objects.filter(pk=self.encounter.pk).update(visit_date=archive.months_ago(30), status='COMPLETED')
+        call_command('archive_encounters', stdout=StringIO())
+        self.assertTrue(ArchivedEncounter.objects.filter(pk=self.encounter.pk).exists())
+
+        rows = [row for chunk in exports.iter_chunks(chunk_size=2) for row in chunk]
+        hot = list(Encounter.objects.order_by('pk').values_list('pk', flat=True))
+        self.assertEqual([row['encounter_id'] for row in rows], [self.encounter.pk, *hot])
+        self.assertEqual((rows[0]['doctor_specialization'], rows[0]['status']), ('Cardiology', 'COMPLETED'))
+        self.assertEqual(rows[0]['diagnoses'], 'Angina;Angina;Angina')
+        self.assertEqual((rows[0]['feedback_count'], rows[0]['feedback_avg_rating']), (3, 5.0))
+        # The watermark counts archived ids
+        Encounter.objects.all().delete()
+        self.assertEqual(exports.latest_encounter_id(), self.encounter.pk)
+
+    def test_view_streams_csv_for_staff_only(self):
+        self.assertEqual(self.client.get('/export/encounters').status_code, 302)
+        self.client.force_login(User.objects.create_user('analyst', password='x', is_staff=True))
+        response = self.client.get('/export/encounters', {'since_id': self.encounter.pk})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(','), exports.COLUMNS)
+        self.assertEqual(len(lines), 1 + Encounter.objects.filter(pk__gt=self.encounter.pk).count())
+        self.assertEqual(response['X-Export-Watermark'], str(Encounter.objects.latest('pk').pk))
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.world = build_world(2)
+
+    def counters(self):
+        return sorted(
+            DailyRollup.objects.filter(encounters__gt=0)
+            .values_list('date', 'doctor_id', 'specialization', 'visit_type', *rollups.COUNTERS)
+        )
+
+    def test_incremental_updates_match_a_rebuild(self):
+        rollups.rebuild(date.today() - timedelta(days=5), date.today() + timedelta(days=5))
+        patient, doctor, now = self.world['patient'], self.world['doctor'], self.world['now']
+        enc = Encounter.objects.create(patient=patient, doctor=doctor, visit_type='OPD', visit_date=now)
+        enc.status = 'NO_SHOW'
+        enc.save()
+        moved = Encounter.objects.get(pk=self.world['encounter'].pk)
+        moved.visit_date = now + timedelta(days=1)
+        moved.status = 'COMPLETED'
+        moved.save()
+        fb = Feedback.objects.create(encounter=enc, rating=2)
+        fb = Feedback.objects.get(pk=fb.pk)
+        fb.rating = 4
+        fb.save()
+
+        incremental = self.counters()
+        rollups.rebuild(date.today() - timedelta(days=5), date.today() + timedelta(days=5))
+        self.assertEqual(incremental, self.counters())
+
+    def test_refresh_picks_up_rows_written_without_signals(self):
+        rollups.refresh()
+        Encounter.objects.bulk_create([
+            Encounter(patient=self.world['patient'], doctor=self.world['doctor'], visit_type='ER',
+                      visit_date=self.world['now'] - timedelta(days=40), status='CANCELLED'),
+        ])
+        days, _ = rollups.refresh()
+        self.assertEqual(days, 1)
+        row = DailyRollup.objects.get(visit_type='ER')
+        self.assertEqual((row.encounters, row.cancelled, row.specialization), (1, 1, 'Cardiology'))
+
+    def test_dashboard_groups_by_specialization(self):
+        rollups.refresh()
+        self.client.force_login(User.objects.create_user('ops', password='x', is_staff=True))
+        today = timezone.localdate()
+        response = self.client.get('/dashboard/rollups', {
+            'from': (today - timedelta(days=2)).isoformat(), 'to': (today + timedelta(days=2)).isoformat(),
+            'group_by': 'specialization',
+        })
+        rows = response.json()['rows']
+        self.assertEqual([r['specialization'] for r in rows], ['Cardiology'])
+        self.assertEqual(rows[0]['encounters'], Encounter.objects.count())
+        self.assertEqual(rows[0]['avg_rating'], 5.0)
+        self.assertEqual(self.client.get('/dashboard/rollups', {'group_by': 'month'}).status_code, 400)
+
+
+class PatientSearchTests(TestCase):
+    def setUp(self):
+        self.asha = Patient.objects.create(first_name='Asha', last_name='Rao', dob=date(1990, 1, 1), gender='F',
+                                           phone='9876543210', email='asha@example.com', address='')
+        self.ravi = Patient.objects.create(first_name='Ravi', last_name='Iyer', dob=date(1985, 1, 1), gender='M',
+                                           phone='9123456789', email='ravi.rao@example.com', address='')
+
+    def test_substring_terms_ranked_by_field_weight(self):
+        self.assertEqual([p.pk for p in search.search_patients('rao')], [self.asha.pk, self.ravi.pk])
+        self.assertEqual([p.pk for p in search.search_patients('asha 54321')], [self.asha.pk])
+        self.assertEqual([p.pk for p in search.search_patients('RA')], [self.ravi.pk, self.asha.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.ravi.last_name = 'Menon'
+        self.ravi.save()
+        self.assertEqual([p.pk for p in search.search_patients('menon')], [self.ravi.pk])
+        Patient.objects.filter(pk=self.ravi.pk).delete()
+        self.assertEqual(search.search_patients('menon'), [])
+
+    def test_admin_search_uses_index(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        response = self.client.get('/admin/app1/patient/', {'q': '3456'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.ravi])
+
+
+@override_settings(GROQ_API_KEY='')
+class ConversationTests(TestCase):
+    def setUp(self):
+        self.world = build_world(1)
+
+    def turn(self, message):
+        body = json.dumps({'action': 'CHAT_TURN', 'data': {'message': message}})
+        return self.client.post('/api/perform_action/', body, content_type='application/json').json()
+
+    def test_existing_patient_books_in_one_call_per_message(self):
+        self.assertEqual(self.turn('I have chest pain')['step'], 'ask_patient_type')
+        self.assertEqual(self.turn('existing')['step'], 'ask_existing_id')
+        reply = self.turn(self.world['patient'].phone)
+        self.assertEqual((reply['step'], reply['patient']['patient_id']), ('ask_visit_type', self.world['patient'].pk))
+        # The problem from the first message is triaged in the same turn
+        reply = self.turn('new')
+        self.assertEqual(reply['step'], 'choose_slot')
+        self.assertEqual(reply['doctor']['specialization'], 'Cardiology')
+        slot = reply['available_slots'][1]['datetime']
+        reply = self.turn('2')
+        self.assertEqual(reply['encounter']['appointment_date'], slot)
+        encounter = Encounter.objects.get(pk=reply['encounter']['encounter_id'])
+        self.assertEqual((encounter.problem, encounter.reminders.count()), ('I have chest pain', 1))
+        reply = self.turn('yes')
+        self.assertEqual(reply['step'], 'done')
+        self.assertEqual(Encounter.objects.get(pk=encounter.pk).payment_status, 'PAID')
+
+    def test_archived_visits_are_listed_and_can_be_followed_up(self):
+        encounter = self.world['encounter']
+        archive.move([encounter.pk])
+        self.turn('I have chest pain')
+        self.turn('existing')
+        reply = self.turn(self.world['patient'].phone)
+        self.assertTrue(any(line.startswith(f'- OP {encounter.pk},') for line in reply['messages']))
+        self.turn('previous')
+        # Accepted, and the problem from the first message is triaged
+        self.assertEqual(self.turn(str(encounter.pk))['step'], 'choose_slot')
+
+    def test_idle_conversation_starts_over(self):
+        self.turn('book')
+        with self.settings(CHAT_STATE_TTL=-1):
+            reply = self.turn('existing')
+        self.assertEqual(reply['step'], 'ask_patient_type')
+
+
+@override_settings(PUSH_POLL_INTERVAL=0.01)
+class PushTests(TestCase):
+    async def next_event(self, lines):
+        while True:
+            line = await asyncio.wait_for(anext(lines), 5)
+            if line.startswith('id:'):
+                return line
+
+    async def test_events_reach_only_addressed_connections(self):
+        doctor_lines = push.stream([('doctor', 7)])
+        patient_lines = push.stream([('patient', 3)], last_event_id=0)
+        await anext(doctor_lines)
+        await anext(patient_lines)
+        missed = await PushEvent.objects.acreate(kind='reminder', data={'text': 'earlier'}, patient_id=3)
+        # Replayed from the outbox because the connection asked for events after id 0
+        self.assertIn('earlier', await self.next_event(patient_lines))
+        await PushEvent.objects.acreate(kind='slots', data={'taken': 'x'}, doctor_id=8)
+        event = await PushEvent.objects.acreate(kind='slots', data={'taken': 'y'}, doctor_id=7)
+        line = await self.next_event(doctor_lines)
+        self.assertTrue(line.startswith(f'id: {event.event_id}\nevent: slots\n'), line)
+        self.assertGreater(event.event_id, missed.event_id)
+        await doctor_lines.aclose()
+        await patient_lines.aclose()
+        self.assertEqual(push.HUB.subscribers, {})
+
+    async def test_asgi_endpoint_streams_until_disconnect(self):
+        communicator = ApplicationCommunicator(push.asgi_events, {
+            'type': 'http', 'method': 'GET', 'path': '/events', 'query_string': b'doctor_id=7', 'headers': [],
+        })
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        start = await communicator.receive_output(5)
+        self.assertEqual((start['status'], dict(start['headers'])[b'content-type']), (200, b'text/event-stream'))
+        await communicator.receive_output(5)
+        await PushEvent.objects.acreate(kind='slots', data={'taken': 'y'}, doctor_id=7)
+        self.assertIn(b'event: slots', (await communicator.receive_output(5))['body'])
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(5)
+        self.assertEqual(push.HUB.subscribers, {})
+
+    async def test_only_asgi_pages_listen(self):
+        response = await self.async_client.get('/')
+        self.assertContains(response, 'data-live-updates="on"')
+
+    def test_wsgi_has_no_event_stream(self):
+        self.assertContains(self.client.get('/'), 'data-live-updates="off"')
+        self.assertEqual(self.client.get('/events').status_code, 501)
+
+    def test_writers_prune_old_events(self):
+        old = PushEvent.objects.create(kind='slots', data={})
+        PushEvent.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=1))
+        with mock.patch.object(push, 'PRUNE_PROBABILITY', 1), self.captureOnCommitCallbacks(execute=True):
+            push.publish('slots', {}, doctor_id=7)
+        self.assertEqual(list(PushEvent.objects.values_list('doctor_id', flat=True)), [7])
+
+    def test_booking_announces_the_taken_slot(self):
+        world = build_world(1)
+        slot = timezone.localtime(world['now']) + timedelta(days=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Encounter.objects.create(patient=world['patient'], doctor=world['doctor'], visit_type='OPD',
+                                     visit_date=slot)
+        event = PushEvent.objects.get(kind='slots')
+        self.assertEqual((event.doctor_id, event.data['taken']), (world['doctor'].pk, slot.isoformat()))
+
+
+class DoctorCalendarTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(DOCTOR_CALENDAR_PATH=f'{directory.name}/calendar')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_slot_lookups_come_from_the_shared_file(self):
+        world = build_world(1)
+        doctor = world['doctor']
+        slot = availability.slot_time(timezone.localdate() + timedelta(days=2), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            encounter = Encounter.objects.create(patient=world['patient'], doctor=doctor, visit_type='OPD',
+                                                 visit_date=slot)
+        with override_settings(DOCTOR_CALENDAR_PATH=None):
+            expected = get_available_slots(doctor)
+        self.assertNotIn(slot, expected)
+        get_available_slots(doctor)  # loads the days
+        with self.assertNumQueries(0):
+            self.assertEqual(get_available_slots(doctor), expected)
+
+        # Another process mapping the same file sees the change
+        other = availability.DoctorCalendar(availability.calendar().path)
+        self.addCleanup(other.close)
+        self.assertIs(other.is_taken(doctor.pk, slot), True)
+        with self.captureOnCommitCallbacks(execute=True):
+            encounter.visit_date = slot + timedelta(hours=1)
+            encounter.save()
+        self.assertEqual((other.is_taken(doctor.pk, slot), other.is_taken(doctor.pk, encounter.visit_date)),
+                         (False, True))
+
+
+    def test_rebuild_of_the_same_day_mid_read_is_detected(self):
+        world = build_world(1)
+        slot = availability.slot_time(timezone.localdate() + timedelta(days=2), 1)
+        calendar = availability.calendar()
+        self.assertIs(calendar.is_taken(world['doctor'].pk, slot), False)
+        other = availability.DoctorCalendar(calendar.path)
+        self.addCleanup(other.close)
+
+        class RebuiltWhileRead:
+            def __getitem__(self, key):
+                # The day holds the same date afterwards, with other bits
+                Encounter.objects.bulk_create([Encounter(patient=world['patient'], doctor=world['doctor'],
+                                                         visit_type='OPD', visit_date=slot)])
+                other.rebuild()
+                return bits[key]
+
+        bits = calendar.bits
+        calendar.bits = RebuiltWhileRead()
+        try:
+            self.assertIsNone(calendar.is_taken(world['doctor'].pk, slot))
+        finally:
+            calendar.bits = bits
+        self.assertIs(availability.is_taken(world['doctor'].pk, slot), True)
+
+
+class AssignmentTests(TestCase):
+    def test_patients_spread_over_the_specialization(self):
+        doctors = [Doctor.objects.create(first_name=f'Doc{i}', last_name='Heart', specialization='Cardiology')
+                   for i in range(3)]
+        patient = Patient.objects.create(first_name='Asha', last_name='Rao', dob=date(1990, 1, 1), gender='F',
+                                         phone='9000000001', address='')
+        first = DoctorLoad.objects.get(pk=doctors[0].pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(assignment.assign('cardiology'), doctors[0])
+
+        # Taking a doctor's next free slot moves them back in the order; a
+        # visit later today only adds to their load.
+        Encounter.objects.create(patient=patient, doctor=doctors[0], visit_type='OPD', visit_date=first.next_free_at)
+        self.assertEqual(assignment.assign('Cardiology'), doctors[1])
+        midnight = timezone.localtime().replace(hour=0, minute=30, second=0, microsecond=0)
+        Encounter.objects.create(patient=patient, doctor=doctors[1], visit_type='OPD', visit_date=midnight)
+        self.assertEqual(DoctorLoad.objects.get(pk=doctors[1].pk).load, 1)
+        self.assertEqual(assignment.assign('Cardiology'), doctors[2])
+        # ...unless the patient has a doctor already: the latest visit's
+        self.assertEqual(assignment.assign('Cardiology', patient.pk), doctors[0])
+
+        # Slots that went by are recomputed when they reach the top
+        DoctorLoad.objects.filter(pk=doctors[2].pk).update(next_free_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(assignment.assign('Cardiology'), doctors[2])
+        self.assertGreater(DoctorLoad.objects.get(pk=doctors[2].pk).next_free_at, timezone.now())
+        self.assertIsNone(assignment.assign('Neurology'))
+
+
+class WaitlistTests(TestCase):
+    def test_freed_slots_go_down_the_waitlist(self):
+        doctor = Doctor.objects.create(first_name='Doc', last_name='Heart', specialization='Cardiology')
+        a, b, c, d = Patient.objects.bulk_create([
+            Patient(first_name=name, last_name='Rao', dob=date(1990, 1, 1), gender='F', phone=f'900000000{i}',
+                    address='')
+            for i, name in enumerate('abcd')
+        ])
+        day = timezone.localtime().replace(hour=10, minute=0, second=0, microsecond=0)
+        first, second, third = (day + timedelta(days=i) for i in (2, 4, 5))
+        cancelled = booking.book(a, doctor, 'cough', first)
+        moved = booking.book(b, doctor, 'cough', second)
+        # b wants their visit brought forward and outranks c, who waited longer
+        waitlist.join(c, 'Cardiology', problem='palpitations')
+        waitlist.join(b, 'Cardiology', doctor=doctor, encounter=moved, priority=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booked = waitlist.cancel(Encounter.objects.select_related('doctor').get(pk=cancelled.pk))
+        # b moves into the cancelled slot, and c into the one b left
+        self.assertEqual([entry.patient_id for entry in booked], [b.pk, c.pk])
+        moved.refresh_from_db()
+        self.assertEqual(moved.visit_date, first)
+        self.assertEqual(Reminder.objects.get(encounter=moved).remind_at, first - timedelta(hours=24))
+        self.assertEqual(Encounter.objects.get(patient=c).visit_date, second)
+        self.assertFalse(ReminderDue.objects.filter(reminder__encounter_id=cancelled.pk).exists())
+        self.assertEqual(PushEvent.objects.filter(kind='waitlist').count(), 2)
+        self.assertTrue(booking.slot_taken(doctor.pk, first))
+
+        # Nobody is left waiting: a rescheduled slot just comes free
+        waitlist.join(d, 'cardiology', wanted_before=first)
+        self.assertEqual(waitlist.reschedule(moved, third), [])
+        self.assertFalse(booking.slot_taken(doctor.pk, first))
+        self.assertEqual(WaitlistEntry.objects.filter(status='WAITING').count(), 1)
+
+    def test_backfill_sees_the_slot_freed_in_its_transaction(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        doctor = Doctor.objects.create(first_name='Doc', last_name='Heart', specialization='Cardiology')
+        a, b = Patient.objects.bulk_create([
+            Patient(first_name=name, last_name='Rao', dob=date(1990, 1, 1), gender='F', phone=f'900000000{i}',
+                    address='')
+            for i, name in enumerate('ab')
+        ])
+        slot = availability.slot_time(timezone.localdate() + timedelta(days=2), 1)
+        # The shared calendar only learns of the cancellation on commit
+        with override_settings(DOCTOR_CALENDAR_PATH=f'{directory.name}/calendar'):
+            with self.captureOnCommitCallbacks(execute=True):
+                cancelled = booking.book(a, doctor, 'cough', slot)
+            self.assertIs(availability.is_taken(doctor.pk, slot), True)
+            waitlist.join(b, 'cardiology')
+            with self.captureOnCommitCallbacks(execute=True):
+                booked = waitlist.cancel(Encounter.objects.select_related('doctor').get(pk=cancelled.pk))
+            self.assertEqual([entry.patient_id for entry in booked], [b.pk])
+            self.assertIs(availability.is_taken(doctor.pk, slot), True)
+
+
+    def test_appointments_whose_doctor_is_gone(self):
+        world = build_world(1)
+        upcoming = world['upcoming']
+        later = Encounter.objects.create(patient=world['patient'], doctor=world['doctor'], visit_type='OPD',
+                                         visit_date=upcoming.visit_date + timedelta(days=1))
+        world['doctor'].delete()
+
+        def perform(action, encounter):
+            body = json.dumps({'action': action, 'data': {'encounter_id': encounter.pk}})
+            return self.client.post('/api/perform_action/', body, content_type='application/json')
+
+        self.assertEqual(perform('RESCHEDULE_APPOINTMENT', later).status_code, 409)
+        response = perform('CANCEL_APPOINTMENT', upcoming)
+        self.assertEqual((response.status_code, response.json()['backfilled']), (200, []))
+        self.assertEqual(Encounter.objects.get(pk=upcoming.pk).status, 'CANCELLED')
+        self.assertEqual(WaitlistEntry.objects.filter(status='WAITING').count(), 1)
+
+
+    def test_booking_refuses_taken_and_past_slots(self):
+        world = build_world(1)
+        slot = timezone.localtime(world['upcoming'].visit_date)
+
+        def book(slot_choice, action='BOOK_APPOINTMENT'):
+            body = json.dumps({'action': action, 'data': {
+                'patient_id': world['patient'].pk, 'doctor_id': world['doctor'].pk, 'problem': 'cough',
+                'slot_choice': slot_choice,
+            }})
+            return self.client.post('/api/perform_action/', body, content_type='application/json')
+
+        self.assertEqual(book(slot.isoformat()).status_code, 409)
+        # A naive slot is local time, so this is the same one
+        self.assertEqual(book(slot.replace(tzinfo=None).isoformat(), 'CREATE_ENCOUNTER').status_code, 409)
+        self.assertEqual(book((slot - timedelta(days=2)).isoformat()).status_code, 400)
+        self.assertEqual(book('soon').status_code, 400)
+        self.assertEqual(Encounter.objects.filter(visit_date=slot).count(), 1)
+
+        free = slot + timedelta(days=1)
+        response = book(free.replace(tzinfo=None).isoformat())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Encounter.objects.get(pk=response.json()['encounter']['encounter_id']).visit_date, free)
+
+
+class EncounterAdminTests(TestCase):
+    def setUp(self):
+        self.world = build_world(10)
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        counts = []
+        for extra in (0, 20):
+            Encounter.objects.bulk_create([
+                Encounter(patient=self.world['patient'], doctor=self.world['doctor'], visit_type='OPD',
+                          visit_date=self.world['now'] - timedelta(days=i))
+                for i in range(extra)
+            ])
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get('/admin/app1/encounter/')
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        day = timezone.localtime(self.world['now'])
+        response = self.client.get('/admin/app1/encounter/', {
+            'visit_date__year': day.year, 'visit_date__month': day.month,
+        })
+        self.assertContains(response, f'visit_date__day={day.day}')
+
+    def test_cancel_action_frees_the_slot_for_the_waitlist(self):
+        upcoming = self.world['upcoming']
+        Reminder.objects.create(encounter=upcoming, remind_at=self.world['now'])
+        self.client.post('/admin/app1/encounter/', {
+            'action': 'mark_cancelled', '_selected_action': [upcoming.pk],
+        })
+        self.assertEqual(Encounter.objects.get(pk=upcoming.pk).status, 'CANCELLED')
+        self.assertFalse(ReminderDue.objects.filter(reminder__encounter=upcoming).exists())
+        # The longest-waiting cardiology patient gets the slot
+        entry = WaitlistEntry.objects.get(status='BOOKED')
+        self.assertEqual(entry.encounter.doctor_id, upcoming.doctor_id)
+        self.assertEqual(entry.encounter.visit_date, upcoming.visit_date)
+        day = rollups.local_date(upcoming.visit_date)
+        self.assertEqual(DailyRollup.objects.get(date=day, doctor_id=upcoming.doctor_id, visit_type='FU').cancelled, 1)
+
+    def test_bulk_status_action_updates_rollups(self):
+        encounter = self.world['encounter']
+        rollups.rebuild(timezone.localdate() - timedelta(days=2), timezone.localdate())
+        self.client.post('/admin/app1/encounter/', {
+            'action': 'mark_no_show', '_selected_action': [encounter.pk],
+        })
+        self.assertEqual(Encounter.objects.get(pk=encounter.pk).status, 'NO_SHOW')
+        day = rollups.local_date(encounter.visit_date)
+        self.assertEqual(DailyRollup.objects.get(date=day, visit_type='OPD').no_shows, 1)
+
+
+class StaticAssetTests(TestCase):
+    def test_collected_chat_assets_are_hashed_compressed_and_immutable(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root, DEBUG=False):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            page = self.client.get('/').content.decode()
+            url = re.search(r'src="(/static/chat/chat\.[0-9a-f]{12}\.js)"', page).group(1)
+
+            response = self.client.get(url, headers={'accept-encoding': 'gzip, br;q=0'})
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(
+                gzip.decompress(b''.join(response.streaming_content)),
+                (Path(root) / url.removeprefix('/static/')).read_bytes(),
+            )
+            response.close()
+
+            again = self.client.get(url, headers={'accept-encoding': 'gzip', 'if-none-match': response['ETag']})
+            self.assertEqual(again.status_code, 304)
+
+
+class ReminderQueueTests(TestCase):
+    def test_only_due_reminders_are_dispatched_and_dequeued(self):
+        encounter = build_world(1)['encounter']
+        now = timezone.now()
+        due = Reminder.objects.create(encounter=encounter, remind_at=now - timedelta(minutes=5), method='EMAIL')
+        later = Reminder.objects.create(encounter=encounter, remind_at=now + timedelta(days=1), method='EMAIL')
+        Reminder.objects.create(encounter=encounter, remind_at=now - timedelta(days=3), health_check_done=True)
+        self.assertEqual(list(reminders.due(now)), [due.pk])
+
+        # Rescheduling moves the queue entry to the new bucket
+        later.remind_at = now - timedelta(minutes=1)
+        later.save()
+        self.assertEqual(list(reminders.due(now)), [due.pk, later.pk])
+
+        call_command('process_reminders', stdout=StringIO())
+        self.assertFalse(ReminderDue.objects.exists())
+        self.assertEqual(Reminder.objects.filter(health_check_done=False).count(), 0)
+
+
+class ArchiveTests(TestCase):
+    def test_old_closed_encounters_move_with_their_children(self):
+        self.assertEqual(archive.unmapped_children(), [])
+        world = build_world(3)
+        old = world['encounter']
+        old.visit_date = archive.months_ago(30)
+        old.status = 'COMPLETED'
+        old.save()
+        Reminder.objects.create(encounter=old, remind_at=timezone.now() + timedelta(days=1))
+        daily = rollups.compute(date(2000, 1, 1), date.today())
+
+        call_command('archive_encounters', stdout=StringIO())
+        self.assertFalse(Encounter.objects.filter(pk=old.pk).exists())
+        self.assertEqual(ArchivedEncounter.objects.get().pk, old.pk)
+        self.assertEqual(ArchivedLabResult.objects.count(), 3)
+        self.assertFalse(ReminderDue.objects.exists())
+        self.assertEqual(rollups.compute(date(2000, 1, 1), date.today()), daily)
+
+        # History pages run from the hot rows into the archived one
+        patient = world['patient'].pk
+        first, cursor = archive.patient_history(patient, limit=3)
+        rest, end = archive.patient_history(patient, before=cursor, limit=3)
+        self.assertEqual([row['encounter_id'] for row in first + rest][-1], old.pk)
+        self.assertEqual(len(first + rest), 4)
+        self.assertIsNone(end)
+        self.assertEqual(len(archive.patient_lab_results(patient)[0]), 3)
+
+
+class LabTests(TestCase):
+    def test_values_parsed_on_save_and_trends_computed_per_test(self):
+        self.assertEqual(labs.parse_value('1,200 cells'), 1200)
+        self.assertEqual(labs.parse_value('<0.5'), 0.5)
+        self.assertIsNone(labs.parse_value('Negative'))
+        self.assertEqual(labs.parse_range('0.4 – 4.0'), (0.4, 4.0))
+        self.assertEqual(labs.parse_range('< 200'), (None, 200))
+
+        world = build_world(1)
+        patient = world['patient']
+        today = date.today()
+        for days, value in ((30, '5.0'), (20, '5.5'), (10, '6.0'), (0, 'pending')):
+            LabResult.objects.create(patient=patient, test_name='HbA1c', result_value=value, result_unit='%',
+                                     reference_range='4.0-5.6', test_date=today - timedelta(days=days))
+        high = LabResult.objects.create(patient=patient, test_name='TSH', result_value='6.1', reference_range='0.4-4.0',
+                                        test_date=today)
+        self.assertEqual((high.value_numeric, high.range_high, high.abnormal), (6.1, 4.0, True))
+
+        hba1c, tsh = labs.trends(patient.pk, points=3)
+        # The fixture's reading of today (5.6) plus the four above
+        self.assertEqual((hba1c['count'], hba1c['numeric_count'], hba1c['abnormal_count']), (5, 4, 1))
+        self.assertAlmostEqual(hba1c['slope_per_day'], 0.023)
+        self.assertEqual([p['flag'] for p in hba1c['points']], ['H', 'N', None])
+        self.assertEqual(hba1c['points'][0]['delta'], 0.5)
+        self.assertEqual(tsh['latest']['flag'], 'H')
+        self.assertIsNone(tsh['slope_per_day'])
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.login(username='admin', password='pw')
+        response = self.client.get('/dashboard/abnormal_labs').json()
+        self.assertEqual(response['counts'], {'TSH': 1})
+        self.assertEqual(response['results'][0]['lab_id'], high.pk)
+
+
+class EwsTests(TestCase):
+    def test_scores_follow_new_readings_and_bulk_recompute_agrees(self):
+        self.assertEqual(ews.parse_blood_pressure('118 / 76 mmHg'), (118, 76))
+        systolic, diastolic = ews.parse_blood_pressures(['120/80', '95/60 sitting', 'n/a'])
+        self.assertEqual(systolic[:2].tolist(), [120, 95])
+        self.assertTrue(math.isnan(diastolic[2]))
+
+        world = build_world(1)
+        encounter, now = world['encounter'], world['now']
+        self.assertEqual(encounter.risk.score, 0)
+        # SpO2 92 (2) + systolic 95 (2) + pulse 115 (2) + 38.5° (1)
+        sick = Vital.objects.create(encounter=encounter, temperature=38.5, heart_rate=115, blood_pressure='95/60',
+                                    oxygen_saturation=92, recorded_at=now + timedelta(minutes=20))
+        self.assertEqual((sick.systolic, sick.news_score), (95, 7))
+        # An older reading counts but does not replace the latest
+        Vital.objects.create(encounter=encounter, temperature=37.0, heart_rate=45, blood_pressure='120/80',
+                             oxygen_saturation=98, recorded_at=now - timedelta(hours=1))
+        risk = EncounterRisk.objects.get(pk=encounter.pk)
+        self.assertEqual((risk.score, risk.peak_score, risk.readings, risk.last_vital_id), (7, 7, 3, sick.pk))
+        self.assertEqual(ews.level(risk.score, risk.red_flag), 'HIGH')
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.login(username='admin', password='pw')
+        response = self.client.get('/dashboard/high_risk', {'ward': 'OPD'}).json()
+        self.assertEqual([e['encounter_id'] for e in response['encounters']], [encounter.pk])
+        self.assertEqual(self.client.get('/dashboard/high_risk', {'ward': 'ER'}).json()['encounters'], [])
+
+        sick.delete()
+        risk.refresh_from_db()
+        self.assertEqual((risk.score, risk.peak_score, risk.readings), (0, 1, 2))
+        Vital.objects.update(news_score=None)
+        EncounterRisk.objects.all().delete()
+        call_command('recompute_ews', stdout=StringIO())
+        self.assertEqual(EncounterRisk.objects.get(pk=encounter.pk).peak_score, 1)
+        self.assertEqual(Vital.objects.filter(news_score=None).count(), 0)
+
+
+class StartupTests(SimpleTestCase):
+    def test_batch_commands_do_not_import_the_web_stack(self):
+        modules = {name for name, _, _ in import_times('process_reminders')}
+        self.assertIn('app1.push', modules)
+        self.assertFalse({'requests', 'app1.views', 'app1.conversation'} & modules)
+
+
+class LogTests(SimpleTestCase):
+    def test_json_lines_written_in_the_background_and_sampled(self):
+        stream = StringIO()
+        handler = log.BackgroundHandler(stream)
+        handler.addFilter(log.SampleFilter({'action': 0}))
+        logger = logging.getLogger('tests.log')
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        logger.info('action', extra={'action': 'BOOK_APPOINTMENT'})
+        logger.warning('action', extra={'action': 'SEND_EMAIL', 'encounter_id': 7, 'latency_ms': 12.5})
+        logger.info('email_%s', 'failed')
+        handler.stop()
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line['event'] for line in lines], ['action', 'email_failed'])
+        self.assertEqual(
+            {k: lines[0][k] for k in ('level', 'action', 'encounter_id', 'latency_ms')},
+            {'level': 'WARNING', 'action': 'SEND_EMAIL', 'encounter_id': 7, 'latency_ms': 12.5},
+        )
+
+
+class DispatchTests(TestCase):
+    CHANNELS = {
+        'EMAIL': {'BACKEND': 'app1.dispatch.LocmemChannel', 'CONCURRENCY': 2,
+                  'OPTIONS': {'fail_for': ['bounce@example.com']}},
+        'CALL': {'BACKEND': 'app1.dispatch.LocmemChannel', 'CONCURRENCY': 1, 'OPTIONS': {'delay': 0.5}},
+    }
+
+    def setUp(self):
+        dispatch.LocmemChannel.outbox.clear()
+
+    def test_slow_channel_does_not_hold_up_the_others(self):
+        with dispatch.Dispatcher(self.CHANNELS) as dispatcher:
+            call = dispatcher.submit(dispatch.Delivery(1, 'CALL', '900', '', 'call'))
+            emails = [dispatcher.submit(dispatch.Delivery(i, 'EMAIL', f'{i}@example.com', 's', 'b'))
+                      for i in range(2, 6)]
+            for email in emails:
+                self.assertEqual(email.result(timeout=0.4).status, 'SENT')
+            self.assertFalse(call.done())
+        self.assertEqual(call.result().status, 'SENT')
+        self.assertEqual(dispatcher.submit(dispatch.Delivery(1, 'SMS', '900', '', '')).result().status, 'FAILED')
+
+    @override_settings(REMINDER_CHANNELS={**CHANNELS, 'CALL': {'BACKEND': 'app1.dispatch.LocmemChannel'}})
+    def test_process_reminders_records_every_attempt(self):
+        world = build_world(1)
+        past = timezone.now() - timedelta(minutes=1)
+        call = Reminder.objects.create(encounter=world['encounter'], remind_at=past, method='CALL')
+        Patient.objects.filter(pk=world['patient'].pk).update(email='bounce@example.com')
+        call_command('process_reminders', stdout=StringIO())
+        attempts = {(a.channel, a.status) for a in ReminderAttempt.objects.filter(reminder=call)}
+        self.assertEqual(attempts, {('CALL', 'SENT'), ('EMAIL', 'FAILED')})
+        self.assertEqual(len(dispatch.LocmemChannel.outbox['CALL']), 1)
+
+    @override_settings(REMINDER_CHANNELS={**CHANNELS, 'CALL': {'BACKEND': 'app1.dispatch.LocmemChannel'}})
+    def test_failed_deliveries_are_retried_on_their_channel(self):
+        world = build_world(1)
+        past = timezone.now() - timedelta(minutes=1)
+        call = Reminder.objects.create(encounter=world['encounter'], remind_at=past, method='CALL')
+        Patient.objects.filter(pk=world['patient'].pk).update(email='bounce@example.com')
+
+        def run():
+            call_command('process_reminders', stdout=StringIO())
+            due = ReminderDue.objects.first()
+            # Bring the retry forward
+            ReminderDue.objects.update(remind_at=past, bucket=reminders.bucket_of(past))
+            return due
+
+        due = run()
+        self.assertGreater(due.remind_at, timezone.now() + timedelta(minutes=10))
+        self.assertFalse(Reminder.objects.get(pk=call.pk).health_check_done)
+        self.assertIsNotNone(run())
+        # The third failure is the last
+        self.assertIsNone(run())
+        self.assertEqual(ReminderAttempt.objects.filter(reminder=call, channel='EMAIL', status='FAILED').count(), 3)
+        # The call went out the first time and was not repeated
+        self.assertEqual(len(dispatch.LocmemChannel.outbox['CALL']), 1)
+
+        email = Reminder.objects.create(encounter=world['encounter'], remind_at=past, method='EMAIL')
+        self.assertIsNotNone(run())
+        Patient.objects.filter(pk=world['patient'].pk).update(email='asha@example.com')
+        self.assertIsNone(run())
+        self.assertEqual(ReminderAttempt.objects.filter(reminder=email).count(), 2)
+        self.assertEqual(len(dispatch.LocmemChannel.outbox['EMAIL']), 1)
+
+
+class IdempotencyTests(TestCase):
+    PATIENT = {'first_name': 'Asha', 'last_name': 'Rao', 'dob': '1990-01-01', 'gender': 'F',
+               'phone': '9000000001', 'blood_group': 'O+'}
+
+    def register(self, key, **changes):
+        body = json.dumps({'action': 'REGISTER_PATIENT', 'data': {**self.PATIENT, **changes}})
+        return self.client.post('/api/perform_action/', body, content_type='application/json',
+                                headers={'idempotency-key': key})
+
+    def test_retry_gets_the_stored_response(self):
+        first = self.register('k1')
+        retry = self.register('k1')
+        self.assertEqual(Patient.objects.count(), 1)
+        self.assertEqual((retry.status_code, retry.content), (200, first.content))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.register('k1', phone='9000000002').status_code, 422)
+        self.register('k2')
+        self.assertEqual(Patient.objects.count(), 2)
+
+    def test_keys_are_scoped_to_the_session(self):
+        other = Client()
+        for client in (self.client, other):
+            client.get('/')
+        first = self.register('k1')
+        # Another session's key of the same name is not a retry of this one
+        body = json.dumps({'action': 'REGISTER_PATIENT', 'data': {**self.PATIENT, 'phone': '9000000002'}})
+        response = other.post('/api/perform_action/', body, content_type='application/json',
+                              headers={'idempotency-key': 'k1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Patient.objects.count(), 2)
+        self.assertEqual(self.register('k1').content, first.content)
+
+    @override_settings(METRICS_MULTIPROC_DIR=None)
+    def test_replays_are_counted_as_requests(self):
+        def requests():
+            return metrics.REGISTRY.collect()['chatbot_action_requests_total'].get(('REGISTER_PATIENT',), [0])[0]
+
+        before = requests()
+        self.register('k1')
+        self.assertEqual(self.register('k1')['Idempotent-Replayed'], 'true')
+        self.assertEqual(requests() - before, 2)
+
+    def test_page_sends_keys_for_the_same_actions(self):
+        source = (Path(__file__).parent / 'static' / 'chat' / 'chat.js').read_text()
+        mutating = re.search(r'const MUTATING = new Set\(\[(.*?)\]\)', source, re.S).group(1)
+        self.assertEqual(set(re.findall(r"'([A-Z_]+)'", mutating)), idempotency.ACTIONS)
+
+    def test_retried_waitlist_join_is_stored_once(self):
+        world = build_world(1)
+        body = json.dumps({
+            'action': 'JOIN_WAITLIST', 'data': {'patient_id': world['patient'].pk, 'problem': 'chest pain'},
+        })
+        for _ in range(2):
+            self.client.post('/api/perform_action/', body, content_type='application/json',
+                             headers={'idempotency-key': 'k1'})
+        self.assertEqual(WaitlistEntry.objects.filter(patient=world['patient']).count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT=0.1)
+    def test_duplicate_waits_for_the_running_request(self):
+        body = json.dumps({'action': 'REGISTER_PATIENT', 'data': self.PATIENT}).encode()
+        IdempotencyRecord.objects.create(key=idempotency.record_key('addr:127.0.0.1', 'k1'),
+                                         request_hash=idempotency.request_hash(body),
+                                         created_at=timezone.now())
+        self.assertEqual(self.register('k1').status_code, 409)
+        self.assertFalse(Patient.objects.exists())
+        # A request that never finished is taken over once it is stale
+        IdempotencyRecord.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.register('k1').status_code, 200)
+        self.assertEqual(IdempotencyRecord.objects.get().status_code, 200)
+        self.assertEqual(Patient.objects.count(), 1)
+
+
+@override_settings(METRICS_MULTIPROC_DIR=None)
+class MetricsTests(TestCase):
+    def requests(self, action):
+        values = metrics.REGISTRY.collect()['chatbot_action_requests_total']
+        return values.get((action,), [0])[0]
+
+    def test_actions_are_recorded_and_exposed(self):
+        before = self.requests('LIST_DOCTORS'), self.requests('SEND_EMAIL')
+        for action in ('LIST_DOCTORS', 'SEND_EMAIL'):
+            self.client.post('/api/perform_action/', json.dumps({'action': action, 'data': {}}),
+                             content_type='application/json')
+        self.assertEqual((self.requests('LIST_DOCTORS'), self.requests('SEND_EMAIL')), (before[0] + 1, before[1] + 1))
+        self.assertGreaterEqual(metrics.REGISTRY.collect()['chatbot_action_errors_total'][('SEND_EMAIL',)][0], 1)
+
+        response = self.client.get('/metrics')
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE chatbot_action_latency_seconds histogram', body)
+        self.assertIn(f'chatbot_action_requests_total{{action="LIST_DOCTORS"}} {before[0] + 1:g}', body)
+        self.assertRegex(body, r'chatbot_action_latency_seconds_bucket\{action="LIST_DOCTORS",le="\+Inf"\} \d+')
+
+    def test_forked_worker_keeps_what_it_records_before_flushing(self):
+        metrics.ACTION_REQUESTS.inc(action='PARENT')
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                metrics.ACTION_REQUESTS.inc(action='CHILD')
+                os.write(write, json.dumps(metrics.REGISTRY.snapshot()['chatbot_action_requests_total']).encode())
+            finally:
+                os._exit(0)
+        os.close(write)
+        with os.fdopen(read) as f:
+            child = json.load(f)
+        os.waitpid(pid, 0)
+        # The parent's values stay with the parent's dump
+        self.assertEqual(child, [[['CHILD'], [1.0]]])
+
+
+@override_settings(DEBUG=True, SQL_PROFILER_N_PLUS_ONE_THRESHOLD=3)
+class QueryProfilerTests(TestCase):
+    def history(self, world):
+        body = json.dumps({'action': 'GET_PATIENT_HISTORY', 'data': {'patient_id': world['patient'].pk}})
+        return self.client.post('/api/perform_action/', body, content_type='application/json')
+
+    def test_debug_headers_flag_repeated_queries(self):
+        world = build_world(5)
+        response = self.history(world)
+        self.assertEqual((response['X-DB-Query-Count'], response['X-DB-Duplicate-Queries']), ('1', '0'))
+        self.assertNotIn('X-DB-N-Plus-One', response)
+
+        history = archive.patient_history
+
+        def with_n_plus_one(*args):
+            # One query per row: the N+1 the profiler exists to catch
+            encounters, cursor = history(*args)
+            for enc in encounters:
+                Encounter.objects.get(pk=enc['encounter_id'])
+            return encounters, cursor
+
+        with mock.patch.object(archive, 'patient_history', with_n_plus_one):
+            response = self.history(world)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response['X-DB-Query-Count'], response['X-DB-Duplicate-Queries']), ('7', '5'))
+        self.assertRegex(response['X-DB-N-Plus-One'], r'^6x [0-9a-f]{12}$')
+
+
+# ---------------------------------------------------------------------------
+# Query budgets
+# ---------------------------------------------------------------------------
+#
+# Maximum number of queries each perform_action action may issue. Every action
+# is run against fixtures with 1, 10 and 100 related rows and must stay within
+# its budget *and* issue the same number of queries at every size, so an N+1
+# (a lazy foreign key or related manager hit inside a loop) fails here.
+
+QUERY_BUDGETS = {
+    'REGISTER_PATIENT': 1,
+    'VALIDATE_PATIENT': 2,
+    'SEARCH_PATIENTS': 1,
+    'ASSIGN_DOCTOR': 2,
+    'CREATE_ENCOUNTER': 8,
+    'BOOK_APPOINTMENT': 8,
+    # Both free a slot and book a waitlisted patient into it (app1.waitlist)
+    'CANCEL_APPOINTMENT': 22,
+    'RESCHEDULE_APPOINTMENT': 24,
+    'JOIN_WAITLIST': 2,
+    'SEND_EMAIL': 1,
+    'SCHEDULE_REMINDER': 3,
+    'POST_VISIT_FEEDBACK': 3,
+    'GET_VISIT_SUMMARY': 6,
+    'UPDATE_PAYMENT_STATUS': 2,
+    # 9 when the follow-up takes the doctor's next free slot (app1.assignment)
+    'SCHEDULE_FOLLOW_UP': 9,
+    'CHECK_FOLLOW_UP_STATUS': 1,
+    'LIST_DOCTORS': 1,
+    'GET_PATIENT_HISTORY': 1,
+    'GET_LAB_REPORTS': 1,
+    'GET_LAB_TRENDS': 1,
+    'CHAT_TURN': 4,
+}
+
+FIXTURE_SIZES = (1, 10, 100)
+
+
+def build_world(n):
+    """A patient, doctor and encounter with `n` rows of every related kind."""
+    now = timezone.now().replace(minute=0, second=0, microsecond=0)
+    doctors = Doctor.objects.bulk_create([
+        Doctor(first_name=f'Doc{i}', last_name='Heart', specialization='Cardiology') for i in range(n)
+    ])
+    doctor = doctors[0]
+    patient = Patient.objects.create(
+        first_name='Asha', last_name='Rao', dob=date(1990, 1, 1), gender='F',
+        phone='9000000001', email='asha@example.com', address='', blood_group='O+',
+    )
+    others = Patient.objects.bulk_create([
+        Patient(first_name='Other', last_name=str(i), dob=date(1980, 1, 1), gender='M',
+                phone=f'8{i:09d}', address='')
+        for i in range(n)
+    ])
+    encounter = Encounter.objects.create(
+        patient=patient, doctor=doctor, visit_type='OPD', visit_date=now - timedelta(days=1),
+        problem='chest pain', notes='chest pain',
+    )
+    # Upcoming follow-ups with different doctors fill the doctor's calendar
+    # and the patient's history.
+    upcoming = Encounter.objects.bulk_create([
+        Encounter(patient=patient, doctor=doctors[i % len(doctors)], visit_type='FU',
+                  visit_date=now + timedelta(hours=i + 1), problem='follow-up')
+        for i in range(n)
+    ])[0]
+    # Other patients waiting for any cardiologist
+    WaitlistEntry.objects.bulk_create([
+        WaitlistEntry(patient=other, specialization='cardiology', problem='palpitations',
+                      created_at=now - timedelta(hours=i))
+        for i, other in enumerate(others)
+    ])
+    today = date.today()
+    Medication.objects.bulk_create([
+        Medication(patient=patient, encounter=encounter, name=f'Med{i}', dosage='5mg',
+                   frequency='daily', start_date=today)
+        for i in range(n)
+    ])
+    Diagnosis.objects.bulk_create([
+        Diagnosis(encounter=encounter, diagnosis_code=f'I{i:02d}', description='Angina') for i in range(n)
+    ])
+    Vital.objects.bulk_create([
+        ews.score(Vital(encounter=encounter, temperature=37.0, heart_rate=80, blood_pressure='120/80',
+                        oxygen_saturation=98, recorded_at=now))
+        for i in range(n)
+    ])
+    ews.recompute_encounter(encounter.pk)
+    LabResult.objects.bulk_create([
+        labs.parse(LabResult(patient=patient, encounter=encounter, test_name='HbA1c', result_value='5.6',
+                             result_unit='%', reference_range='4.0-5.6', test_date=today - timedelta(days=i)))
+        for i in range(n)
+    ])
+    Feedback.objects.bulk_create([
+        Feedback(encounter=encounter, rating=5, comments='ok') for i in range(n)
+    ])
+    assignment.rebuild()
+    return {'patient': patient, 'doctor': doctor, 'encounter': encounter, 'upcoming': upcoming, 'now': now}
+
+
+def _slot(w):
+    return (timezone.localtime(w['now']) + timedelta(days=3)).replace(hour=10).isoformat()
+
+
+ACTION_PAYLOADS = {
+    'REGISTER_PATIENT': lambda w: {
+        'first_name': 'New', 'last_name': 'Patient', 'dob': '1995-05-05', 'gender': 'M',
+        'phone': '7000000000', 'blood_group': 'A+',
+    },
+    'VALIDATE_PATIENT': lambda w: {'phone': w['patient'].phone},
+    'SEARCH_PATIENTS': lambda w: {'query': 'asha rao'},
+    'ASSIGN_DOCTOR': lambda w: {'problem': 'chest pain'},
+    'CREATE_ENCOUNTER': lambda w: {
+        'patient_id': w['patient'].pk, 'doctor_id': w['doctor'].pk, 'problem': 'cough', 'slot_choice': _slot(w),
+    },
+    'BOOK_APPOINTMENT': lambda w: {
+        'patient_id': w['patient'].pk, 'doctor_id': w['doctor'].pk, 'problem': 'cough', 'slot_choice': _slot(w),
+    },
+    'CANCEL_APPOINTMENT': lambda w: {'encounter_id': w['upcoming'].pk},
+    'RESCHEDULE_APPOINTMENT': lambda w: {'encounter_id': w['upcoming'].pk, 'slot_choice': _slot(w)},
+    'JOIN_WAITLIST': lambda w: {'patient_id': w['patient'].pk, 'problem': 'chest pain', 'priority': 1},
+    'SEND_EMAIL': lambda w: {'encounter_id': w['encounter'].pk},
+    'SCHEDULE_REMINDER': lambda w: {
+        'encounter_id': w['encounter'].pk, 'remind_at': w['now'].isoformat(),
+    },
+    'POST_VISIT_FEEDBACK': lambda w: {'encounter_id': w['encounter'].pk, 'rating': 4, 'comments': 'good'},
+    'GET_VISIT_SUMMARY': lambda w: {'encounter_id': w['encounter'].pk},
+    'UPDATE_PAYMENT_STATUS': lambda w: {'encounter_id': w['encounter'].pk, 'payment_status': 'PAID'},
+    'SCHEDULE_FOLLOW_UP': lambda w: {'encounter_id': w['encounter'].pk},
+    'CHECK_FOLLOW_UP_STATUS': lambda w: {'patient_id': w['patient'].pk},
+    'LIST_DOCTORS': lambda w: {},
+    'GET_PATIENT_HISTORY': lambda w: {'patient_id': w['patient'].pk},
+    'GET_LAB_REPORTS': lambda w: {'patient_id': w['patient'].pk},
+    'GET_LAB_TRENDS': lambda w: {'patient_id': w['patient'].pk},
+    'CHAT_TURN': lambda w: {'message': 'book'},
+}
+
+
+@override_settings(
+    GROQ_API_KEY='',
+    EMAIL_HOST='smtp.example.com',
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class QueryBudgetTests(TestCase):
+    def measure(self, action, n):
+        """Build fixtures of size `n`, run `action` once and roll everything back.
+        Returns (status_code, captured queries)."""
+        # Start each run without a session cookie; the previous run's session was rolled back
+        self.client.cookies.clear()
+        with transaction.atomic():
+            world = build_world(n)
+            body = json.dumps({'action': action, 'data': ACTION_PAYLOADS[action](world)})
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post('/api/perform_action/', body, content_type='application/json')
+            transaction.set_rollback(True)
+        return response.status_code, ctx.captured_queries
+
+    def test_every_action_has_a_budget(self):
+        source = (Path(__file__).parent / 'views.py').read_text()
+        actions = set(re.findall(r"action == '([A-Z_]+)'", source))
+        self.assertEqual(actions - set(QUERY_BUDGETS), set(), 'Declare a query budget for new actions')
+        self.assertEqual(set(QUERY_BUDGETS) - set(ACTION_PAYLOADS), set())
+
+    def test_query_counts_are_within_budget_and_constant(self):
+        for action, budget in QUERY_BUDGETS.items():
+            with self.subTest(action=action):
+                runs = {n: self.measure(action, n) for n in FIXTURE_SIZES}
+                for n, (status, _) in runs.items():
+                    self.assertLess(status, 400, f'{action} failed with {status} at size {n}')
+                counts = {n: len(queries) for n, (_, queries) in runs.items()}
+                worst = max(runs, key=lambda n: counts[n])
+                if max(counts.values()) > budget or len(set(counts.values())) > 1:
+                    sql = '\n'.join(
+                        f'  {i + 1}. {q["sql"]}' for i, q in enumerate(runs[worst][1])
+                    )
+                    self.fail(
+                        f'{action}: budget {budget}, queries by fixture size {counts}.\n'
+                        f'Queries at size {worst}:\n{sql}'
+                    )
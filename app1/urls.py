@@ -4,4 +4,10 @@ from . import views
 urlpatterns = [
     path('', views.index, name='chat_index'),
     path('api/perform_action/', views.perform_action, name='perform_action'),
+    path('events', views.events, name='events'),
+    path('metrics', views.metrics, name='metrics'),
+    path('export/encounters', views.export_encounters, name='export_encounters'),
+    path('dashboard/rollups', views.dashboard_rollups, name='dashboard_rollups'),
+    path('dashboard/abnormal_labs', views.abnormal_labs, name='abnormal_labs'),
+    path('dashboard/high_risk', views.high_risk, name='high_risk'),
 ]
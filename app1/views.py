@@ -1,108 +1,191 @@
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.core.handlers.asgi import ASGIRequest
+from django.contrib.admin.views.decorators import staff_member_required
 from django.utils import timezone
 import json
-from datetime import datetime, timedelta, time
+from datetime import date, datetime, timedelta, time
 from django.core.mail import send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
+import logging
 
 from .models import Patient, Doctor, Encounter, Reminder, Feedback
 from django.conf import settings
-from . import llm
+from . import metrics as app_metrics
+from . import exports
+from . import rollups
+from . import search
+from . import conversation
+from . import push
+from . import idempotency
+from . import archive
+from . import labs
+from . import ews
+from . import waitlist
+from .booking import (
+	map_symptom_to_specialization, find_doctor_for_specialization, choose_appointment_slot,
+	get_available_slots, slot_options, slot_taken, book,
+)
+
+
+logger = logging.getLogger('app1.views')
 
 
 def index(request):
-	return render(request, 'chat.html')
+	# Start the session now, so the page's first action is already scoped to
+	# it (Idempotency-Key, see app1.idempotency)
+	if not request.session.session_key:
+		request.session.save()
+	# Live updates (/events) need ASGI; see events()
+	return render(request, 'chat.html', {'live_updates': isinstance(request, ASGIRequest)})
+
+
+def metrics(request):
+	return HttpResponse(
+		app_metrics.REGISTRY.render(),
+		content_type='text/plain; version=0.0.4; charset=utf-8',
+	)
+
+
+def events(request):
+	"""/events is only served under ASGI, by push.asgi_events (see
+	HospitalChatbot/asgi.py). Under WSGI the endless stream would hold a
+	worker for good, so there are no live updates: the page is not told to
+	listen (index), and 501 tells an EventSource that does not to retry."""
+	return HttpResponse('Live updates need the ASGI server (HospitalChatbot.asgi)', status=501, content_type='text/plain')
+
+
+@staff_member_required
+def export_encounters(request):
+	"""Stream encounters as CSV (default) or NDJSON. `since_id` limits the
+	export to newer encounters; the X-Export-Watermark response header is the
+	since_id to pass next time."""
+	fmt = request.GET.get('format', 'csv')
+	if fmt not in ('csv', 'ndjson'):
+		return HttpResponseBadRequest('format must be csv or ndjson')
+	try:
+		since_id = int(request.GET.get('since_id', 0))
+	except ValueError:
+		return HttpResponseBadRequest('since_id must be an integer')
+	until_id = exports.latest_encounter_id()
+	chunks = exports.iter_chunks(since_id, until_id)
+	if fmt == 'csv':
+		response = StreamingHttpResponse(exports.csv_lines(chunks), content_type='text/csv; charset=utf-8')
+	else:
+		response = StreamingHttpResponse(exports.ndjson_lines(chunks), content_type='application/x-ndjson')
+	response['Content-Disposition'] = f'attachment; filename="encounters_{since_id}_{until_id}.{fmt}"'
+	response['X-Export-Watermark'] = str(until_id)
+	return response
+
 
+@staff_member_required
+def abnormal_labs(request):
+	"""Out-of-range lab results of one day across all patients.
 
-def map_symptom_to_specialization(problem_text: str) -> str:
-	# Prefer LLM-based classification if GROQ key is configured
+	Query parameters: `date` (YYYY-MM-DD, default today), optional
+	`test_name`, and `after`, the `next_after` of the previous page.
+	"""
 	try:
-		if getattr(settings, 'GROQ_API_KEY', ''):
-			spec = llm.classify_specialization(problem_text)
-			if spec:
-				return spec
-	except Exception:
-		# fall back to rule-based mapping on any LLM error
-		pass
-
-	text = problem_text.lower()
-	if any(k in text for k in ['chest', 'heart', 'bp', 'breath']):
-		return 'Cardiology'
-	if any(k in text for k in ['bone', 'joint', 'fracture']):
-		return 'Orthopedics'
-	if any(k in text for k in ['fever', 'stomach', 'weak', 'cold', 'flu']):
-		return 'General Medicine'
-	if any(k in text for k in ['rash', 'itch', 'skin', 'allergy']):
-		return 'Dermatology'
-	if any(k in text for k in ['ear', 'nose', 'throat']):
-		return 'ENT'
-	if any(k in text for k in ['preg', 'period', 'women']):
-		return 'Gynecology'
-	if any(k in text for k in ['child', 'kid', 'children']):
-		return 'Pediatrics'
-	return 'General Medicine'
-
-
-def find_doctor_for_specialization(spec: str):
-	return Doctor.objects.filter(specialization__iexact=spec).first()
-
-
-def choose_appointment_slot(doctor):
-	# Choose same-day next hour slot between 09:00-17:00 if available, else 2 days later
-	now = timezone.localtime()
-	start_hour = max(now.hour + 1, 9)
-	if start_hour > 17:
-		candidate = (now + timedelta(days=2)).replace(hour=9, minute=0, second=0, microsecond=0)
-	else:
-		candidate = now.replace(hour=start_hour, minute=0, second=0, microsecond=0)
+		day = datetime.strptime(request.GET['date'], '%Y-%m-%d').date() if request.GET.get('date') else timezone.localdate()
+		after = int(request.GET['after']) if request.GET.get('after') else None
+	except ValueError:
+		return JsonResponse({'error': 'date must be YYYY-MM-DD and after an integer'}, status=400)
+	rows, counts, cursor = labs.abnormal_results(day, request.GET.get('test_name') or None, after)
+	return JsonResponse({'date': day.isoformat(), 'counts': counts, 'results': rows, 'next_after': cursor})
+
+
+@staff_member_required
+def high_risk(request):
+	"""Encounters with the highest early-warning scores whose latest vitals
+	were recorded in the last `hours` (default 24).
+
+	Query parameters: optional `ward` (a visit type: OPD, ER, IPD...),
+	`hours` and `limit` (default 20, at most 200).
+	"""
+	try:
+		hours = int(request.GET.get('hours') or 24)
+		limit = min(max(int(request.GET.get('limit') or 20), 1), 200)
+	except ValueError:
+		return JsonResponse({'error': 'hours and limit must be integers'}, status=400)
+	encounters = []
+	for risk in ews.highest_risk(request.GET.get('ward') or None, hours, limit):
+		enc = risk.encounter
+		encounters.append({
+			'encounter_id': enc.encounter_id,
+			'patient_id': enc.patient_id,
+			'patient_name': f'{enc.patient.first_name} {enc.patient.last_name}',
+			'doctor': f'Dr. {enc.doctor.first_name} {enc.doctor.last_name}' if enc.doctor else None,
+			'ward': risk.ward,
+			'score': risk.score,
+			'level': ews.level(risk.score, risk.red_flag),
+			'red_flag': risk.red_flag,
+			'peak_score': risk.peak_score,
+			'readings': risk.readings,
+			'recorded_at': risk.recorded_at.isoformat(),
+		})
+	return JsonResponse({'hours': hours, 'encounters': encounters})
 
-	# check conflict exact datetime; if exists, move 2 days later same time
-	conflict = Encounter.objects.filter(doctor=doctor, visit_date=candidate).exists()
-	if conflict:
-		candidate = candidate + timedelta(days=2)
-	return candidate
 
+@staff_member_required
+def dashboard_rollups(request):
+	"""Encounter and feedback counters from the daily rollups.
 
-def get_available_slots(doctor, days_ahead=7):
-	"""Get available slots for a doctor for the next few days"""
-	slots = []
-	now = timezone.localtime()
-	
-	# Generate slots for the next 7 days
-	for day_offset in range(days_ahead):
-		date = now + timedelta(days=day_offset)
-		
-		# Skip Sundays (assuming 6 = Sunday in weekday())
-		if date.weekday() == 6:
-			continue
-			
-		# Generate time slots between 9 AM and 5 PM
-		for hour in range(9, 18):
-			slot_time = date.replace(hour=hour, minute=0, second=0, microsecond=0)
-			
-			# Skip past times for today
-			if day_offset == 0 and slot_time < now:
-				continue
-				
-			# Check if slot is available
-			conflict = Encounter.objects.filter(doctor=doctor, visit_date=slot_time).exists()
-			if not conflict:
-				slots.append(slot_time)
-				
-			# Limit to reasonable number of slots
-			if len(slots) >= 10:
-				break
-		
-		if len(slots) >= 10:
-			break
-			
-	return slots
+	Query parameters: `from`/`to` (YYYY-MM-DD, default the last 30 days),
+	`group_by` (comma separated: date, doctor, specialization, visit_type),
+	and optional `specialization` and `doctor_id` filters.
+	"""
+	today = timezone.localdate()
+	try:
+		end = datetime.strptime(request.GET['to'], '%Y-%m-%d').date() if request.GET.get('to') else today
+		start = datetime.strptime(request.GET['from'], '%Y-%m-%d').date() if request.GET.get('from') else end - timedelta(days=29)
+		doctor_id = int(request.GET['doctor_id']) if request.GET.get('doctor_id') else None
+	except ValueError:
+		return JsonResponse({'error': 'from/to must be YYYY-MM-DD and doctor_id an integer'}, status=400)
+	group_by = [g.strip() for g in request.GET.get('group_by', 'date').split(',') if g.strip()]
+	unknown = set(group_by) - rollups.GROUPINGS
+	if unknown:
+		return JsonResponse({'error': f'unknown group_by: {", ".join(sorted(unknown))}'}, status=400)
+	rows = rollups.summary(start, end, group_by, request.GET.get('specialization'), doctor_id)
+	return JsonResponse({'from': start.isoformat(), 'to': end.isoformat(), 'group_by': group_by, 'rows': rows})
+
+
+def _history_entry(row):
+	return {
+		'encounter_id': row['encounter_id'],
+		'doctor_name': f"Dr. {row['doctor__first_name']} {row['doctor__last_name']}" if row['doctor__first_name'] else "Unknown",
+		'specialization': row['doctor__specialization'] or "Unknown",
+		'visit_date': row['visit_date'].isoformat(),
+		'problem': row['problem'],
+		'status': row['status']
+	}
+
+
+def _chosen_slot(doctor_id, slot_choice):
+	"""(aware datetime, None) for a free upcoming slot_choice, else (None,
+	error response). Backfill and the slot calendar assume one booking per slot."""
+	try:
+		appt_dt = datetime.fromisoformat(slot_choice)
+	except (TypeError, ValueError):
+		return None, JsonResponse({'error': 'Invalid slot choice'}, status=400)
+	if timezone.is_naive(appt_dt):
+		appt_dt = timezone.make_aware(appt_dt)
+	if appt_dt <= timezone.now():
+		return None, JsonResponse({'error': 'Slot is in the past'}, status=400)
+	if slot_taken(doctor_id, appt_dt):
+		return None, JsonResponse({'error': 'Slot already taken'}, status=409)
+	return appt_dt, None
+
+
+def _history_cursor(cursor):
+	if cursor is None:
+		return None
+	return {'visit_date': cursor[0].isoformat(), 'encounter_id': cursor[1]}
 
 
 @csrf_exempt
+@idempotency.idempotent
 def perform_action(request):
 	if request.method != 'POST':
 		return HttpResponseBadRequest('POST required')
@@ -114,6 +197,9 @@ def perform_action(request):
 
 	action = payload.get('action')
 	data = payload.get('data', {})
+	# Tag the request so middleware can report per-action numbers.
+	request.chatbot_action = action
+	request.chatbot_encounter_id = data.get('encounter_id') if isinstance(data, dict) else None
 
 	if action == 'REGISTER_PATIENT':
 		required = ['first_name', 'last_name', 'dob', 'gender', 'phone', 'blood_group']
@@ -143,52 +229,56 @@ def perform_action(request):
 		if not patient:
 			return JsonResponse({'action': 'VALIDATE_PATIENT', 'valid': False})
 		
-		# Get patient's previous encounters
-		previous_encounters = []
-		encounters = Encounter.objects.filter(patient=patient).order_by('-visit_date')
-		for enc in encounters:
-			previous_encounters.append({
-				'encounter_id': enc.encounter_id,
-				'doctor_name': f"Dr. {enc.doctor.first_name} {enc.doctor.last_name}" if enc.doctor else "Unknown",
-				'specialization': enc.doctor.specialization if enc.doctor else "Unknown",
-				'visit_date': enc.visit_date.isoformat(),
-				'problem': enc.problem,
-				'status': enc.status
-			})
+		# Get patient's previous encounters (the newest page; GET_PATIENT_HISTORY pages further)
+		encounters, cursor = archive.patient_history(patient.patient_id)
+		previous_encounters = [_history_entry(enc) for enc in encounters]
 		
 		return JsonResponse({'action': 'VALIDATE_PATIENT', 'valid': True, 'patient': {
 			'patient_id': patient.patient_id,
 			'first_name': patient.first_name,
 			'last_name': patient.last_name,
 			'phone': patient.phone,
-		}, 'previous_encounters': previous_encounters})
+		}, 'previous_encounters': previous_encounters, 'next_before': _history_cursor(cursor)})
+
+	if action == 'SEARCH_PATIENTS':
+		query = (data.get('query') or '').strip()
+		if not query:
+			return JsonResponse({'error': 'query required'}, status=400)
+		try:
+			limit = min(max(int(data.get('limit', 10)), 1), 50)
+		except (TypeError, ValueError):
+			return JsonResponse({'error': 'limit must be an integer'}, status=400)
+		matches = []
+		for p in search.search_patients(query, limit=limit):
+			matches.append({
+				'patient_id': p.patient_id,
+				'first_name': p.first_name,
+				'last_name': p.last_name,
+				'dob': p.dob.isoformat(),
+				'phone': p.phone,
+				'score': round(p.score, 4) if p.score is not None else None,
+			})
+		return JsonResponse({'action': 'SEARCH_PATIENTS', 'matches': matches})
 
 	if action == 'ASSIGN_DOCTOR':
 		problem = data.get('problem')
 		if not problem:
 			return JsonResponse({'error': 'problem required'}, status=400)
 		spec = map_symptom_to_specialization(problem)
-		doc = find_doctor_for_specialization(spec)
+		# With a patient_id, their previous doctor in the specialization is preferred
+		doc = find_doctor_for_specialization(spec, data.get('patient_id'))
 		if not doc:
 			return JsonResponse({'action': 'ASSIGN_DOCTOR', 'assigned': False, 'specialization': spec})
 		
-		# Get available slots for this doctor
+		# Get available slots for this doctor (first 5 shown)
 		slots = get_available_slots(doc)
-		slot_options = []
-		for i, slot in enumerate(slots[:5]):  # Show first 5 slots
-			slot_options.append({
-				'id': i+1,
-				'datetime': slot.isoformat(),
-				'date': slot.strftime('%Y-%m-%d'),
-				'time': slot.strftime('%H:%M')
-			})
 		
 		return JsonResponse({'action': 'ASSIGN_DOCTOR', 'assigned': True, 'doctor': {
 			'doctor_id': doc.doctor_id,
 			'first_name': doc.first_name,
 			'last_name': doc.last_name,
 			'specialization': doc.specialization,
-		}, 'available_slots': slot_options})
+		}, 'available_slots': slot_options(slots)})
 
 	if action == 'CREATE_ENCOUNTER' or action == 'BOOK_APPOINTMENT':
 		patient_id = data.get('patient_id')
@@ -204,35 +294,14 @@ def perform_action(request):
 		
 		# Use chosen slot or default slot selection
 		if slot_choice:
-			try:
-				appt_dt = datetime.fromisoformat(slot_choice)
-			except ValueError:
-				return JsonResponse({'error': 'Invalid slot choice'}, status=400)
+			appt_dt, error = _chosen_slot(doctor.pk, slot_choice)
+			if error is not None:
+				return error
 		else:
 			appt_dt = choose_appointment_slot(doctor)
 		
-		# Determine visit type based on whether it's a follow-up
-		visit_type = 'FU' if previous_encounter_id else 'OPD'
-		
-		enc = Encounter.objects.create(
-			patient=patient,
-			doctor=doctor,
-			visit_type=visit_type,
-			visit_date=appt_dt,
-			notes=problem,
-			problem=problem,
-			status='BOOKED',
-			payment_status='PENDING',
-		)
-
-		# create reminder 24 hours prior if appointment not same-day
-		remind_at = appt_dt - timedelta(hours=24)
-		Reminder.objects.create(
-			encounter=enc, 
-			remind_at=remind_at, 
-			method='CALL',
-			health_check_required=True
-		)
+		# Creates the encounter and its reminder 24 hours prior
+		enc = book(patient, doctor, problem, appt_dt, previous_encounter_id)
 
 		return JsonResponse({'action': action, 'encounter': {
 			'encounter_id': enc.encounter_id,
@@ -242,19 +311,84 @@ def perform_action(request):
 			'visit_type': enc.visit_type,
 		}})
 
+	if action == 'CANCEL_APPOINTMENT' or action == 'RESCHEDULE_APPOINTMENT':
+		encounter_id = data.get('encounter_id')
+		if not encounter_id:
+			return JsonResponse({'error': 'encounter_id required'}, status=400)
+		enc = get_object_or_404(Encounter.objects.select_related('doctor'), pk=encounter_id)
+		if enc.status != 'BOOKED' or enc.visit_date <= timezone.now():
+			return JsonResponse({'error': 'Only upcoming booked appointments can be changed'}, status=400)
+
+		# The freed slot goes to the best waitlisted patient (app1.waitlist)
+		if action == 'CANCEL_APPOINTMENT':
+			backfilled = waitlist.cancel(enc)
+		else:
+			if enc.doctor is None:
+				return JsonResponse({'error': 'The appointment has no doctor; book a new one'}, status=409)
+			slot_choice = data.get('slot_choice')
+			if slot_choice:
+				appt_dt, error = _chosen_slot(enc.doctor_id, slot_choice)
+				if error is not None:
+					return error
+			else:
+				slots = get_available_slots(enc.doctor)
+				if not slots:
+					return JsonResponse({'error': 'No free slots'}, status=409)
+				appt_dt = slots[0]
+			backfilled = waitlist.reschedule(enc, appt_dt)
+
+		return JsonResponse({'action': action, 'encounter': {
+			'encounter_id': enc.encounter_id,
+			'appointment_date': enc.visit_date.isoformat(),
+			'appointment_time': enc.visit_date.time().isoformat(),
+			'status': enc.status,
+		}, 'backfilled': [
+			{'encounter_id': entry.encounter_id, 'patient_id': entry.patient_id} for entry in backfilled
+		]})
+
+	if action == 'JOIN_WAITLIST':
+		patient_id = data.get('patient_id')
+		doctor_id = data.get('doctor_id')
+		problem = data.get('problem') or ''
+		encounter_id = data.get('encounter_id')
+		if not patient_id or not (doctor_id or problem):
+			return JsonResponse({'error': 'patient_id and doctor_id or problem required'}, status=400)
+		try:
+			priority = int(data.get('priority', 0))
+			before = data.get('before')
+			if before is not None:
+				before = datetime.fromisoformat(before)
+				if timezone.is_naive(before):
+					before = timezone.make_aware(before)
+		except (TypeError, ValueError):
+			return JsonResponse({'error': 'priority must be an integer and before an ISO datetime'}, status=400)
+		patient = get_object_or_404(Patient, pk=patient_id)
+		doctor = get_object_or_404(Doctor, pk=doctor_id) if doctor_id else None
+		# With an encounter, it is moved to the earlier slot rather than a second one booked
+		enc = None
+		if encounter_id:
+			enc = get_object_or_404(Encounter, pk=encounter_id, patient_id=patient.pk, status='BOOKED')
+		spec = doctor.specialization if doctor else map_symptom_to_specialization(problem)
+		entry = waitlist.join(
+			patient, spec, doctor=doctor, encounter=enc, problem=problem, priority=priority, wanted_before=before,
+		)
+
+		return JsonResponse({'action': 'JOIN_WAITLIST', 'entry': {
+			'entry_id': entry.entry_id,
+			'doctor_id': entry.doctor_id,
+			'specialization': entry.specialization,
+			'encounter_id': entry.encounter_id,
+			'wanted_before': entry.wanted_before.isoformat() if entry.wanted_before else None,
+			'priority': entry.priority,
+			'status': entry.status,
+		}})
+
 	if action == 'SEND_EMAIL':
 		encounter_id = data.get('encounter_id')
 		if not encounter_id:
 			return JsonResponse({'error': 'encounter_id required'}, status=400)
 		
-		encounter = get_object_or_404(Encounter, pk=encounter_id)
-		
-		# Debug: Print email settings
-		import os
-		print("EMAIL_HOST:", getattr(settings, 'EMAIL_HOST', 'Not set'))
-		print("EMAIL_HOST_USER:", getattr(settings, 'EMAIL_HOST_USER', 'Not set'))
-		print("EMAIL_HOST_PASSWORD length:", len(getattr(settings, 'EMAIL_HOST_PASSWORD', '')))
-		print("DEFAULT_FROM_EMAIL:", getattr(settings, 'DEFAULT_FROM_EMAIL', 'Not set'))
+		encounter = get_object_or_404(Encounter.objects.select_related('patient', 'doctor'), pk=encounter_id)
 		
 		# Prepare email content
 		subject = f'Hospital Appointment Confirmation - OP#{encounter.encounter_id}'
@@ -289,7 +423,7 @@ Hospital Administration
 				# Check if email settings are properly configured
 				if not getattr(settings, 'EMAIL_HOST', None) or getattr(settings, 'EMAIL_HOST') == 'localhost':
 					error_message = "Email server not properly configured. Please check EMAIL_HOST settings."
-					print(f"Email configuration error: {error_message}")
+					logger.warning('email_not_configured', extra={'action': action, 'encounter_id': encounter.encounter_id})
 					return JsonResponse({
 						'action': 'SEND_EMAIL', 
 						'sent': False, 
@@ -309,7 +443,7 @@ Hospital Administration
 			except Exception as e:
 				# Log error but don't fail the request
 				error_message = str(e)
-				print(f"Failed to send email: {e}")
+				logger.warning('email_failed', extra={'action': action, 'encounter_id': encounter.encounter_id, 'error': error_message})
 				email_sent = False
 		else:
 			email_sent = False
@@ -346,7 +480,7 @@ Hospital Administration
 		follow_up = data.get('follow_up_required', False)
 		if not encounter_id:
 			return JsonResponse({'error': 'encounter_id required'}, status=400)
-		enc = get_object_or_404(Encounter, pk=encounter_id)
+		enc = get_object_or_404(Encounter.objects.select_related('patient', 'doctor'), pk=encounter_id)
 		fb = Feedback.objects.create(encounter=enc, rating=rating, comments=comments, follow_up_required=follow_up)
 		
 		# Send feedback summary to patient
@@ -354,7 +488,7 @@ Hospital Administration
 			try:
 				subject = f'Visit Summary - Appointment #{encounter_id}'
 				message = f'''
-Dear {enc.patient.patient.first_name} {enc.patient.patient.last_name},
+Dear {enc.patient.first_name} {enc.patient.last_name},
 
 Thank you for visiting our hospital. Here's a summary of your visit:
 
@@ -381,7 +515,7 @@ Hospital Administration
 					fail_silently=False,
 				)
 			except Exception as e:
-				print(f"Failed to send feedback summary: {e}")
+				logger.warning('email_failed', extra={'action': action, 'encounter_id': enc.encounter_id, 'error': str(e)})
 		
 		return JsonResponse({'action': 'POST_VISIT_FEEDBACK', 'feedback_id': fb.feedback_id})
 	
@@ -390,7 +524,10 @@ Hospital Administration
 		if not encounter_id:
 			return JsonResponse({'error': 'encounter_id required'}, status=400)
 		
-		enc = get_object_or_404(Encounter, pk=encounter_id)
+		# Old visits may have been moved to the archive tables
+		enc = archive.get_encounter(encounter_id)
+		if enc is None:
+			raise Http404('No encounter matches the given query.')
 		
 		# Get all related information
 		medications = []
@@ -418,10 +555,11 @@ Hospital Administration
 				'blood_pressure': vital.blood_pressure,
 				'oxygen_saturation': vital.oxygen_saturation,
 				'recorded_at': vital.recorded_at.isoformat(),
+				'news_score': vital.news_score,
 			})
 		
 		lab_results = []
-		for lab in enc.lab_results.all():
+		for lab in archive.lab_results(enc):
 			lab_results.append({
 				'test_name': lab.test_name,
 				'result_value': lab.result_value,
@@ -432,8 +570,8 @@ Hospital Administration
 		
 		# Get feedback if exists
 		feedback = None
-		if hasattr(enc, 'feedbacks') and enc.feedbacks.exists():
-			fb = enc.feedbacks.first()
+		fb = enc.feedbacks.order_by('feedback_id').first()
+		if fb:
 			feedback = {
 				'rating': fb.rating,
 				'comments': fb.comments,
@@ -493,7 +631,7 @@ Hospital Administration
 		if not encounter_id:
 			return JsonResponse({'error': 'encounter_id required'}, status=400)
 		
-		enc = get_object_or_404(Encounter, pk=encounter_id)
+		enc = get_object_or_404(Encounter.objects.select_related('patient', 'doctor'), pk=encounter_id)
 		
 		# Schedule follow-up appointment
 		follow_up_date = timezone.now() + timedelta(days=follow_up_days)
@@ -527,6 +665,12 @@ Hospital Administration
 			health_check_required=True
 		)
 		
+		push.notify_patient(
+			'follow_up', enc.patient_id,
+			f"Follow-up appointment {follow_up_enc.encounter_id} scheduled for {follow_up_enc.visit_date.strftime('%Y-%m-%d %H:%M')}.",
+			encounter_id=follow_up_enc.encounter_id,
+		)
+		
 		# Send confirmation to patient
 		if enc.patient.email:
 			try:
@@ -555,7 +699,7 @@ Hospital Administration
 					fail_silently=False,
 				)
 			except Exception as e:
-				print(f"Failed to send follow-up confirmation: {e}")
+				logger.warning('email_failed', extra={'action': action, 'encounter_id': follow_up_enc.encounter_id, 'error': str(e)})
 		
 		return JsonResponse({
 			'action': 'SCHEDULE_FOLLOW_UP', 
@@ -574,7 +718,7 @@ Hospital Administration
 			visit_type='FU',
 			status='BOOKED',
 			visit_date__gte=timezone.now()
-		).order_by('visit_date')
+		).select_related('doctor').order_by('visit_date')
 		
 		follow_ups = []
 		for enc in upcoming_follow_ups:
@@ -613,22 +757,24 @@ Hospital Administration
 		if not patient_id:
 			return JsonResponse({'error': 'patient_id required'}, status=400)
 		
-		# Get patient's previous encounters
-		previous_encounters = []
-		encounters = Encounter.objects.filter(patient_id=patient_id).order_by('-visit_date')
-		for enc in encounters:
-			previous_encounters.append({
-				'encounter_id': enc.encounter_id,
-				'doctor_name': f"Dr. {enc.doctor.first_name} {enc.doctor.last_name}" if enc.doctor else "Unknown",
-				'specialization': enc.doctor.specialization if enc.doctor else "Unknown",
-				'visit_date': enc.visit_date.isoformat(),
-				'problem': enc.problem,
-				'status': enc.status
-			})
+		# Newest first, one page at a time; pass `next_before` back as `before`
+		# for older visits, which may come from the archive (app1.archive).
+		before = data.get('before')
+		try:
+			limit = min(int(data.get('page_size', archive.PAGE_SIZE)), archive.PAGE_SIZE)
+			if before is not None:
+				before = (datetime.fromisoformat(before['visit_date']), int(before['encounter_id']))
+		except (KeyError, TypeError, ValueError):
+			return JsonResponse({'error': 'before must be a next_before value and page_size an integer'}, status=400)
+		if limit < 1:
+			return JsonResponse({'error': 'page_size must be positive'}, status=400)
+		encounters, cursor = archive.patient_history(patient_id, before, limit)
+		previous_encounters = [_history_entry(enc) for enc in encounters]
 		
 		return JsonResponse({
 			'action': 'GET_PATIENT_HISTORY',
-			'history': previous_encounters
+			'history': previous_encounters,
+			'next_before': _history_cursor(cursor),
 		})
 	
 	if action == 'GET_LAB_REPORTS':
@@ -636,21 +782,64 @@ Hospital Administration
 		if not patient_id:
 			return JsonResponse({'error': 'patient_id required'}, status=400)
 		
-		# Get patient's lab results
+		# Newest first, one page at a time; pass `next_before` back as `before`
+		before = data.get('before')
+		try:
+			limit = min(int(data.get('page_size', archive.PAGE_SIZE)), archive.PAGE_SIZE)
+			if before is not None:
+				before = (date.fromisoformat(before['test_date']), int(before['lab_id']))
+		except (KeyError, TypeError, ValueError):
+			return JsonResponse({'error': 'before must be a next_before value and page_size an integer'}, status=400)
+		if limit < 1:
+			return JsonResponse({'error': 'page_size must be positive'}, status=400)
+		results, cursor = archive.patient_lab_results(patient_id, before, limit)
 		lab_results = []
-		results = LabResult.objects.filter(patient_id=patient_id).order_by('-test_date')
 		for result in results:
 			lab_results.append({
-				'test_name': result.test_name,
-				'result_value': result.result_value,
-				'result_unit': result.result_unit,
-				'reference_range': result.reference_range,
-				'test_date': result.test_date.isoformat(),
+				'lab_id': result['lab_id'],
+				'test_name': result['test_name'],
+				'result_value': result['result_value'],
+				'result_unit': result['result_unit'],
+				'reference_range': result['reference_range'],
+				'test_date': result['test_date'].isoformat(),
+				# Parsed on write (app1.labs); None when not numeric
+				'value': result['value_numeric'],
+				'range_low': result['range_low'],
+				'range_high': result['range_high'],
+				'abnormal': result['abnormal'],
 			})
 		
 		return JsonResponse({
 			'action': 'GET_LAB_REPORTS',
-			'reports': lab_results
+			'reports': lab_results,
+			'next_before': {'test_date': cursor[0].isoformat(), 'lab_id': cursor[1]} if cursor else None,
 		})
 	
+	if action == 'GET_LAB_TRENDS':
+		patient_id = data.get('patient_id')
+		if not patient_id:
+			return JsonResponse({'error': 'patient_id required'}, status=400)
+		# Every reading of each test goes into the numbers; `points` limits
+		# how many of the latest are returned per test.
+		tests = data.get('tests') or None
+		try:
+			since = date.fromisoformat(data['since']) if data.get('since') else None
+			points = int(data.get('points', 50))
+		except (TypeError, ValueError):
+			return JsonResponse({'error': 'since must be YYYY-MM-DD and points an integer'}, status=400)
+		if tests is not None and not (isinstance(tests, list) and all(isinstance(t, str) for t in tests)):
+			return JsonResponse({'error': 'tests must be a list of test names'}, status=400)
+		return JsonResponse({'action': 'GET_LAB_TRENDS', 'trends': labs.trends(patient_id, tests, since, points)})
+	
+	if action == 'CHAT_TURN':
+		# One user message in, the bot's reply out; the booking flow's state
+		# stays in the session (see app1.conversation).
+		message = (data.get('message') or '').strip()
+		if not message:
+			return JsonResponse({'error': 'message required'}, status=400)
+		reply = conversation.handle_turn(request.session, message)
+		return JsonResponse({'action': 'CHAT_TURN', **reply})
+	
+	# Keep arbitrary client input out of metric labels.
+	request.chatbot_action = 'UNKNOWN'
 	return JsonResponse({'error': 'unknown action'}, status=400)
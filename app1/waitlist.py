@@ -0,0 +1,146 @@
+"""
+Cancellations, rescheduling, and the waitlist that refills freed slots.
+
+cancel() and reschedule() free an encounter's slot, and backfill() offers it
+to the waitlist. The offer goes to entries waiting for that doctor and to
+entries waiting for anyone in the doctor's specialization, if their
+wanted_before is after the slot. The best entry has the highest priority, then
+the longest wait. Each queue is read from the top of its index, so the cost
+does not grow with the queue:
+
+* (status, doctor, -priority, created_at)
+* (status, specialization, doctor, -priority, created_at)
+
+The entry is claimed with a conditional UPDATE, because another worker may be
+backfilling it too. The booking is made in the same transaction: the entry's
+encounter is moved to the slot, or a new one is booked. The patient's push
+notification is queued for commit, so it goes out if and only if the booking
+does. Moving an encounter frees its old slot, which is then backfilled too,
+up to CHAIN_LIMIT bookings.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import booking, push, reminders
+from .models import Reminder, WaitlistEntry
+
+
+CHAIN_LIMIT = 5
+# Entries claimed by another worker while we looked
+CLAIM_ATTEMPTS = 3
+# As booking.book()
+REMINDER_LEAD = timedelta(hours=24)
+
+
+def join(patient, specialization, doctor=None, encounter=None, problem='', priority=0, wanted_before=None):
+    """Put a patient on the waitlist. With an encounter, only slots before it
+    are offered (unless wanted_before says otherwise) and it is moved rather
+    than a second one booked."""
+    if wanted_before is None and encounter is not None:
+        wanted_before = encounter.visit_date
+    return WaitlistEntry.objects.create(
+        patient=patient, doctor=doctor, specialization=specialization.lower(), encounter=encounter,
+        problem=problem or '', priority=priority, wanted_before=wanted_before,
+    )
+
+
+def cancel(encounter):
+    """Cancel a booked encounter (loaded with its doctor), drop its pending
+    reminders and waitlist entries, and backfill its slot. Returns the
+    entries booked."""
+    with transaction.atomic():
+        encounter.status = 'CANCELLED'
+        encounter.save()
+        reminders.dequeue(Reminder.objects.filter(encounter_id=encounter.pk).values('pk'))
+        WaitlistEntry.objects.filter(encounter_id=encounter.pk, status='WAITING').update(status='CANCELLED')
+        return backfill(encounter.doctor, encounter.visit_date)
+
+
+def reschedule(encounter, visit_date):
+    """Move a booked encounter (loaded with its doctor) and its reminders to
+    `visit_date`, and backfill the slot it left. Returns the entries booked."""
+    with transaction.atomic():
+        freed = encounter.visit_date
+        _move(encounter, encounter.doctor, visit_date)
+        return backfill(encounter.doctor, freed)
+
+
+def _move(encounter, doctor, visit_date):
+    encounter.doctor = doctor
+    encounter.visit_date = visit_date
+    encounter.save()
+    reminders.move(encounter.pk, visit_date - REMINDER_LEAD)
+
+
+def backfill(doctor, visit_date):
+    """Book the best waitlisted patient into the doctor's slot if it is
+    upcoming and free, and so on down the chain of slots that frees. Returns
+    the entries booked, the first one into this slot."""
+    booked = []
+    if doctor is None:
+        # The doctor was deleted: there is no slot to offer
+        return booked
+    with transaction.atomic():
+        while len(booked) < CHAIN_LIMIT and visit_date > timezone.now():
+            entry = _claim(doctor, visit_date)
+            if entry is None:
+                break
+            booked.append(entry)
+            freed = _book(entry, doctor, visit_date)
+            if freed is None:
+                break
+            doctor, visit_date = freed
+    return booked
+
+
+def _claim(doctor, visit_date):
+    # The slot was freed in this transaction, so not in the calendar yet
+    if booking.slot_taken(doctor.pk, visit_date, uncommitted=True):
+        return None
+    waiting = (
+        WaitlistEntry.objects.filter(status='WAITING')
+        .filter(Q(wanted_before__isnull=True) | Q(wanted_before__gt=visit_date))
+        .select_related('patient', 'encounter__doctor')
+        .order_by('-priority', 'created_at')
+    )
+    for _ in range(CLAIM_ATTEMPTS):
+        candidates = [
+            entry for entry in (
+                waiting.filter(doctor=doctor).first(),
+                waiting.filter(doctor__isnull=True, specialization=doctor.specialization.lower()).first(),
+            )
+            if entry is not None
+        ]
+        if not candidates:
+            return None
+        entry = min(candidates, key=lambda e: (-e.priority, e.created_at))
+        if WaitlistEntry.objects.filter(pk=entry.pk, status='WAITING').update(
+            status='BOOKED', booked_at=timezone.now(),
+        ):
+            return entry
+    return None
+
+
+def _book(entry, doctor, visit_date):
+    """Book the claimed entry into the slot. Returns the (doctor, visit_date)
+    its encounter left, or None."""
+    encounter = entry.encounter
+    freed = None
+    if encounter is not None and encounter.status == 'BOOKED':
+        if encounter.doctor is not None:
+            freed = (encounter.doctor, encounter.visit_date)
+        _move(encounter, doctor, visit_date)
+    else:
+        encounter = booking.book(entry.patient, doctor, entry.problem or 'Waitlist booking', visit_date)
+    WaitlistEntry.objects.filter(pk=entry.pk).update(encounter=encounter)
+    entry.encounter = encounter
+    push.notify_patient(
+        'waitlist', entry.patient_id,
+        f'An earlier slot opened up: appointment {encounter.encounter_id} with Dr. {doctor.first_name} '
+        f"{doctor.last_name} on {timezone.localtime(visit_date).strftime('%Y-%m-%d %H:%M')}.",
+        encounter_id=encounter.encounter_id,
+    )
+    return freed
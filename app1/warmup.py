@@ -0,0 +1,74 @@
+"""
+Start-up work for pre-forking servers (gunicorn.conf.py).
+
+With preload_app the master imports Django and the project once. warm() then
+does, before any worker forks, the work a fresh worker would otherwise pay for
+on its first requests:
+
+* import every view module, and through them the LLM client and the chat
+  flow, by resolving the URLconf; and requests and NumPy, which the LLM
+  client and the lab trends (app1.labs) only import on first use;
+* compile the chat templates into the cached template loader;
+* load the static files manifest;
+* read the doctor directory, and rebuild the shared slot calendar
+  (app1.availability) when it is enabled.
+
+Workers inherit all of it copy-on-write. gc.freeze() moves the warmed objects
+out of the collector's generations, so collections in a worker do not write to
+(and un-share) their pages.
+
+Connections are not inherited. warm() closes its database connections, and
+worker_started() builds each worker's own LLM HTTP session after fork.
+Database connections are not opened ahead: the ASGI workers run each
+request's sync code in a thread of its own, and Django's connections belong
+to the thread that opened them.
+"""
+import gc
+import time
+from contextlib import contextmanager
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+from . import availability, llm
+from .models import Doctor
+
+
+TEMPLATES = ('chat.html', 'floating_chat.html')
+
+
+@contextmanager
+def _timed(timings, step):
+    started = time.perf_counter()
+    yield
+    timings[step] = time.perf_counter() - started
+
+
+def warm():
+    """Load everything a worker would load lazily. Returns {step: seconds}."""
+    timings = {}
+    with _timed(timings, 'imports'):
+        get_resolver().url_patterns
+        # The master's session is never used: each worker builds its own
+        llm.session()
+        import numpy  # noqa: F401
+    with _timed(timings, 'templates'):
+        for name in TEMPLATES:
+            get_template(name)
+    with _timed(timings, 'static manifest'):
+        staticfiles_storage.url('chat/chat.js')
+    with _timed(timings, 'doctors'):
+        list(Doctor.objects.values_list('doctor_id', 'specialization'))
+        calendar = availability.calendar()
+        if calendar is not None:
+            calendar.rebuild()
+    connections.close_all()
+    gc.freeze()
+    return timings
+
+
+def worker_started():
+    """Build this worker's own LLM session right after fork."""
+    llm.session()
@@ -0,0 +1,47 @@
+"""
+Production entry point:
+
+    gunicorn -c gunicorn.conf.py
+
+The app is loaded and warmed once in the master (app1.warmup) and workers fork
+from it, so they start with Django, the views, templates and the doctor
+directory already in memory. Each worker builds its own LLM HTTP session
+after fork.
+
+Workers are uvicorn's ASGI workers serving HospitalChatbot.asgi: every chat
+page holds an /events stream open (app1.push), which an ASGI worker keeps as
+an idle coroutine, and a sync worker could not serve at all.
+
+Every setting can be overridden with GUNICORN_CMD_ARGS or on the command line.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'HospitalChatbot.settings')
+# Django runs each ASGI request's sync code in a thread of its own, so a kept
+# connection would not be reused by the next request
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
+wsgi_app = 'HospitalChatbot.asgi:application'
+worker_class = 'uvicorn_worker.UvicornWorker'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+timeout = 30
+# Recycle workers now and then; a fresh fork of the warmed master is cheap
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+
+def on_starting(server):
+    # Runs in the master after the preload, before the first fork
+    from app1 import warmup
+
+    timings = warmup.warm()
+    server.log.info('Warmed up: %s', ', '.join(f'{step} {seconds * 1000:.0f} ms' for step, seconds in timings.items()))
+
+
+def post_fork(server, worker):
+    from app1 import warmup
+
+    warmup.worker_started()